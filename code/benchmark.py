@@ -0,0 +1,184 @@
+import argparse, json, datetime, os, random, resource, subprocess, sys, tempfile, time
+from ldap3 import Server, Connection, MOCK_SYNC
+from connector import LDAP_Connector
+from data import LDAP_Type
+from writer import Write_Pool
+from state import Sync_State
+from plan import Change_Plan, PHASES
+from fingerprint import Fingerprint_Store
+from main import build_plan
+from logger import logging
+
+
+## Синтетический тест производительности: полный цикл миграции (построение и применение плана) между двумя
+#  серверами ldap3 MOCK_SYNC. Каталог источника генерируется в формате eDirectory: вложенные OU, пользователи,
+#  группы с неравномерным количеством членов. Выполняются два запуска: первоначальная миграция в пустой
+#  целевой каталог и повторная синхронизация после изменений источника (изменение атрибутов, перемещение, удаление).
+#  Каждый размер каталога запускается в отдельном процессе, результаты дописываются в файл в формате JSON Lines
+
+SOURCE_ROOT_DN = 'o=bench'
+DEST_ROOT_DN = 'dc=bench,dc=lab'
+SOURCE_MANAGER = ('cn=admin,o=bench', 'bench')
+DEST_MANAGER = ('cn=Administrator,cn=Users,dc=bench,dc=lab', 'bench')
+MIGRATION_OU = 'ou=Bench'
+OU_DEPTH = 4
+
+
+## Формирование конфигурации теста: фильтры и маппинг атрибутов берутся из config.json
+def bench_config(workers: int, page_size: int):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'), 'r', encoding='utf-8') as file:
+        json_config = json.load(file)
+    json_config.update({'READ_ROOT_DN': SOURCE_ROOT_DN, 'WRITE_ROOT_DN': DEST_ROOT_DN, \
+                        'MIGRATION_SEARCH_BASE': SOURCE_ROOT_DN, 'MIGRATION_LIST_OU': [MIGRATION_OU], \
+                        'WRITE_WORKERS': workers, 'LDAP_PAGE_SIZE': page_size})
+    return json_config
+
+
+## Генерация каталога источника из size объектов: 1% OU (до OU_DEPTH уровней вложенности), 2% групп, остальное -
+#  пользователи. Количество членов группы убывает по закону Ципфа: первая группа содержит 20% пользователей
+def populate_source(connection, json_config, size: int, seed: int = 1):
+    random.seed(seed)
+    guid = json_config['MappingAttr']['OU']['novellGUID']
+    user_mapping = json_config['MappingAttr']['User']
+    group_mapping = json_config['MappingAttr']['Group']
+    strategy = connection.strategy
+    strategy.add_entry(SOURCE_MANAGER[0], {'objectClass': 'Person', 'userPassword': SOURCE_MANAGER[1]})
+    strategy.add_entry(SOURCE_ROOT_DN, {'objectClass': 'organization', guid: 'bench-root'})
+    ou_count, group_count = max(1, size // 100), max(1, size // 50)
+    user_count = max(1, size - ou_count - group_count)
+    ous = [(MIGRATION_OU + ',' + SOURCE_ROOT_DN, 1)]
+    strategy.add_entry(ous[0][0], {'objectClass': 'organizationalUnit', 'ou': 'Bench', guid: 'ou-0'})
+    for index in range(1, ou_count):
+        parent, depth = random.choice([ou for ou in ous[-50:] if ou[1] < OU_DEPTH] or ous[:1])
+        dn = f'ou=Unit{index},{parent}'
+        strategy.add_entry(dn, {'objectClass': 'organizationalUnit', 'ou': f'Unit{index}', guid: f'ou-{index}'})
+        ous.append((dn, depth + 1))
+    users = []
+    for index in range(user_count):
+        dn = f'cn=user{index},{random.choice(ous)[0]}'
+        attributes = {source: f'{source}-{index}' for source in user_mapping.values()}
+        attributes.update({'objectClass': 'Person', 'cn': f'user{index}', user_mapping['novellGUID']: f'u-{index}'})
+        strategy.add_entry(dn, attributes)
+        users.append(dn)
+    members = 0
+    for index in range(group_count):
+        member_count = max(1, int(user_count * 0.2 / (index + 1)))
+        group_members = random.sample(users, min(member_count, user_count))
+        members += len(group_members)
+        strategy.add_entry(f'cn=group{index},{random.choice(ous)[0]}', \
+                           {'objectClass': 'Group', 'cn': f'group{index}', \
+                            group_mapping['sAMAccountName']: f'group{index}', \
+                            group_mapping['member']: group_members, group_mapping['novellGUID']: f'g-{index}'})
+    return {'OU': ou_count, 'User': user_count, 'Group': group_count, 'member': members}, users, [ou[0] for ou in ous]
+
+
+## Изменение каталога источника между запусками: 5% пользователей - изменение атрибута, 1% - перемещение в другую OU,
+#  1% - удаление
+def mutate_source(connection, json_config, users: list, ous: list, seed: int = 2):
+    random.seed(seed)
+    attribute = json_config['MappingAttr']['User']['sn']
+    sample = random.sample(users, len(users) * 7 // 100)
+    changed, moved, deleted = sample[:len(users) * 5 // 100], sample[len(users) * 5 // 100:len(users) * 6 // 100], \
+        sample[len(users) * 6 // 100:]
+    for dn in changed:
+        connection.modify(dn, {attribute: [('MODIFY_REPLACE', ['changed'])]})
+    for dn in moved:
+        rdn, parent = dn.split(',', 1)
+        connection.modify_dn(dn, rdn, new_superior=random.choice([ou for ou in ous if ou != parent]))
+    for dn in deleted:
+        connection.delete(dn)
+    return {'modify': len(changed), 'move': len(moved), 'delete': len(deleted)}
+
+
+## Запуск цикла миграции: построение плана и применение его по фазам с замером времени каждой фазы
+def run_migration(json_config, edir_connector, samba_connector, workdir: str):
+    started = time.perf_counter()
+    sync_state = Sync_State(os.path.join(workdir, 'sync_state.json'))
+    fingerprints = Fingerprint_Store(os.path.join(workdir, 'fingerprints.json'))
+    plan = build_plan(json_config, edir_connector, samba_connector, sync_state, fingerprints, False)
+    phases = {'plan': {'seconds': round(time.perf_counter() - started, 3), 'operations': plan.counts()}}
+    write_pool = Write_Pool(samba_connector, workers=json_config['WRITE_WORKERS'])
+    for phase in PHASES:
+        phase_plan = Change_Plan([step for step in plan.steps if step['phase'] == phase])
+        operations = sum(len(step['operations']) for step in phase_plan.steps)
+        phase_started = time.perf_counter()
+        phase_plan.apply(write_pool, json_config['DEFAULT_USER_MIGRATION_PASSWORD'], fingerprints)
+        seconds = time.perf_counter() - phase_started
+        phases[phase] = {'operations': operations, 'seconds': round(seconds, 3), \
+                         'ops_per_sec': round(operations / seconds, 1) if seconds > 0 else None}
+    write_pool.close()
+    sync_state.save()
+    fingerprints.save()
+    return {'wall_time': round(time.perf_counter() - started, 3), 'phases': phases}
+
+
+## Тест для одного размера каталога (выполняется в отдельном процессе, чтобы пиковое потребление памяти
+#  относилось только к этому размеру)
+def bench_size(size: int, workers: int, page_size: int):
+    json_config = bench_config(workers, page_size)
+    source_server, dest_server = Server('edir-bench'), Server('samba-bench')
+    source = Connection(source_server, client_strategy=MOCK_SYNC)
+    started = time.perf_counter()
+    objects, users, ous = populate_source(source, json_config, size)
+    dest = Connection(dest_server, client_strategy=MOCK_SYNC)
+    dest.strategy.add_entry(DEST_MANAGER[0], {'objectClass': 'user', 'userPassword': DEST_MANAGER[1]})
+    dest.strategy.add_entry(DEST_ROOT_DN, {'objectClass': 'domain'})
+    populate_time = round(time.perf_counter() - started, 3)
+    edir_connector = LDAP_Connector(fqdn='edir-bench', ldap_type=LDAP_Type.Edirectory, \
+                                    ldap_manager=SOURCE_MANAGER[0], ldap_password=SOURCE_MANAGER[1], \
+                                        source_root_dn=SOURCE_ROOT_DN, dest_root_dn=DEST_ROOT_DN, \
+                                            server_data=source_server, client_strategy=MOCK_SYNC)
+    samba_connector = LDAP_Connector(fqdn='samba-bench', ldap_type=LDAP_Type.SambaDC, \
+                                     ldap_manager=DEST_MANAGER[0], ldap_password=DEST_MANAGER[1], \
+                                         source_root_dn=SOURCE_ROOT_DN, dest_root_dn=DEST_ROOT_DN, \
+                                             member_chunk_size=json_config.get('MEMBER_CHUNK_SIZE', 1000), \
+                                                server_data=dest_server, client_strategy=MOCK_SYNC)
+    source.bind()
+    with tempfile.TemporaryDirectory() as workdir:
+        initial = run_migration(json_config, edir_connector, samba_connector, workdir)
+        changes = mutate_source(source, json_config, users, ous)
+        sync = run_migration(json_config, edir_connector, samba_connector, workdir)
+    return {'size': size, 'objects': objects, 'workers': workers, 'page_size': page_size, \
+            'populate_time': populate_time, 'changes': changes, 'runs': {'initial': initial, 'sync': sync}, \
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+## Идентификатор версии кода для сравнения результатов между запусками
+def code_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, \
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def __main__():
+    parser = argparse.ArgumentParser(description='Синтетический тест производительности миграции на серверах ldap3 MOCK_SYNC')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000], \
+                        help='размеры каталога источника (количество объектов), например 10000 100000 1000000')
+    parser.add_argument('--workers', type=int, default=1, help='количество параллельных соединений для записи')
+    parser.add_argument('--page-size', type=int, default=1000, help='размер страницы постраничного поиска')
+    parser.add_argument('--output', default='benchmark.jsonl', help='файл результатов (JSON Lines, дописывается)')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    # Журнал отдельных операций не выводится, чтобы не искажать время выполнения
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.single:
+        print(json.dumps(bench_size(args.single, args.workers, args.page_size)))
+        return
+
+    revision = code_revision()
+    for size in args.sizes:
+        logging.warning(f'Тест производительности: {size} объектов')
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), '--single', str(size), \
+                                  '--workers', str(args.workers), '--page-size', str(args.page_size)], \
+                                 capture_output=True, text=True, check=True)
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        result.update({'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'revision': revision})
+        with open(args.output, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(result) + '\n')
+        logging.warning(f'Результат для {size} объектов: {json.dumps(result["runs"])}')
+
+if __name__ == '__main__':
+    __main__()
@@ -1,10 +1,13 @@
-from ldap3 import Connection
-from ldap3.core.exceptions import LDAPException, LDAPBindError, LDAPInvalidDnError
-from data import Server_Data, LDAP_Type
-from ldap3.extend.microsoft.addMembersToGroups import ad_add_members_to_groups
-from ldap3.extend.microsoft.removeMembersFromGroups import ad_remove_members_from_groups
-import re
-from logger import logging
+from ldap3 import Connection, BASE, SUBTREE, SYNC, RESTARTABLE
+from ldap3.protocol.formatters.formatters import format_time
+from ldap3.core.exceptions import LDAPException, LDAPBindError, LDAPInvalidDnError, LDAPOperationResult
+from data import Server_Data, Server_Pool_Data, LDAP_Type
+from dn import parse_dn, format_dn, normalize_dn, translate_dn
+from record import Record, normalize_attribute
+from metrics import metrics
+from logger import logging, log_operation
+import datetime
+import time
 
 
 ## Класс словаря, который является регистронезависимым - ключи в нем обрабатываются без учета регистра.
@@ -15,6 +18,33 @@ class CaseInsensitiveDict(dict):
     def __getitem__(self, key):
         return super(CaseInsensitiveDict, self).__getitem__(key.lower())
 
+    def __contains__(self, key):
+        return super(CaseInsensitiveDict, self).__contains__(key.lower())
+
+    def get(self, key, default=None):
+        return super(CaseInsensitiveDict, self).get(key.lower(), default)
+
+
+## Классы объектов и наименования записей в журнале для типов объектов (OU, User, Group)
+OBJECT_CLASSES = {'OU': ['organizationalUnit'], \
+                  'User': ['top', 'person', 'organizationalPerson', 'user'], \
+                  'Group': ['top', 'group']}
+RECORD_NAMES = {'OU': 'OU DN: ', 'User': 'Пользователь DN: ', 'Group': 'Группа DN: '}
+# Результаты запроса add, при которых сервер не принимает пароль и параметры учетной записи в запросе создания пользователя
+ACCOUNT_ADD_REJECTED = ('unwillingToPerform', 'constraintViolation', 'invalidAttributeSyntax', 'undefinedAttributeType', \
+                        'objectClassViolation', 'insufficientAccessRights')
+# Элемент управления удалением поддерева (LDAP_SERVER_TREE_DELETE_OID)
+TREE_DELETE_CONTROL = '1.2.840.113556.1.4.805'
+RECORD_ADD_MESSAGES = {'OU': ('добавлен', 'создан'), 'User': ('добавлен', 'создан'), 'Group': ('добавлена', 'создана')}
+
+
+## Функция возвращающая атрибуты учетной записи пользователя: пароль (unicodePwd - пароль в кавычках в кодировке UTF-16LE),
+#  состояние учетной записи (userAccountControl 514 - отключена, 512 - активна) и флаг смены пароля при первом входе
+def account_attributes(default_password: str, disable_user: str):
+    return {'unicodePwd': ('"' + default_password + '"').encode('utf-16-le'), \
+            'userAccountControl': 514 if disable_user.lower() == 'true' else 512, \
+            'pwdLastSet': 0}
+
 
 ## Основной класс
 class LDAP_Connector (Connection):
@@ -23,14 +53,25 @@ class LDAP_Connector (Connection):
 
     Attributes
     ----------
-    fqdn : str
-        Fully Qualified Domain Name of the ldap server
+    fqdn : str or list
+        Fully Qualified Domain Name of the ldap server or names of the servers of the pool
     ldap_type : LDAP_Type
         LDAP type of the server
     ldap_manager: str
         Account for LDAP connection, REDOS\Administrator, Administrator@redos.croc
     ldap_password: str
         Account password
+    member_chunk_size: int
+        Maximum number of member values sent in one modify request
+    server_data: Server or ServerPool
+        Server object or pool of servers, shared by the clones of the connection
+    client_strategy: str
+        ldap3 client strategy (SYNC, RESTARTABLE - reopen and rebind the connection after a failure,
+        MOCK_SYNC for benchmarks)
+    restart_tries: int
+        Number of attempts to reopen the connection (RESTARTABLE strategy)
+    restart_sleep: float
+        Pause between the attempts to reopen the connection, in seconds
 
     Methods
     -------
@@ -38,21 +79,46 @@ class LDAP_Connector (Connection):
         Return server FQDN into, example dc01.croc.demo -> "DC=croc, DC=demo"
     """
 
+    # Метки метрик (фаза, тип объектов) и GUID объекта выполняемого шага плана, см. apply_operations
+    metrics_labels = None
+    step_guid = None
+    # Создание пользователя одним запросом add вместе с паролем и параметрами учетной записи (см. __apply_add)
+    single_request_add = True
+    # Элементы управления, поддерживаемые сервером (supportedControl корневой записи DSE), см. supports_control
+    supported_controls = None
+    # Адаптивное управление записью (throttle.Write_Throttle), задается пулом записи (см. writer.Write_Pool)
+    write_throttle = None
+    # Продолжение применения плана после сбоя (--resume): изменения, выполненные прерванным запуском, не считаются ошибкой
+    # (записи и члены групп уже добавлены или удалены, запись уже перемещена или переименована)
+    resume = False
+
     def __init__(self, fqdn: str, ldap_type: LDAP_Type, ldap_manager: str, ldap_password: str, \
-                 source_root_dn: str, dest_root_dn: str):
+                 source_root_dn: str, dest_root_dn: str, member_chunk_size: int = 1000, \
+                 server_data=None, client_strategy: str = SYNC, restart_tries: int = 10, restart_sleep: float = 5):
         """
         Init attributes for creating Server Object
 
         Parameters
         ----------
-            fqdn : str
-                Fully Qualified Domain Name of the ldap server
+            fqdn : str or list
+                Fully Qualified Domain Name of the ldap server or names of the servers of the pool
             ldap_type : LDAP_Type
                 LDAP type of the server
             ldap_manager: str
                 LDAP Administrator account
             ldap_password: str
                 Account password
+            member_chunk_size: int
+                Maximum number of member values sent in one modify request
+            server_data: Server or ServerPool, optional
+                Server object or pool of servers to connect to (default is Server_Data for fqdn and ldap_type,
+                Server_Pool_Data if fqdn is a list)
+            client_strategy: str, optional
+                ldap3 client strategy (default is SYNC)
+            restart_tries: int, optional
+                Number of attempts to reopen the connection with RESTARTABLE strategy (default is 10)
+            restart_sleep: float, optional
+                Pause between the attempts to reopen the connection, in seconds (default is 5)
         
         Returns
         -------
@@ -61,19 +127,108 @@ class LDAP_Connector (Connection):
 
         self.__ldap_manager = ldap_manager
         self.__ldap_password = ldap_password
-        self.server_data = Server_Data(fqdn, ldap_type)
+        self.fqdn = fqdn
+        self.ldap_type = ldap_type
+        if server_data is None:
+            server_data = Server_Data(fqdn, ldap_type) if isinstance(fqdn, str) else Server_Pool_Data(fqdn, ldap_type)
+        self.server_data = server_data
+        self.client_strategy = client_strategy
+        self.restart_tries = restart_tries
+        self.restart_sleep = restart_sleep
         self.source_root_dn = source_root_dn
         self.dest_root_dn = dest_root_dn
+        # Индекс записей целевого сервера: {тип объекта: {novellGUID: [Record]}}
+        self.dest_index = {}
+        self.member_chunk_size = member_chunk_size
 
         try:
-            super().__init__(server=self.server_data, user=self.__ldap_manager, password=self.__ldap_password)
-            super().bind()
+            # Диапазоны значений атрибута member (member;range=) читаются явно в get_group_members
+            super().__init__(server=self.server_data, user=self.__ldap_manager, password=self.__ldap_password, \
+                             auto_range=False, client_strategy=client_strategy)
+            # При обрыве соединения оно открывается заново (на следующем доступном сервере пула) и выполняется повторная
+            # аутентификация, затем операция повторяется
+            if client_strategy == RESTARTABLE:
+                self.strategy.restartable_tries = restart_tries
+                self.strategy.restartable_sleep_time = restart_sleep
+            self.bind()
+            if isinstance(self.server_data, Server_Pool_Data):
+                logging.info(f'Подключение к серверу {self.server.host} из пула {self.server_data.fqdns}')
             pass
         except LDAPBindError as error:
             logging.critical(error)
 
+## Метод создающий новое подключение с теми же параметрами. Индекс целевого сервера у копии общий с исходным подключением
+    def clone(self):
+        connector = LDAP_Connector(fqdn=self.fqdn, ldap_type=self.ldap_type, \
+                                   ldap_manager=self.__ldap_manager, ldap_password=self.__ldap_password, \
+                                       source_root_dn=self.source_root_dn, dest_root_dn=self.dest_root_dn, \
+                                           member_chunk_size=self.member_chunk_size, \
+                                               server_data=self.server_data, client_strategy=self.client_strategy, \
+                                                   restart_tries=self.restart_tries, restart_sleep=self.restart_sleep)
+        connector.dest_index = self.dest_index
+        connector.single_request_add = self.single_request_add
+        connector.write_throttle = self.write_throttle
+        connector.resume = self.resume
+        return connector
+
+## Метод выполняющий операцию ldap3 с записью времени выполнения и результата в метрики (см. metrics.py).
+#  Метки фазы и типа объектов берутся из выполняемого шага плана (metrics_labels) или из текущей фазы запуска
+    def __measured(self, operation: str, method, *args, **kwargs):
+        phase, object_type = self.metrics_labels or metrics.current_labels()
+        started = time.perf_counter()
+        try:
+            response = method(*args, **kwargs)
+        except LDAPException as error:
+            seconds = time.perf_counter() - started
+            metrics.observe(operation, phase, object_type, seconds, type(error).__name__)
+            log_operation(operation, self.__operation_dn(operation, args, kwargs), type(error).__name__, seconds, \
+                          self.step_guid, phase, object_type)
+            raise
+        seconds = time.perf_counter() - started
+        result = self.result.get('description', 'unknown') if isinstance(self.result, dict) else 'unknown'
+        metrics.observe(operation, phase, object_type, seconds, result)
+        log_operation(operation, self.__operation_dn(operation, args, kwargs), result, seconds, self.step_guid, phase, object_type)
+        return response
+
+## Метод выполняющий операцию записи ldap3 (см. __measured). Если задано адаптивное управление записью (write_throttle),
+#  операция ожидает свободного места в пределах ограничения для текущего сервера и повторяется, если сервер перегружен
+    def __written(self, operation: str, method, *args, **kwargs):
+        if self.write_throttle is None:
+            return self.__measured(operation, method, *args, **kwargs)
+        return self.write_throttle.run(self.server.host if self.server else str(self.fqdn), \
+                                       lambda: self.__measured(operation, method, *args, **kwargs), \
+                                           lambda: self.result.get('description') if isinstance(self.result, dict) else None)
+
+## Метод возвращающий DN записи, к которой относится операция LDAP (для bind и extended - None)
+    @staticmethod
+    def __operation_dn(operation: str, args: tuple, kwargs: dict):
+        if operation in ('bind', 'extended'):
+            return None
+        return args[0] if args else kwargs.get('dn', kwargs.get('search_base'))
+
+    def bind(self, *args, **kwargs):
+        return self.__measured('bind', super().bind, *args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self.__measured('search', super().search, *args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        return self.__written('add', super().add, *args, **kwargs)
+
+    def modify(self, *args, **kwargs):
+        return self.__written('modify', super().modify, *args, **kwargs)
+
+    def modify_dn(self, *args, **kwargs):
+        return self.__written('modify_dn', super().modify_dn, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self.__written('delete', super().delete, *args, **kwargs)
+
+    def extended(self, *args, **kwargs):
+        return self.__written('extended', super().extended, *args, **kwargs)
+
 ## Метод для сравнения атрибутов. Принимает два словаря, source_attr_dict и dest_attr_dict,
-# и сравнивает их значения. Возвращает новый словарь result_dictionary, содержащий ключи, которые были изменены, 
+# и сравнивает их нормализованные значения (см. normalize_attribute). Возвращает новый словарь result_dictionary, содержащий ключи, которые были изменены, 
 # а также соответствующие изменения.
     @staticmethod
     def __get_changed_attr(source_attr_dict: dict, dest_attr_dict: dict):
@@ -87,225 +242,472 @@ class LDAP_Connector (Connection):
                     result_dictionary[key] = ['MODIFY_REPLACE', list('')]
         return result_dictionary
     
-## Метод для преобразования регистра. Применяется для стандартизации регистра в строках DN
+## Метод для разделения DN на RDN записи и DN контейнера. Типы атрибутов приводятся к нижнему регистру
     @staticmethod
-    def __lower_case_cn_ou_dc(input_string: str):
-        input_string = input_string.replace('CN=', 'cn=')
-        input_string = input_string.replace('OU=', 'ou=')
-        input_string = input_string.replace('DC=', 'dc=')
-        return input_string
-
-## Метод выполняющий поиск записей на основе аттрибута novellGUID. По умолчанию возвращает аттрибут distinguishedName
-    def __is_record_exist(self, search_filer: str, attr=['distinguishedName']):
-        search = '(novellGUID={})'.format(search_filer)
-        records = self.search_records(filter=search, search_base=self.dest_root_dn, attribute_list=attr)
+    def __split_rdn_container(dn: str):
+        rdns = parse_dn(dn)
+        return format_dn(rdns[:1]), format_dn(rdns[1:])
+
+## Метод возвращающий DN записи целевого сервера с заданным novellGUID из индекса или None,
+#  если записи нет или записей с таким novellGUID несколько
+    def indexed_dn(self, object_type: str, guid: str):
+        dest_records = self.__is_record_exist(object_type, guid)
+        return dest_records[0].dn if len(dest_records) == 1 else None
+
+## Метод возвращающий записи целевого сервера с заданным novellGUID из индекса (см. build_dest_index)
+    def __is_record_exist(self, object_type: str, guid: str):
+        return self.dest_index.get(object_type, {}).get(guid, [])
+
+## Метод возвращающий параметры поиска записей целевого сервера для индекса (аргументы iter_records без page_size)
+    def dest_index_query(self, filter: str, attribute_list):
+        attribute_list = set(attribute_list)
+        attribute_list.add('novellGUID')
+        return {'filter': '(&{}(novellGUID=*))'.format(filter), 'search_base': self.dest_root_dn, \
+                'attribute_list': list(attribute_list)}
+
+## Метод для построения индекса записей целевого сервера по атрибуту novellGUID.
+#  Для каждого типа объектов выполняется один постраничный поиск от dest_root_dn вместо отдельного поиска на каждый объект.
+#  Каждая прочитанная запись сразу преобразуется в компактную запись Record (GUID, DN и нормализованные значения атрибутов).
+#  Методы добавления, сравнения и удаления записей используют индекс и поддерживают его в актуальном состоянии.
+#  entries - результаты того же поиска, запущенного заранее (см. dest_index_query и extract.Extract_Scheduler).
+#  dn_attributes - атрибуты с DN, значения которых нормализуются как DN (см. Mapping_Plan.dn_attributes)
+    def build_dest_index(self, object_type: str, filter: str, attribute_list, page_size: int = 1000, entries=None, \
+                         dn_attributes=frozenset()):
+        index = self.dest_index.setdefault(object_type, {})
+        index.clear()
+        if entries is None:
+            entries = self.iter_records(page_size=page_size, **self.dest_index_query(filter, attribute_list))
+        for dn, attributes in entries:
+            guid = normalize_attribute(attributes['novellGUID'])
+            index.setdefault(guid, []).append(Record(guid, dn, attributes, dn_attributes))
+        logging.info(f'Индекс {object_type} целевого сервера построен, записей: {len(index)}')
+        return index
+
+## Метод возвращающий словарь {novellGUID: DN} записей индекса, расположенных в заданном контейнере (включая сам контейнер).
+#  Контейнер нормализуется так же, как DN записей индекса (см. dn.normalize_dn), и сравнивается без учета регистра
+    def indexed_records(self, object_type: str, search_base: str):
+        search_base = normalize_dn(search_base).lower()
+        records = {}
+        for guid, dest_records in self.dest_index.get(object_type, {}).items():
+            for record in dest_records:
+                dn = record.dn.lower()
+                if dn == search_base or dn.endswith(',' + search_base):
+                    records[guid] = record.dn
         return records
 
-## Метод выполняющий поиск записей на основе заданного фильтра. По умолчанию возвращает аттрибут distinguishedName
-    def search_records(self, filter: str, search_base: str, attribute_list=['distinguishedName']):
-        self.search(search_base=search_base, search_filter=filter, attributes=attribute_list)
-        return self.entries
+## Метод возвращающий атрибуты записи с заданным DN (поиск BASE) или None, если записи нет
+    def read_record(self, dn: str, attribute_list=['distinguishedName']):
+        self.search(search_base=dn, search_filter='(objectClass=*)', search_scope=BASE, attributes=list(attribute_list))
+        for entry in self.response or []:
+            if entry['type'] == 'searchResEntry':
+                attributes = CaseInsensitiveDict()
+                for key, value in entry['attributes'].items():
+                    attributes[key] = value
+                return attributes
+        return None
+
+## Генератор, выполняющий постраничный поиск записей (Simple Paged Results) на основе заданного фильтра.
+#  Возвращает кортежи (DN, словарь атрибутов) по одной записи, в памяти одновременно находится не больше одной страницы результатов.
+#  Если страница вернулась с ошибкой (busy, timeLimitExceeded, недействительный cookie после переключения на другой сервер пула),
+#  ldap3 завершает поиск без исключения: результат последней страницы проверяется, и неполный поиск завершается исключением
+#  LDAPOperationResult, чтобы по неполным результатам не планировались удаления
+    def iter_records(self, filter: str, search_base: str, attribute_list=['distinguishedName'], page_size: int = 1000):
+        entries = self.extend.standard.paged_search(search_base=search_base, \
+                                                    search_filter=filter, \
+                                                        attributes=attribute_list, \
+                                                            paged_size=page_size, \
+                                                                generator=True)
+        for entry in entries:
+            if entry['type'] != 'searchResEntry':
+                continue
+            attributes = CaseInsensitiveDict()
+            for key, value in entry['attributes'].items():
+                attributes[key] = value
+            yield entry['dn'], attributes
+        result = self.result if isinstance(self.result, dict) else {}
+        if result.get('result') != 0:
+            logging.error(f'Поиск {filter} в {search_base} прерван: {result.get("description")} {result.get("message", "")}')
+            raise LDAPOperationResult(result=result.get('result'), description=result.get('description'), \
+                                      dn=result.get('dn'), message=result.get('message'), response_type=result.get('type'))
 
 ## Метод для конвертации DN в формат целевого сервера (замена rootDN)
     def convert_dn(self, dn: str):
-        # Регистронезависимая замена
-        compiled = re.compile(re.escape(self.source_root_dn), re.IGNORECASE)
-        dn_new = compiled.sub(self.dest_root_dn, dn)
-        # dn = dn.replace(self.source_root_dn.lower(), self.dest_root_dn)
-        return dn_new
-
-## Метод предназначен для сравнения и обновления записей в LDAP
-    def compare_records(self, source_dn: str, source_attr: dict, dest_object):
+        # Регистронезависимая замена, результат кэшируется (см. dn.translate_dn)
+        return translate_dn(dn, self.source_root_dn, self.dest_root_dn)
+
+## Метод предназначен для сравнения записей в LDAP. Возвращает список операций (перемещение, переименование,
+#  обновление атрибутов), которые приводят запись целевого сервера в соответствие с сервером источником
+    def compare_records(self, source_dn: str, source_attr: dict, dest_record: Record):
     # Подготовка данных для сравнения: DN и атрибуты: Извлекаются и подготавливаются данные для сравнения, 
     # включая разделение DN на составляющие, приведение к нижнему регистру и формирование словаря атрибутов для целевого объекта.
         #   Данные с сервера истончника
-        source_dn_list = source_dn.split(',')
-        source_cn = self.__lower_case_cn_ou_dc(source_dn_list[0])
-        source_container = self.__lower_case_cn_ou_dc(','.join(source_dn_list[1:]))
-        #   Данные на целевом сервере
-        dest_attr_dict = CaseInsensitiveDict()
-        for entry in dest_object.entry_attributes:
-            dest_attr_dict[entry] = str(dest_object[entry])
-        dest_dn_list = dest_object.entry_dn.split(',')
-        dest_cn = self.__lower_case_cn_ou_dc(dest_dn_list[0])
-        dest_container = self.__lower_case_cn_ou_dc(','.join(dest_dn_list[1:]))
-    ## Сверка и обновление DN
+        source_cn, source_container = self.__split_rdn_container(source_dn)
+        #   Данные на целевом сервере (из индекса)
+        dest_entry_dn = dest_record.dn
+        dest_attr_dict = dest_record
+        dest_cn, dest_container = self.__split_rdn_container(dest_entry_dn)
+        operations = []
+    ## Сверка DN
         # Если Organizational Units (OU) записи не совпадают, производится перемещение записи в другой контейнер.
         if dest_cn == source_cn and source_container != dest_container:
-            self.modify_dn(dest_object.entry_dn, dest_cn, new_superior=source_container)
-            if self.result['description'] == 'success':
-                logging.info('DN: ' + dest_object.entry_dn + ' перемещен в контейнер ' + source_container)
-            else:
-                logging.error('DN: ' + dest_object.entry_dn + '. Ошибка перемещения: ' + self.result['message'] )
+            operations.append({'op': 'move', 'dn': dest_entry_dn, 'rdn': dest_cn, 'new_superior': source_container})
         # Если Common Name (CN) записи на целевом сервере не совпадает с источником, производится переименование записи.
         elif dest_cn != source_cn and source_container == dest_container:
-            self.modify_dn(','.join([dest_cn, dest_container]), source_cn)
-            if self.result['description'] == 'success':
-                logging.info('DN: ' + dest_object.entry_dn + ' переименован в ' + source_cn)
-            else:
-                logging.error('DN: ' + dest_object.entry_dn + ' при переименовании произошла ошибка: ' + self.result['message'] )
+            operations.append({'op': 'rename', 'dn': ','.join([dest_cn, dest_container]), 'rdn': source_cn})
         # Если и CN, и OU не совпадают, выполняются и переименование, и перемещение.
         elif dest_cn != source_cn and source_container != dest_container:
-            self.modify_dn(dest_object.entry_dn, dest_cn, new_superior=source_container)
-            if self.result['description'] == 'success':
-                logging.info('DN: ' + dest_object.entry_dn + ' перемещен в контейнер ' + source_container)
-            else:
-                logging.error('DN: ' + dest_object.entry_dn + '. Ошибка перемещения: ' + self.result['message'] )
-            self.modify_dn(','.join([dest_cn, source_container]), source_cn)
-            if self.result['description'] == 'success':
-                logging.info('DN: ' + dest_object.entry_dn + ' переименован в ' + source_cn)
-            else:
-                logging.error('DN: ' + dest_object.entry_dn + ' при переименовании произошла ошибка: ' + self.result['message'] )
-    ## Сверка и обновление атрибутов
+            operations.append({'op': 'move', 'dn': dest_entry_dn, 'rdn': dest_cn, 'new_superior': source_container})
+            operations.append({'op': 'rename', 'dn': ','.join([dest_cn, source_container]), 'rdn': source_cn})
+    ## Сверка атрибутов
         # Вызывается функция __get_changed_attr, чтобы определить измененные атрибуты между источником и целевым объектом.
         compare_attributes = self.__get_changed_attr(source_attr, dest_attr_dict)
-        # Если есть изменения, вызывается функция modify для обновления атрибутов на целевом сервере.
+        # Если есть изменения, планируется операция modify для обновления атрибутов на целевом сервере.
         if compare_attributes:
-            self.modify(source_dn, compare_attributes)
-            if self.result['description'] == 'success':
-                logging.info('DN: ' + dest_object.entry_dn + ' обновлены атрибуты: ' + ' ,'.join(list(compare_attributes.keys())))
-            else:
-                logging.error('DN: ' + dest_object.entry_dn + ' ошибка при обновлении атрибутов ' + ' ,'.join(list(compare_attributes.keys())) + ': ' + self.result['message'] )
-
-## Метод для добавления записи (organizationalUnit) в LDAP-каталог. 
-    def add_ou_record(self, source_new_dn: str, \
-                      source_attributes: dict, \
-                        dest_attributes: list, \
-                            object_class = ['organizationalUnit']):
-        # Проверка существования записи
-        # Вызывается метод __is_record_exist для проверки существования записи с указанным novellGUID и другими атрибутами.
-        dest_dn = self.__is_record_exist(source_attributes['novellGUID'],attr=list(dest_attributes))
-        # Если запись не существует, она добавляется. 
-        if not dest_dn:
-            self.add(dn=source_new_dn, object_class = object_class, attributes=source_attributes)
-            if self.result['description'] == 'success' and self.result['type'] == 'addResponse':
-                logging.info('OU DN: ' + source_new_dn + ' добавлен')
-            else:
-                logging.error('OU DN: ' + source_new_dn + ' не создан. Ошибка: ' + self.result['message'] )
-        # В противном случае производится логирование и вызывается метод compare_records (сравнение)
-        else:
-            logging.info('OU DN: ' + source_new_dn + ' уже существует')
-            if len(dest_dn) == 1:
-                self.compare_records(source_dn = source_new_dn, source_attr = source_attributes, dest_object = dest_dn[0])
-            else:
-                logging.error('OU DN: ' + source_new_dn + ' Существует больше одного объекта с novellGUID: ' + source_attributes['novellGUID'])
-
-
-## Метод для добавления учетной записи в LDAP-каталог. 
-    def add_user_record(self, source_new_dn: str, \
-                        default_password: str, \
-                            source_attributes: dict, \
-                                dest_attributes: list, \
-                                    set_default_password=True, \
-                                        disable_user=True, \
-                                            object_class=['top', 'person', 'organizationalPerson', 'user']):
-        # Предварительная проверка, существует ли пользователь на целевом сервре
-        dest_dn = self.__is_record_exist(source_attributes['novellGUID'],attr=list(dest_attributes))
-        # Если не существует, то пользователь создается
+            operations.append({'op': 'modify', 'dn': source_dn, 'changes': compare_attributes})
+        return operations
+
+## Метод для планирования изменений записи (organizationalUnit, учетной записи, группы) на целевом сервере.
+#  Если записи с novellGUID нет в индексе целевого сервера, планируется ее добавление,
+#  в противном случае вызывается метод compare_records (сравнение). Возвращает список операций
+    def plan_record(self, object_type: str, source_new_dn: str, source_attributes: dict, **add_options):
+        name = RECORD_NAMES[object_type]
+        # Вызывается метод __is_record_exist для поиска записи с указанным novellGUID в индексе целевого сервера.
+        dest_dn = self.__is_record_exist(object_type, source_attributes['novellGUID'])
         if not dest_dn:
+            operation = {'op': 'add', 'dn': source_new_dn, 'object_class': OBJECT_CLASSES[object_type], \
+                         'attributes': dict(source_attributes)}
+            operation.update(add_options)
+            return [operation]
+        logging.info(name + source_new_dn + ' уже существует')
+        if len(dest_dn) == 1:
+            return self.compare_records(source_dn = source_new_dn, source_attr = source_attributes, dest_record = dest_dn[0])
+        logging.error(name + source_new_dn + ' Существует больше одного объекта с novellGUID: ' + source_attributes['novellGUID'])
+        return []
+
+## Метод возвращающий множество членов группы на целевом сервере (DN в нижнем регистре).
+#  Для больших групп сервер возвращает значения частями в атрибуте member;range=N-M (ranged retrieval),
+#  следующая часть запрашивается с N = M + 1, последняя часть имеет вид member;range=N-*
+    def get_group_members(self, group_dn: str):
+        members = set()
+        attribute = 'member'
+        while attribute:
+            self.search(search_base=group_dn, search_filter='(objectclass=group)', search_scope=BASE, attributes=[attribute])
+            entries = [entry for entry in self.response if entry['type'] == 'searchResEntry']
+            attribute = None
+            if not entries:
+                break
+            for key, values in entries[0]['attributes'].items():
+                name, _, value_range = key.partition(';range=')
+                if name.lower() != 'member' or not values:
+                    continue
+                members.update(value.lower() for value in values)
+                range_end = value_range.partition('-')[2]
+                if range_end and range_end != '*':
+                    attribute = f'member;range={int(range_end) + 1}-*'
+        return members
+
+## Метод проверяющий, вернул ли сервер в атрибутах записи только часть членов группы (member;range=N-M)
+    @staticmethod
+    def partial_members(attributes: dict):
+        for key in attributes:
+            name, _, value_range = key.partition(';range=')
+            if name.lower() == 'member' and value_range and not value_range.endswith('-*'):
+                return True
+        return False
+
+## Метод возвращающий множество членов группы (DN в нижнем регистре) по атрибутам записи, прочитанным поиском.
+#  Если сервер вернул только часть значений (см. partial_members), члены группы читаются get_group_members
+    def group_members(self, group_dn: str, attributes: dict):
+        if self.partial_members(attributes):
+            return self.get_group_members(group_dn)
+        members = set()
+        for key, values in attributes.items():
+            if key.partition(';range=')[0].lower() == 'member':
+                members.update(str(value).lower() for value in (values if isinstance(values, list) else [values]))
+        return members
+
+## Метод для планирования синхронизации членства в группе между двумя серверами LDAP.
+#  Текущие члены группы читаются с целевого сервера (для новой группы - пустое множество),
+#  возвращает операцию с пользователями для добавления и удаления или None, если состав группы совпадает
+    def plan_membership(self, group_guid: str, group_dn: str, source_group_members: set):
+        dest_group = self.__is_record_exist('Group', group_guid)
+        dest_group_members = self.get_group_members(dest_group[0].dn) if len(dest_group) == 1 else set()
+        # Сравниваются списки членов группы на источнике (source_group_members) и на целевом сервере (dest_group_members).
+        if source_group_members == dest_group_members:
+            return None
+        return {'op': 'membership', 'dn': group_dn, \
+                'add': sorted(source_group_members.difference(dest_group_members)), \
+                'remove': sorted(dest_group_members.difference(source_group_members))}
+
+## Метод возвращающий текущее время сервера (атрибут currentTime корневой записи DSE) в UTC
+#  или None, если сервер его не возвращает
+    def server_time(self):
+        try:
+            self.search(search_base='', search_filter='(objectClass=*)', search_scope=BASE, attributes=['currentTime'])
+        except LDAPException as error:
+            logging.warning(f'Не удалось прочитать время сервера: {error}')
+            return None
+        for entry in self.response or []:
+            if entry['type'] != 'searchResEntry':
+                continue
+            value = entry['attributes'].get('currentTime')
+            if isinstance(value, list):
+                value = value[0] if value else None
+            if isinstance(value, (str, bytes)):
+                value = format_time(value if isinstance(value, bytes) else value.encode('utf-8'))
+            if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+                return value.astimezone(datetime.timezone.utc)
+        return None
+
+## Метод возвращающий True, если сервер поддерживает элемент управления с заданным OID.
+#  Список элементов управления читается из корневой записи DSE один раз
+    def supports_control(self, oid: str):
+        if self.supported_controls is None:
             try:
-                self.add(dn=source_new_dn, object_class=object_class, attributes=source_attributes)
-                if self.result['description'] == 'success' and self.result['type'] == 'addResponse':
-                    logging.info('Пользователь DN: ' + source_new_dn + ' добавлен')
-                else:
-                    logging.error('Пользователь DN: ' + source_new_dn + ' не создан. Ошибка: ' + self.result['message'] )
-                pass
+                self.search(search_base='', search_filter='(objectClass=*)', search_scope=BASE, attributes=['supportedControl'])
+                entries = [entry for entry in self.response if entry['type'] == 'searchResEntry']
             except LDAPException as error:
-                logging.critical(error)
-                pass
-            # Задание пароля для пользователя
-            if set_default_password and self.result['description'] == 'success':
-                self.extend.microsoft.modify_password(source_new_dn, new_password=default_password)
-                # По умолчанию (определяется в конфигурации) пользователь создается неактивным (userAccountControl = 514)
-                if disable_user.lower() == 'true':
-                    self.modify(source_new_dn, {'userAccountControl': [('MODIFY_REPLACE', 514)]})
+                logging.warning(f'Не удалось прочитать список элементов управления сервера: {error}')
+                entries = []
+            self.supported_controls = set(entries[0]['attributes'].get('supportedControl', [])) if entries else set()
+        return oid in self.supported_controls
+
+## Метод для планирования удаления записи (объекта) из LDAP-каталога по идентификатору объекта (атрибут NovellGUID).
+#  Для удаления поддерева OU (subtree - удаляемые записи поддерева [тип объекта, GUID, DN]) операция содержит
+#  все записи поддерева от дочерних к родительским: они удаляются по отдельности, если удаление поддерева невозможно
+    def plan_delete(self, object_type: str, guid: str, subtree: list = None):
+        # Получение DN (Distinguished Name) записи из индекса целевого сервера
+        dest_dn = self.__is_record_exist(object_type, guid)
+        if not dest_dn:
+            logging.error("Запись с novellGUID: " + guid + " не найдена на целевом сервере")
+            return []
+        operation = {'op': 'delete', 'dn': dest_dn[0].dn}
+        if subtree is not None:
+            records = subtree + [[object_type, guid, dest_dn[0].dn]]
+            operation.update(tree=True, records=sorted(records, key=lambda record: -len(parse_dn(record[2]))))
+        return [operation]
+
+## Метод для добавления записи в индекс целевого сервера после ее создания
+    def __index_new_record(self, object_type: str, guid: str, dn: str, attributes: dict):
+        self.dest_index.setdefault(object_type, {})[guid] = [Record(guid, dn, attributes)]
+
+## Метод для выполнения шага плана изменений (см. plan.Change_Plan): операции выполняются по порядку,
+#  при ошибке выполнение шага прекращается. Возвращает True, если все операции выполнены успешно
+    def apply_operations(self, step: dict, default_password: str = None):
+        self.metrics_labels = (step['phase'], step['object_type'])
+        self.step_guid = step['guid']
+        try:
+            for operation in step['operations']:
+                if operation['op'] == 'add':
+                    success = self.__apply_add(step, operation, default_password)
+                elif operation['op'] in ('move', 'rename'):
+                    success = self.__apply_modify_dn(step, operation)
+                elif operation['op'] == 'modify':
+                    success = self.__apply_modify(step, operation)
+                elif operation['op'] == 'membership':
+                    success = self.__apply_membership(operation)
                 else:
-                    self.modify(source_new_dn, {'userAccountControl': [('MODIFY_REPLACE', 512)]})
-                # Установка флага для смены пароля при первом входе
-                self.modify(source_new_dn, {'pwdLastSet': [('MODIFY_REPLACE', 0)]})
-                if self.result['description'] == 'success' and self.result['type'] == 'modifyResponse':
-                    logging.info('Пароль \'' + default_password + '\' установлен для пользователя DN: ' + source_new_dn)
-                pass
-        # В противном случае производится логирование и вызывается метод compare_records (сравнение)
+                    success = self.__apply_delete(step, operation)
+                if not success:
+                    return False
+            return True
+        finally:
+            self.metrics_labels = None
+            self.step_guid = None
+
+## Метод для добавления записи в LDAP-каталог. Для учетной записи устанавливается пароль,
+#  пользователь активируется/деактивируется и устанавливается флаг для смены пароля при первом входе.
+#  Пароль и параметры учетной записи передаются в том же запросе add (один запрос вместо четырех, требуется TLS).
+#  Если сервер не принимает их в запросе add, пользователь создается без них, а пароль и параметры
+#  устанавливаются отдельными запросами; для следующих пользователей сразу используется этот способ
+    def __apply_add(self, step: dict, operation: dict, default_password: str):
+        name = RECORD_NAMES[step['object_type']]
+        source_new_dn = operation['dn']
+        set_password = operation.get('set_default_password')
+        single_request = set_password and self.single_request_add
+        attributes = operation['attributes']
+        if single_request:
+            attributes = dict(attributes, **account_attributes(default_password, operation['disable_user']))
+        try:
+            self.add(dn=source_new_dn, object_class=operation['object_class'], attributes=attributes)
+            if single_request and self.result['description'] in ACCOUNT_ADD_REJECTED:
+                logging.warning(name + source_new_dn + ' сервер не принял пароль и параметры учетной записи в запросе создания (' + \
+                                self.result['description'] + '), они будут установлены отдельными запросами')
+                single_request = False
+                self.add(dn=source_new_dn, object_class=operation['object_class'], attributes=operation['attributes'])
+                # Следующие пользователи создаются без пароля и параметров учетной записи, только если запрос без них
+                # выполнен: иначе причина отказа не в них, и ошибка относится только к этой записи
+                if self.result['description'] == 'success':
+                    self.single_request_add = False
+        except LDAPException as error:
+            logging.critical(error)
+            return False
+        # Запись создана прерванным запуском: пароль и параметры учетной записи устанавливаются отдельными запросами,
+        # так как запуск мог прерваться до их установки
+        if self.resume and self.result['description'] == 'entryAlreadyExists':
+            logging.info(name + source_new_dn + ' уже ' + RECORD_ADD_MESSAGES[step['object_type']][1] + ' прерванным запуском')
+            single_request = False
+        elif self.result['description'] != 'success' or self.result['type'] != 'addResponse':
+            logging.error(name + source_new_dn + ' не ' + RECORD_ADD_MESSAGES[step['object_type']][1] + '. Ошибка: ' + self.result['message'] )
+            return False
         else:
-            logging.info('Пользователь DN: ' + source_new_dn + ' уже существует')
-            if len(dest_dn) == 1:
-                self.compare_records(source_dn = source_new_dn, source_attr = source_attributes, dest_object = dest_dn[0])
+            logging.info(name + source_new_dn + ' ' + RECORD_ADD_MESSAGES[step['object_type']][0])
+        self.__index_new_record(step['object_type'], step['guid'], source_new_dn, operation['attributes'])
+        if single_request:
+            logging.info('Пароль \'' + default_password + '\' установлен для пользователя DN: ' + source_new_dn)
+        # Задание пароля для пользователя
+        elif set_password:
+            self.extend.microsoft.modify_password(source_new_dn, new_password=default_password)
+            # По умолчанию (определяется в конфигурации) пользователь создается неактивным (userAccountControl = 514)
+            if operation['disable_user'].lower() == 'true':
+                self.modify(source_new_dn, {'userAccountControl': [('MODIFY_REPLACE', 514)]})
             else:
-                logging.error('Пользователь DN: ' + source_new_dn + ' Существует больше одного объекта с novellGUID: ' + source_attributes['novellGUID'])
-
-## Метод для добавления группы в LDAP-каталог. 
-    def add_group_record(self, source_new_dn: str, source_attributes: dict, dest_attributes: dict, object_class = ['top', 'group']):
-        # Проверка существования записи
-        # Вызывается метод __is_record_exist для проверки существования записи с указанным novellGUID и другими атрибутами.
-        dest_dn = self.__is_record_exist(source_attributes['novellGUID'],attr=list(dest_attributes))
-        # Если не существует, то группа создается
-        if not dest_dn:
-            self.add(dn=source_new_dn, object_class = object_class, attributes=source_attributes)
-            if self.result['description'] == 'success' and self.result['type'] == 'addResponse':
-                logging.info('Группа DN: ' + source_new_dn + ' добавлена')
+                self.modify(source_new_dn, {'userAccountControl': [('MODIFY_REPLACE', 512)]})
+            # Установка флага для смены пароля при первом входе
+            self.modify(source_new_dn, {'pwdLastSet': [('MODIFY_REPLACE', 0)]})
+            if self.result['description'] == 'success' and self.result['type'] == 'modifyResponse':
+                logging.info('Пароль \'' + default_password + '\' установлен для пользователя DN: ' + source_new_dn)
+        return True
+
+## Метод для перемещения записи в другой контейнер или переименования записи
+    def __apply_modify_dn(self, step: dict, operation: dict):
+        dn = operation['dn']
+        if operation['op'] == 'move':
+            self.modify_dn(dn, operation['rdn'], new_superior=operation['new_superior'])
+            new_dn = ','.join([operation['rdn'], operation['new_superior']])
+        else:
+            self.modify_dn(dn, operation['rdn'])
+            new_dn = ','.join([operation['rdn']] + dn.split(',')[1:])
+        # Запись перемещена или переименована прерванным запуском: исходного DN уже нет, запись находится по новому DN
+        if self.resume and self.result['description'] == 'noSuchObject' and self.read_record(new_dn) is not None:
+            logging.info('DN: ' + dn + ' уже изменен на ' + new_dn + ' прерванным запуском')
+        elif self.result['description'] != 'success':
+            if operation['op'] == 'move':
+                logging.error('DN: ' + dn + '. Ошибка перемещения: ' + self.result['message'] )
             else:
-                logging.error('Группа DN: ' + source_new_dn + ' не создана. Ошибка: ' + self.result['message'] )
-        # В противном случае производится логирование и вызывается метод compare_records (сравнение)
+                logging.error('DN: ' + dn + ' при переименовании произошла ошибка: ' + self.result['message'] )
+            return False
+        elif operation['op'] == 'move':
+            logging.info('DN: ' + dn + ' перемещен в контейнер ' + operation['new_superior'])
         else:
-            logging.info('Группа DN:' + source_new_dn + ' уже существует')
-            if len(dest_dn) == 1:
-                self.compare_records(source_dn = source_new_dn, source_attr = source_attributes, dest_object = dest_dn[0])
-
-## Метод для синхронизации членства в группе между двумя серверами LDAP
-    def update_user_membership(self, source_group_members: list, group_dn: str):
-        # Получение текущих членов группы на целевом сервере:
-        # Используется метод search_records для поиска записи группы и получения ее членов.
-        # Результат сохраняется в множество dest_group_members.
-        dest_group_members = set(entry.lower() for entry in self.search_records(filter='(objectclass=group)', \
-                                                                                search_base=group_dn,\
-                                                                                      attribute_list=['member'])[0].member)
-        # Проверка различий между членами групп на источнике и целевом
-        # Сравниваются списки членов группы на источнике (source_group_members) и на целевом сервере (dest_group_members).
-        # Если есть различия, выполняются дополнительные шаги для обновления состава группы на целевом сервере
-        if source_group_members != dest_group_members:
-            # Удаление лишних пользователей из группы на целевом сервере
-            # Вычисляются пользователи, которые есть в группе на целевом сервере, но отсутствуют в группе на источнике.
-            members_for_del = dest_group_members.difference(source_group_members)
-            # Если такие пользователи есть, они удаляются из группы
-            if members_for_del:
-                ad_remove_members_from_groups(connection=self,\
-                                               members_dn=members_for_del, \
-                                                groups_dn=group_dn, \
-                                                    fix=True, raise_error=False)
-                if self.result['description'] == 'success' and self.result['type'] == 'modifyResponse':
-                    logging.info(f'Из группы {group_dn} удалены пользователи: {members_for_del}')
-                else:
-                    logging.error(f'При удалении из группы DN: {group_dn} ошибка: {self.result["message"]}')
-            # Добавление новых пользователей в группу:
-            # Вызывается метод ad_add_members_to_groups для добавления пользователей в группу.
+            logging.info('DN: ' + dn + ' переименован в ' + operation['rdn'])
+        for record in self.__is_record_exist(step['object_type'], step['guid']):
+            record.dn = new_dn
+        return True
+
+## Метод для обновления атрибутов записи
+    def __apply_modify(self, step: dict, operation: dict):
+        compare_attributes = operation['changes']
+        self.modify(operation['dn'], compare_attributes)
+        if self.result['description'] != 'success':
+            logging.error('DN: ' + operation['dn'] + ' ошибка при обновлении атрибутов ' + ' ,'.join(list(compare_attributes.keys())) + ': ' + self.result['message'] )
+            return False
+        for record in self.__is_record_exist(step['object_type'], step['guid']):
+            record.update({key: change[1] for key, change in compare_attributes.items()})
+        logging.info('DN: ' + operation['dn'] + ' обновлены атрибуты: ' + ' ,'.join(list(compare_attributes.keys())))
+        return True
+
+## Метод для обновления состава группы: удаление лишних и добавление новых членов группы
+    def __apply_membership(self, operation: dict):
+        group_dn = operation['dn']
+        chunk_size = self.member_chunk_size
+        # Изменения отправляются частями не больше member_chunk_size значений в одном запросе modify
+        # Удаление лишних пользователей из группы на целевом сервере
+        for index in range(0, len(operation['remove']), chunk_size):
+            members_for_del = operation['remove'][index:index + chunk_size]
+            self.modify(group_dn, {'member': [('MODIFY_DELETE', members_for_del)]})
+            # Часть пользователей удалена прерванным запуском: сервер отклоняет весь запрос,
+            # поэтому пользователи удаляются по одному, уже удаленные пропускаются
+            if self.resume and self.result['description'] == 'noSuchAttribute':
+                if not self.__remove_members(group_dn, members_for_del):
+                    return False
+                logging.info(f'Из группы {group_dn} удалены пользователи: {members_for_del}')
+            elif self.result['description'] == 'success' and self.result['type'] == 'modifyResponse':
+                logging.info(f'Из группы {group_dn} удалены пользователи: {members_for_del}')
+            else:
+                logging.error(f'При удалении из группы DN: {group_dn} ошибка: {self.result["message"]}')
+                return False
+        # Добавление новых пользователей в группу
+        for index in range(0, len(operation['add']), chunk_size):
+            members_for_add = operation['add'][index:index + chunk_size]
             try:
-                ad_add_members_to_groups(connection=self, members_dn=source_group_members,\
-                                          groups_dn=group_dn, fix=True, raise_error=False)
-                if self.result['description'] == 'success' and self.result['type'] == 'modifyResponse':
-                    logging.info(f'Для группы {group_dn} обновлено/добавлено членство пользователей: {source_group_members}')
-                elif self.result['description'] == 'success' and self.result['type'] == 'searchResDone':
-                    pass
-                else:
-                    logging.error(f'При добавлении пользователей в группу: {group_dn} возникла ошибка: {self.result["message"]}')
+                self.modify(group_dn, {'member': [('MODIFY_ADD', members_for_add)]})
             except LDAPInvalidDnError as error:
                 logging.error(error)
-
-## Метод для удаления записей (объектов) из LDAP-каталога.
-#  В качестве входных данных получает словарь с идентификаторами объектов (атрибут NovellGUID)
-    def delete_records(self, records: dict):
-        # Итерация по переданным записям
-        for record in records:
-            # Получение DN (Distinguished Name) записи:
-            # Вызывается метод __is_record_exist для поиска записи в LDAP-каталоге и получения ее DN.
-            dn = self.__is_record_exist(record)[0].entry_dn
-            # Удаление записи: Вызывается метод delete с переданным DN для удаления записи
-            self.delete(dn)
-            if self.result['description'] == 'success' and self.result['type'] == 'delResponse':
-                logging.info("Удален DN: " + dn)
+                return False
+            # Часть пользователей добавлена прерванным запуском: сервер отклоняет весь запрос,
+            # поэтому пользователи добавляются по одному, уже добавленные пропускаются
+            if self.resume and self.result['description'] == 'attributeOrValueExists':
+                if not self.__add_members(group_dn, members_for_add):
+                    return False
+                logging.info(f'Для группы {group_dn} добавлено членство пользователей: {members_for_add}')
+            elif self.result['description'] == 'success' and self.result['type'] == 'modifyResponse':
+                logging.info(f'Для группы {group_dn} добавлено членство пользователей: {members_for_add}')
             else:
-                logging.error("При удалении DN: " + dn + " возникла ошибка: " + self.result['message'] )
+                logging.error(f'При добавлении пользователей в группу: {group_dn} возникла ошибка: {self.result["message"]}')
+                return False
+        return True
+
+## Метод для добавления пользователей в группу по одному запросу на пользователя (при продолжении применения плана).
+#  Пользователи, которые уже являются членами группы (attributeOrValueExists), пропускаются
+    def __add_members(self, group_dn: str, members: list):
+        for member in members:
+            try:
+                self.modify(group_dn, {'member': [('MODIFY_ADD', [member])]})
+            except LDAPInvalidDnError as error:
+                logging.error(error)
+                return False
+            if self.result['description'] not in ('success', 'attributeOrValueExists'):
+                logging.error(f'При добавлении пользователя {member} в группу: {group_dn} возникла ошибка: {self.result["message"]}')
+                return False
+        return True
+
+## Метод для удаления пользователей из группы по одному запросу на пользователя (при продолжении применения плана).
+#  Пользователи, которые уже не являются членами группы (noSuchAttribute), пропускаются
+    def __remove_members(self, group_dn: str, members: list):
+        for member in members:
+            self.modify(group_dn, {'member': [('MODIFY_DELETE', [member])]})
+            if self.result['description'] not in ('success', 'noSuchAttribute'):
+                logging.error(f'При удалении пользователя {member} из группы DN: {group_dn} ошибка: {self.result["message"]}')
+                return False
+        return True
+
+## Метод для удаления записи (объекта) из LDAP-каталога
+    def __apply_delete(self, step: dict, operation: dict):
+        if operation.get('tree'):
+            return self.__apply_tree_delete(step, operation)
+        return self.__delete_record(step['object_type'], step['guid'], operation['dn'])
+
+    def __delete_record(self, object_type: str, guid: str, dn: str, controls: list = None):
+        self.delete(dn, controls=controls)
+        if self.result['description'] == 'success' and self.result['type'] == 'delResponse':
+            self.dest_index.get(object_type, {}).pop(guid, None)
+            logging.info("Удален DN: " + dn)
+            return True
+        # Запись удалена прерванным запуском
+        if self.resume and self.result['description'] == 'noSuchObject':
+            self.dest_index.get(object_type, {}).pop(guid, None)
+            logging.info("DN: " + dn + " уже удален прерванным запуском")
+            return True
+        logging.error("При удалении DN: " + dn + " возникла ошибка: " + self.result['message'] )
+        return False
+
+## Метод для удаления поддерева OU одним запросом с элементом управления tree delete.
+#  Если в поддереве есть записи без novellGUID (созданные не миграцией), они не удаляются: записи миграции
+#  удаляются по отдельности от дочерних к родительским
+    def __apply_tree_delete(self, step: dict, operation: dict):
+        dn = operation['dn']
+        records = operation['records']
+        self.search(search_base=dn, search_filter='(!(novellGUID=*))', search_scope=SUBTREE, size_limit=1)
+        if any(entry['type'] == 'searchResEntry' for entry in self.response):
+            logging.warning(f'В поддереве {dn} есть записи, созданные не миграцией, записи поддерева удаляются по отдельности')
+            return all(self.__delete_record(object_type, guid, record_dn) for object_type, guid, record_dn in records)
+        if not self.__delete_record(step['object_type'], step['guid'], dn, controls=[(TREE_DELETE_CONTROL, True, None)]):
+            return False
+        for object_type, guid, _ in records:
+            self.dest_index.get(object_type, {}).pop(guid, None)
+        logging.info(f'Удалено поддерево {dn}, записей миграции: {len(records)}')
+        return True
     pass
     
 pass
-
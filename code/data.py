@@ -1,5 +1,5 @@
 from enum import Enum
-from ldap3 import Server, Tls
+from ldap3 import Server, ServerPool, Tls, ROUND_ROBIN
 import ssl
 import json
 
@@ -95,3 +95,50 @@ class Server_Data (Server):
         return ','.join(ldap_address)
     
     pass
+
+
+
+class Server_Pool_Data (ServerPool):
+    """
+    A class to represent a pool of ldap servers of the same type (domain controllers, replicas).
+
+    Every connection opened on the pool takes a server by the pool strategy: ROUND_ROBIN spreads
+    the connections over the servers, FIRST uses the first available server and switches to
+    the next one only when it is unavailable. Availability of a server is checked before it is
+    used, an unavailable server is skipped for exhaust seconds.
+
+    Attributes
+    ----------
+    fqdns : list
+        Fully Qualified Domain Names of the ldap servers
+    ldap_type : LDAP_Type
+        LDAP type of the servers
+    """
+
+    def __init__(self, fqdns: list, ldap_type: LDAP_Type, pool_strategy: str = ROUND_ROBIN, exhaust: int = 60, \
+                 tries: int = 10, ca_certs_path='/var/lib/samba/private/tls/ca.pem'):
+        """
+        Init attributes for creating ServerPool Object
+
+        Parameters
+        ----------
+            fqdns : list
+                Fully Qualified Domain Names of the ldap servers
+            ldap_type : LDAP_Type
+                LDAP type of the servers
+            pool_strategy : str, optional
+                ldap3 pool strategy: ROUND_ROBIN, FIRST or RANDOM (default is ROUND_ROBIN)
+            exhaust : int, optional
+                Number of seconds an unavailable server is skipped (default is 60)
+            tries : int, optional
+                Number of cycles over the servers to find an available one (default is 10)
+            ca_cert_path: str, optional
+                Path to CA certificate file
+        """
+
+        self.fqdns = list(fqdns)
+        self.ldap_type = ldap_type
+        # Состояние пула (текущий сервер, недоступные серверы) общее для всех подключений
+        super().__init__([Server_Data(fqdn, ldap_type, ca_certs_path) for fqdn in self.fqdns], \
+                         pool_strategy=pool_strategy, active=max(1, tries), exhaust=exhaust, single_state=True)
+        pass
@@ -0,0 +1,57 @@
+import re
+import sys
+from functools import lru_cache
+
+
+## Разбор и преобразование DN. DN разбирается один раз в кортеж RDN вида (тип атрибута в нижнем регистре, значение),
+#  результаты разбора и конвертации кэшируются (LRU), строки интернируются, поэтому повторяющиеся DN
+#  (контейнеры, члены групп) хранятся в памяти в одном экземпляре
+
+# Максимальное количество DN в каждом из кэшей
+DN_CACHE_SIZE = 262144
+
+# RDN - последовательность символов до неэкранированной запятой
+_RDN = re.compile(r'(?:[^,\\]|\\.)+')
+
+
+## Функция для получения регулярного выражения корневого DN (компилируется один раз для каждого корневого DN)
+@lru_cache(maxsize=None)
+def root_pattern(root_dn: str):
+    return re.compile(re.escape(root_dn), re.IGNORECASE)
+
+
+## Разбор DN в кортеж RDN без кэширования (см. parse_dn, normalize_dn)
+def _split_dn(dn: str):
+    rdns = []
+    for rdn in _RDN.findall(dn):
+        attribute, _, value = rdn.partition('=')
+        rdns.append((sys.intern(attribute.strip().lower()), sys.intern(value.strip())))
+    return tuple(rdns)
+
+
+## Функция для разбора DN в кортеж RDN: (('cn', 'user1'), ('ou', 'U2'), ('o', 'gazprom'))
+@lru_cache(maxsize=DN_CACHE_SIZE)
+def parse_dn(dn: str):
+    return _split_dn(dn)
+
+
+## Функция для сборки строки DN из кортежа RDN
+def format_dn(rdns: tuple):
+    return sys.intern(','.join(attribute + '=' + value for attribute, value in rdns))
+
+
+## Функция для нормализации DN (типы атрибутов в нижнем регистре, без пробелов вокруг RDN). Разбор не кэшируется:
+#  используется для DN, которые хранятся в индексе в одном экземпляре
+def normalize_dn(dn: str):
+    return format_dn(_split_dn(dn))
+
+
+## Функция для конвертации DN в формат целевого сервера (регистронезависимая замена корневого DN)
+@lru_cache(maxsize=DN_CACHE_SIZE)
+def translate_dn(dn: str, source_root_dn: str, dest_root_dn: str):
+    return sys.intern(root_pattern(source_root_dn).sub(lambda match: dest_root_dn, dn))
+
+
+## Функция возвращающая количество OU в DN (для определения порядка создания и удаления OU)
+def ou_depth(dn: str):
+    return sum(1 for attribute, _ in parse_dn(dn) if attribute == 'ou')
@@ -0,0 +1,108 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Full
+
+
+# Признак завершения поиска
+_DONE = object()
+
+
+class Extract_Scheduler:
+    """
+    A class to represent the scheduler of concurrent searches on one LDAP server.
+
+    Every search (OU x object class) is started on a free connection of the scheduler as soon as it is
+    requested, up to workers searches at the same time. Results of a search are buffered in its own
+    queue and are read in the order of the search results, searches are read in the order they were
+    requested, so the callers get the same ordered records as with sequential searches.
+    The interface of iter_records is the same as LDAP_Connector.iter_records.
+
+    Attributes
+    ----------
+    workers : int
+        Number of searches running at the same time (connections of the scheduler)
+    queue_size : int
+        Maximum number of buffered records of one search (0 - not limited)
+
+    Methods
+    -------
+    iter_records(filter, search_base, attribute_list, page_size):
+        Start a paged search and return the iterator of its records (DN, attributes)
+    close():
+        Stop the searches and close the connections of the scheduler
+    """
+
+    def __init__(self, connector, workers: int = 1, queue_size: int = 1000):
+        """
+        Init attributes for creating Extract_Scheduler Object
+
+        Parameters
+        ----------
+            connector : LDAP_Connector
+                Bound connection, the searches are run on its clones
+            workers : int, optional
+                Number of searches running at the same time (default is 1)
+            queue_size : int, optional
+                Maximum number of buffered records of one search (default is 1000, 0 - not limited).
+                A search with a full queue waits until the records are read
+        """
+
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.__clones = [connector.clone() for _ in range(self.workers)]
+        self.__connectors = Queue()
+        for clone in self.__clones:
+            self.__connectors.put(clone)
+        self.__executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='extract')
+        self.__closed = threading.Event()
+
+## Метод запускающий постраничный поиск на свободном соединении планировщика (или ставящий его в очередь,
+#  если заняты все соединения). Возвращает итератор записей (DN, словарь атрибутов) в порядке результатов поиска.
+#  Исключение поиска передается при чтении записей
+    def iter_records(self, filter: str, search_base: str, attribute_list=['distinguishedName'], page_size: int = 1000):
+        results = Queue(maxsize=self.queue_size)
+        self.__executor.submit(self.__search, results, filter, search_base, list(attribute_list), page_size)
+        return self.__read(results)
+
+    def __search(self, results: Queue, filter: str, search_base: str, attribute_list: list, page_size: int):
+        if self.__closed.is_set():
+            return
+        connector = self.__connectors.get()
+        try:
+            for record in connector.iter_records(filter=filter, search_base=search_base, \
+                                                 attribute_list=attribute_list, page_size=page_size):
+                if not self.__put(results, record):
+                    return
+        except BaseException as error:
+            self.__put(results, error)
+            return
+        finally:
+            self.__connectors.put(connector)
+        self.__put(results, _DONE)
+
+## Метод добавляющий запись в очередь поиска. Возвращает False, если планировщик закрыт (результаты больше не читаются)
+    def __put(self, results: Queue, item):
+        while not self.__closed.is_set():
+            try:
+                results.put(item, timeout=1)
+                return True
+            except Full:
+                continue
+        return False
+
+    @staticmethod
+    def __read(results: Queue):
+        while True:
+            item = results.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+## Метод останавливающий поиски и закрывающий соединения планировщика
+    def close(self):
+        self.__closed.set()
+        self.__executor.shutdown()
+        for clone in self.__clones:
+            clone.unbind()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+
+
+## Функция для вычисления отпечатка записи: хэш SHA-256 от DN (без учета регистра) и нормализованных атрибутов
+#  (ключи в нижнем регистре, многозначные атрибуты - отсортированные списки, см. connector.normalize_attribute)
+def record_fingerprint(dn: str, attributes: dict):
+    normalized = {key.lower(): value for key, value in attributes.items()}
+    data = json.dumps([dn.lower(), normalized], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class Fingerprint_Store:
+    """
+    A class to represent the local sidecar file with fingerprints of synchronized entries.
+
+    A fingerprint is saved only when the target entry is known to match the source entry:
+    the comparison found no differences or the planned operations were applied successfully.
+
+    Attributes
+    ----------
+    path : str
+        Path to the local fingerprint file (JSON)
+
+    Methods
+    -------
+    get(guid):
+        Return the saved fingerprint of the entry or None
+    update(guid, fingerprint):
+        Save the fingerprint of a synchronized entry
+    discard(guid):
+        Remove the fingerprint of a deleted entry
+    take_updates():
+        Return the fingerprints saved since the previous call (sharded planning)
+    save():
+        Write the fingerprints to the file
+    """
+
+    def __init__(self, path: str):
+        """
+        Init attributes for creating Fingerprint_Store Object
+
+        Parameters
+        ----------
+            path : str
+                Path to the local fingerprint file, saved fingerprints are loaded if the file exists
+        """
+
+        self.path = path
+        self.__fingerprints = {}
+        self.__updates = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.__fingerprints = json.load(file)
+
+## Метод возвращающий сохраненный отпечаток записи
+    def get(self, guid: str):
+        return self.__fingerprints.get(guid)
+
+## Метод для сохранения отпечатка синхронизированной записи
+    def update(self, guid: str, fingerprint: str):
+        self.__fingerprints[guid] = fingerprint
+        self.__updates[guid] = fingerprint
+
+## Метод возвращающий отпечатки, сохраненные после предыдущего вызова (передаются из процесса-обработчика шарда координатору)
+    def take_updates(self):
+        updates, self.__updates = self.__updates, {}
+        return updates
+
+## Метод для удаления отпечатка удаленной записи
+    def discard(self, guid: str):
+        self.__fingerprints.pop(guid, None)
+
+## Метод для сохранения отпечатков в файл (через временный файл, чтобы не повредить файл при сбое)
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.__fingerprints, file, sort_keys=True)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+
+
+class Apply_Journal:
+    """
+    A class to represent the append-only journal of applied plan steps.
+
+    The first line of the journal holds the identifier of the plan, every next line - one
+    successfully applied step (phase and GUID). The file is synced to disk not more often than
+    once per sync_interval seconds and when the journal is closed, so after a crash only the
+    last steps of the interval can be lost and are applied again by the resumed run.
+
+    Attributes
+    ----------
+    path : str
+        Path to the journal file (JSON Lines)
+    sync_interval : float
+        Interval between syncs of the journal to disk, in seconds
+
+    Methods
+    -------
+    completed(plan_id):
+        Return the set of (phase, guid) of the steps applied for the plan, ValueError if the journal belongs to another plan
+    start(plan_id, resume):
+        Open the journal for writing, a new journal is started unless the run resumes the same plan
+    record(step):
+        Register a successfully applied step
+    close():
+        Sync and close the journal
+    """
+
+    def __init__(self, path: str, sync_interval: float = 1.0):
+        """
+        Init attributes for creating Apply_Journal Object
+
+        Parameters
+        ----------
+            path : str
+                Path to the journal file
+            sync_interval : float, optional
+                Interval between syncs of the journal to disk, in seconds (default is 1)
+        """
+
+        self.path = path
+        self.sync_interval = sync_interval
+        self.__file = None
+        self.__lock = threading.Lock()
+        self.__last_sync = 0.0
+
+## Метод возвращающий множество (фаза, GUID) шагов, выполненных для плана plan_id. Если журнал относится к другому
+#  плану (например, к конвейерному запуску, для которого файл плана не сохраняется), выполненные шаги неизвестны,
+#  и вызывается ValueError. Незавершенная последняя строка (запись прервана сбоем) пропускается
+    def completed(self, plan_id: str):
+        steps = set()
+        if not os.path.exists(self.path):
+            return steps
+        if not self.__header_matches(plan_id):
+            raise ValueError(f'Журнал {self.path} относится к другому плану изменений, продолжение плана {plan_id} невозможно')
+        with open(self.path, 'r', encoding='utf-8') as file:
+            file.readline()
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                steps.add((entry['phase'], entry['guid']))
+        return steps
+
+## Метод для открытия журнала на запись. При продолжении (resume) того же плана записи дописываются в конец,
+#  иначе начинается новый журнал с идентификатором плана в первой строке
+    def start(self, plan_id: str, resume: bool = False):
+        if resume and self.__header_matches(plan_id):
+            self.__file = open(self.path, 'a', encoding='utf-8')
+            # Строка, запись которой прервана сбоем, завершается, чтобы следующая запись начиналась с новой строки
+            if self.__file.tell() and not self.__ends_with_newline():
+                self.__file.write('\n')
+        else:
+            self.__file = open(self.path, 'w', encoding='utf-8')
+            self.__file.write(json.dumps({'plan': plan_id}) + '\n')
+            self.__sync()
+
+    def __ends_with_newline(self):
+        with open(self.path, 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b'\n'
+
+    def __header_matches(self, plan_id: str):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as file:
+            try:
+                return json.loads(file.readline()).get('plan') == plan_id
+            except ValueError:
+                return False
+
+## Метод для записи выполненного шага. Файл синхронизируется с диском не чаще одного раза в sync_interval секунд
+    def record(self, step: dict):
+        with self.__lock:
+            self.__file.write(json.dumps({'phase': step['phase'], 'guid': step['guid']}, ensure_ascii=False) + '\n')
+            if time.monotonic() - self.__last_sync >= self.sync_interval:
+                self.__sync()
+
+    def __sync(self):
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__last_sync = time.monotonic()
+
+## Метод для синхронизации и закрытия журнала
+    def close(self):
+        if self.__file is not None:
+            with self.__lock:
+                self.__sync()
+                self.__file.close()
+                self.__file = None
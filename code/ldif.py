@@ -0,0 +1,116 @@
+import base64
+import os
+
+
+## Формат файлов выгрузки: LDIF (RFC 2849) для загрузки командой ldbadd -H /var/lib/samba/private/sam.ldb.
+#  Каждая запись - строка dn, строки objectClass и атрибутов, записи разделяются пустой строкой.
+#  Значения, которые нельзя записать как есть (не ASCII, переводы строк, начинаются с пробела, ':' или '<',
+#  заканчиваются пробелом), и двоичные значения записываются в base64 ("атрибут:: значение")
+
+# Максимальная длина строки LDIF, более длинные строки переносятся (продолжение начинается с пробела)
+LINE_LENGTH = 76
+
+
+## Функция возвращающая True, если значение можно записать в LDIF без base64
+def _is_safe(value: str):
+    if not value:
+        return True
+    if value[0] in ' :<' or value[-1] == ' ':
+        return False
+    return all(0 < ord(char) < 128 and char not in '\r\n' for char in value)
+
+
+## Функция для формирования строк LDIF одного значения атрибута с переносом длинных строк
+def _format_line(name: str, value):
+    if isinstance(value, bytes):
+        line = name + ':: ' + base64.b64encode(value).decode('ascii')
+    else:
+        value = str(value)
+        line = name + ': ' + value if _is_safe(value) else name + ':: ' + base64.b64encode(value.encode('utf-8')).decode('ascii')
+    lines = [line[:LINE_LENGTH]]
+    for start in range(LINE_LENGTH, len(line), LINE_LENGTH - 1):
+        lines.append(' ' + line[start:start + LINE_LENGTH - 1])
+    return '\n'.join(lines) + '\n'
+
+
+## Функция для преобразования записи в текст LDIF. Значения многозначных атрибутов записываются отдельными строками,
+#  пустые атрибуты ('[]', см. normalize_attribute) не записываются
+def format_record(dn: str, object_class: list, attributes: dict):
+    lines = [_format_line('dn', dn)]
+    lines.extend(_format_line('objectClass', value) for value in object_class)
+    for name, value in attributes.items():
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            if item != '[]':
+                lines.append(_format_line(name, item))
+    return ''.join(lines) + '\n'
+
+
+class LDIF_Writer:
+    """
+    A class to represent the streamed writer of LDIF files split into chunks.
+
+    Records are written to the current file as they arrive, a new file is started every chunk_size
+    records, so the memory used does not depend on the number of records. Files are named
+    <prefix>-NNNN.ldif, the alphabetical order of the names is the order of loading.
+
+    Attributes
+    ----------
+    directory : str
+        Directory of the LDIF files
+    prefix : str
+        Prefix of the file names
+    chunk_size : int
+        Maximum number of records in one file
+    count : int
+        Number of written records
+    files : list
+        Paths of the written files
+
+    Methods
+    -------
+    write(dn, object_class, attributes):
+        Write a record
+    close():
+        Close the current file
+    """
+
+    def __init__(self, directory: str, prefix: str, chunk_size: int = 10000):
+        """
+        Init attributes for creating LDIF_Writer Object
+
+        Parameters
+        ----------
+            directory : str
+                Directory of the LDIF files, it is created if it does not exist
+            prefix : str
+                Prefix of the file names
+            chunk_size : int, optional
+                Maximum number of records in one file (default is 10000)
+        """
+
+        self.directory = directory
+        self.prefix = prefix
+        self.chunk_size = max(1, chunk_size)
+        self.count = 0
+        self.files = []
+        self.__file = None
+        self.__chunk_count = 0
+        os.makedirs(directory, exist_ok=True)
+
+## Метод для записи записи в текущий файл (новый файл открывается после chunk_size записей)
+    def write(self, dn: str, object_class: list, attributes: dict):
+        if self.__file is None or self.__chunk_count >= self.chunk_size:
+            self.close()
+            path = os.path.join(self.directory, f'{self.prefix}-{len(self.files) + 1:04d}.ldif')
+            self.__file = open(path, 'w', encoding='utf-8', newline='\n')
+            self.files.append(path)
+            self.__chunk_count = 0
+        self.__file.write(format_record(dn, object_class, attributes))
+        self.__chunk_count += 1
+        self.count += 1
+
+## Метод закрывающий текущий файл
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
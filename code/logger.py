@@ -1,23 +1,237 @@
+import atexit
+import json
 import logging
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
 from ldap3.utils.log import *
 
 
-logging.basicConfig(
-    filename='migration.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S')
+# Имя журнала структурированных записей об операциях LDAP (см. log_operation)
+OPERATIONS_LOGGER = 'operations'
+# Интервал записи накопленных сообщений на диск (секунды) и максимальное количество сообщений в одной записи
+FLUSH_INTERVAL = 1.0
+BATCH_SIZE = 1000
+# Признак остановки потока записи
+_STOP = object()
+
+
+class Batch_File_Handler(RotatingFileHandler):
+    """
+    A class to represent a rotating log file written in batches.
+
+    The stream is not flushed after every record: Log_Writer flushes it once per batch.
+
+    Methods
+    -------
+    flush_batch():
+        Flush the records written since the previous batch
+    """
+
+    def flush(self):
+        pass
+
+## Метод для записи накопленных сообщений на диск
+    def flush_batch(self):
+        super().flush()
+
+
+class Json_Formatter(logging.Formatter):
+    """
+    A class to represent a formatter of structured records: one JSON object per line.
+    """
+
+    def format(self, record):
+        fields = {'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'), 'level': record.levelname}
+        fields.update(getattr(record, 'fields', None) or {'message': record.getMessage()})
+        return json.dumps(fields, ensure_ascii=False)
+
+
+class Log_Queue_Handler(QueueHandler):
+    """
+    A class to represent a handler that puts records into the queue of Log_Writer.
+
+    Records are not formatted in the calling thread: formatting and writing are done by Log_Writer.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class Forward_Handler(logging.Handler):
+    """
+    A class to represent a handler passing records received from shard worker processes
+    to the loggers of the coordinator with the same names.
+    """
+
+    def handle(self, record):
+        logging.getLogger(record.name).handle(record)
+        return True
+
+
+class Log_Writer:
+    """
+    A class to represent the background thread writing log records.
+
+    Records are taken from the queue and written in batches (up to BATCH_SIZE records
+    or every FLUSH_INTERVAL seconds), so the threads calling logging do not wait for disk
+    and console output.
+
+    Attributes
+    ----------
+    queue : queue.Queue
+        Queue of log records
+
+    Methods
+    -------
+    stop():
+        Write the remaining records, stop the thread and close the handlers
+    """
+
+    def __init__(self, handlers: list, operation_handlers: list):
+        """
+        Init attributes for creating Log_Writer Object
+
+        Parameters
+        ----------
+            handlers : list
+                Handlers of the migration log
+            operation_handlers : list
+                Handlers of the structured operation records
+        """
+
+        self.queue = queue.Queue()
+        self.__handlers = handlers
+        self.__operation_handlers = operation_handlers
+        self.__thread = threading.Thread(target=self.__run, name='log-writer', daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        stopped = False
+        while not stopped:
+            try:
+                batch = [self.queue.get(timeout=FLUSH_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is _STOP:
+                    stopped = True
+                    continue
+                for handler in self.__operation_handlers if record.name == OPERATIONS_LOGGER else self.__handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            for handler in self.__handlers + self.__operation_handlers:
+                if isinstance(handler, Batch_File_Handler):
+                    handler.flush_batch()
+                else:
+                    handler.flush()
+
+## Метод для записи оставшихся сообщений, остановки потока и закрытия файлов журнала
+    def stop(self):
+        self.queue.put(_STOP)
+        self.__thread.join()
+        for handler in self.__handlers + self.__operation_handlers:
+            handler.close()
+
+
+_writer = None
+_success_sample_rate = 1.0
+_random = random.Random()
+
+
+## Функция для настройки журналирования: сообщения всех журналов передаются через очередь потоку записи (Log_Writer).
+#  Журнал миграции и журнал операций (JSON Lines) ротируются при достижении max_bytes, хранится backup_count файлов.
+#  Записи об успешных операциях сохраняются в журнал операций с вероятностью success_sample_rate, об ошибках - всегда.
+#  Если background = False, поток записи не запускается и сообщения записываются в вызывающем потоке
+#  (до создания процессов-обработчиков шардов копированием процесса, см. shard.Shard_Pool)
+def setup_logging(log_file: str = 'migration.log', operation_log_file: str = None, max_bytes: int = 100 * 1024 * 1024, \
+                  backup_count: int = 5, success_sample_rate: float = 1.0, console_level: str = 'DEBUG', background: bool = True):
+    global _writer, _success_sample_rate
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+    root = logging.getLogger('')
+    operations = logging.getLogger(OPERATIONS_LOGGER)
+    for configured_logger in (root, operations):
+        for handler in configured_logger.handlers[:]:
+            configured_logger.removeHandler(handler)
+            handler.close()
+    file_handler_class = Batch_File_Handler if background else RotatingFileHandler
+    file_handler = file_handler_class(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%Y-%m-%d %H:%M:%S'))
+    # Вывод на консоль в упрощенном формате
+    console = logging.StreamHandler()
+    console.setLevel(console_level)
+    console.setFormatter(logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s'))
+    operation_handlers = []
+    if operation_log_file:
+        operation_handler = file_handler_class(operation_log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        operation_handler.setFormatter(Json_Formatter())
+        operation_handlers.append(operation_handler)
+    _success_sample_rate = success_sample_rate
+
+    if background:
+        _writer = Log_Writer([file_handler, console], operation_handlers)
+        root.addHandler(Log_Queue_Handler(_writer.queue))
+        if operation_handlers:
+            operations.addHandler(Log_Queue_Handler(_writer.queue))
+    else:
+        root.addHandler(file_handler)
+        root.addHandler(console)
+        for operation_handler in operation_handlers:
+            operations.addHandler(operation_handler)
+    root.setLevel(logging.INFO)
+    operations.propagate = False
+    operations.disabled = not operation_handlers
+
+
+## Функция для настройки журналирования процесса-обработчика шарда: сообщения всех журналов передаются через очередь
+#  multiprocessing (log_queue) процессу-координатору, который записывает их в свои журналы (см. Forward_Handler).
+#  Поток записи координатора в процессе-обработчике не работает, поэтому его очередь не используется
+def setup_worker_logging(log_queue):
+    global _writer
+    _writer = None
+    for name in ('', OPERATIONS_LOGGER):
+        worker_logger = logging.getLogger(name)
+        for handler in worker_logger.handlers[:]:
+            worker_logger.removeHandler(handler)
+        worker_logger.addHandler(QueueHandler(log_queue))
+
+
+## Функция для записи структурированного сообщения об операции LDAP (GUID, DN, операция, результат, время выполнения).
+#  Записи об успешных операциях отбираются случайно с вероятностью success_sample_rate
+def log_operation(operation: str, dn: str, result: str, seconds: float, guid: str = None, phase: str = '', object_type: str = ''):
+    operations = logging.getLogger(OPERATIONS_LOGGER)
+    if operations.disabled:
+        return
+    success = result == 'success'
+    if success and _success_sample_rate < 1 and _random.random() >= _success_sample_rate:
+        return
+    operations.log(logging.INFO if success else logging.ERROR, operation, \
+                   extra={'fields': {'op': operation, 'dn': dn, 'guid': guid, 'result': result, \
+                                     'latency': round(seconds, 6), 'phase': phase, 'object_type': object_type}})
+
+
+## Функция для записи оставшихся сообщений при завершении процесса
+def shutdown_logging():
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+# До явной настройки (см. main.py) сообщения записываются без потока записи: импорт модуля не запускает потоков
+setup_logging(background=False)
+atexit.register(shutdown_logging)
 set_library_log_activation_level(logging.INFO)
 set_library_log_detail_level(ERROR)
 set_library_log_hide_sensitive_data(False)
 
-# set up logging to console
-console = logging.StreamHandler()
-console.setLevel(logging.DEBUG)
-# set a format which is simpler for console use
-formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
-console.setFormatter(formatter)
-# add the handler to the root logger
-logging.getLogger('').addHandler(console)
-
 logger = logging.getLogger(__name__)
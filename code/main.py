@@ -1,191 +1,970 @@
-import json, datetime
+import argparse, json, datetime, os, uuid
+from ldap3 import SYNC, RESTARTABLE
 from ldap3.utils.log import *
-from connector import LDAP_Connector, CaseInsensitiveDict
-from data import LDAP_Type
-from logger import logging
+from connector import LDAP_Connector, normalize_attribute, account_attributes, OBJECT_CLASSES, TREE_DELETE_CONTROL
+from dn import parse_dn, format_dn, normalize_dn, ou_depth
+from data import LDAP_Type, Server_Pool_Data
+from writer import Write_Pool
+from throttle import Write_Throttle
+from state import Sync_State
+from plan import Change_Plan, PHASES, make_step
+from pipeline import Step_Pipeline, prefetch
+from extract import Extract_Scheduler
+from shard import Shard_Pool, guid_shard
+from mapping import Mapping_Plan
+from journal import Apply_Journal
+from fingerprint import Fingerprint_Store, record_fingerprint
+from snapshot import write_snapshot, diff_snapshots
+from ldif import LDIF_Writer
+from verify import Hash_Tree, diff_trees
+from record import Record
+from metrics import metrics
+from logger import logging, setup_logging
 
 
-## Служебные функции
-#   Количество вхождений ou (для орделения порядка создания OU)
-def count_ou_occurrences(dn):
-    return dn.count("ou=")
+# Типы объектов и ключи конфигурации с LDAP-фильтрами для них
+OBJECT_FILTERS = (('OU', 'LDAP_FILER_OU'), ('User', 'LDAP_FILTER_USER'), ('Group', 'LDAP_FILER_GROUP'))
+
 
+## Служебные функции
 #   Изменение имени группы в формат CN=OU_GroupName
 def rename_group(group_dn):
-    elements = group_dn.split(',')
-    if elements[1].split('=')[1] not in elements[0]:
-        first_element =  'cn=' + elements[1].split('=')[1] + '_' + elements[0].split('=')[1]
-        elements[0] = f"{first_element}"
-    new_string = ','.join(elements)
-    return new_string
-
-#   Маппинг атрибутов
-def map_attributes(attribute_mapping_user, source_attributes):
-    mapped_attributes = CaseInsensitiveDict()
-    for target_attr, source_attr  in attribute_mapping_user.items():
-        if source_attributes[source_attr] and source_attributes[source_attr] != '':
-            mapped_attributes[target_attr] = str(source_attributes[source_attr])
-    return mapped_attributes
+    rdns = parse_dn(group_dn)
+    (_, group_name), (_, container_name) = rdns[0], rdns[1]
+    if container_name not in group_name:
+        rdns = (('cn', container_name + '_' + group_name),) + rdns[1:]
+    return format_dn(rdns)
+
+#   Маппинг атрибутов: планы маппинга (см. mapping.Mapping_Plan) для OU, пользователей и групп компилируются один раз.
+#   Атрибут member групп не маппится (членство обрабатывается отдельно), DN-значения конвертируются connector.convert_dn
+def compile_mappings(json_config, connector):
+    return {object_type: Mapping_Plan(object_type, json_config['MappingAttr'][object_type], connector.convert_dn, \
+                                      exclude=('member',) if object_type == 'Group' else ()) \
+            for object_type, _ in OBJECT_FILTERS}
+
+#   Преобразование записи сервера источника в запись целевого сервера: конвертация DN и маппинг атрибутов.
+#   Группа переименовывается в формат CN_GroupName
+def transform_record(connector, mapping, dn, attributes, mapped_attributes=None):
+    new_dn = connector.convert_dn(dn)
+    if mapping.object_type == 'Group':
+        new_dn = rename_group(new_dn)
+    if mapped_attributes is None:
+        mapped_attributes = mapping.map(attributes)
+    if mapping.object_type == 'Group':
+        mapped_attributes['cn'] = parse_dn(new_dn)[0][1]
+    return new_dn, mapped_attributes
+
+#   Преобразование записей сервера источника страницами по batch_size записей (см. Mapping_Plan.map_page).
+#   Возвращает кортежи (DN, атрибуты сервера источника, DN целевого сервера, атрибуты целевого сервера)
+def transform_records(connector, mapping, records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield from transform_batch(connector, mapping, batch)
+            batch = []
+    yield from transform_batch(connector, mapping, batch)
+
+def transform_batch(connector, mapping, batch):
+    for (dn, attributes), mapped_attributes in zip(batch, mapping.map_page([attributes for _, attributes in batch])):
+        yield (dn, attributes) + transform_record(connector, mapping, dn, attributes, mapped_attributes)
+
+#   Список атрибутов целевого сервера для типа объектов. Атрибут member исключается,
+#   так как добавление членов выполняется после создания группы
+def dest_attribute_list(json_config, object_type):
+    return [attribute for attribute in json_config['MappingAttr'][object_type].keys() if attribute != 'member']
+
+#   Построение индекса записей целевого сервера по novellGUID: один постраничный поиск на каждый тип объектов.
+#   Поиски выполняются через dest_reader (планировщик чтения, см. open_readers): при EXTRACT_WORKERS больше 1 поиски всех
+#   типов объектов выполняются одновременно. Значения атрибутов с DN нормализуются так же, как при маппинге (transform dn).
+#   Возвращает словари {novellGUID: DN} записей целевого сервера в мигрируемых OU для каждого типа объектов
+def prepare_dest_index(json_config, samba_connector, dest_reader=None):
+    page_size = json_config.get('LDAP_PAGE_SIZE', 1000)
+    dest_search_base = samba_connector.convert_dn(json_config['MIGRATION_SEARCH_BASE'])
+    if dest_reader is None:
+        dest_reader = samba_connector
+    mappings = compile_mappings(json_config, samba_connector)
+    entries = {}
+    for object_type, filter_key in OBJECT_FILTERS:
+        query = samba_connector.dest_index_query(json_config[filter_key], dest_attribute_list(json_config, object_type))
+        entries[object_type] = dest_reader.iter_records(page_size=page_size, **query)
+    for object_type, filter_key in OBJECT_FILTERS:
+        metrics.begin_phase('Index', object_type)
+        samba_connector.build_dest_index(object_type, json_config[filter_key], dest_attribute_list(json_config, object_type), \
+                                         page_size, entries[object_type], mappings[object_type].dn_attributes)
+    return dest_index_records(json_config, samba_connector)
+
+#   Словари {novellGUID: DN} записей построенного индекса целевого сервера в мигрируемых OU для каждого типа объектов
+def dest_index_records(json_config, samba_connector):
+    dest_search_base = samba_connector.convert_dn(json_config['MIGRATION_SEARCH_BASE'])
+    dest_records = {}
+    for object_type, _ in OBJECT_FILTERS:
+        dest_records[object_type] = {}
+        for ou in json_config['MIGRATION_LIST_OU']:
+            dest_search_base_ou = f'{ou + "," if ou else ""}{dest_search_base}'
+            dest_records[object_type].update(samba_connector.indexed_records(object_type, dest_search_base_ou))
+    return dest_records
+
+#   Постраничный поиск записей сервера источника по всем OU из MIGRATION_LIST_OU.
+#   То есть если задан MIGRATION_SEARCH_BASE: "o=gazprom", а нужно копировать только ou=HQ,o=gazprom и ou=BrunchOffice01,o=gazprom
+#   то дополнительно это нужно задать в MIGRATION_LIST_OU "MIGRATION_LIST_OU": ["ou=HQ", "ou=BrunchOffice01"]
+#   Прочитанные GUID регистрируются в sync_state (если задан). При инкрементальной синхронизации (delta)
+#   читаются только объекты, измененные после high-water mark предыдущего запуска.
+#   connector - подключение или планировщик чтения (extract.Extract_Scheduler): поиски по всем OU запускаются
+#   при вызове функции и выполняются одновременно, записи возвращаются в порядке OU из MIGRATION_LIST_OU
+def iter_source_records(connector, list_ou, search_base, filter, attribute_list, page_size, \
+                        sync_state=None, object_type=None, guid_attribute=None, delta=False):
+    searches = []
+    for ou in list_ou:
+        search_base_ou = f'{ou + "," if ou else ""}{search_base}'
+        high_water = sync_state.high_water(ou, object_type) if delta else None
+        ou_filter = f'(&{filter}(modifyTimestamp>={high_water}))' if high_water else filter
+        searches.append((ou, connector.iter_records(filter=ou_filter, \
+                                                    search_base=search_base_ou, \
+                                                        attribute_list=list(attribute_list), \
+                                                            page_size=page_size)))
+
+    def records():
+        for ou, entries in searches:
+            for dn, attributes in entries:
+                if sync_state is not None:
+                    guid = attributes.get(guid_attribute)
+                    sync_state.track(ou, object_type, normalize_attribute(guid) if guid else None)
+                yield dn, attributes
+
+    return records()
+
+#   Поиск объектов для удаления: GUID записей целевого сервера (dest_records), которых нет на сервере источнике.
+#   При полной синхронизации используются GUID, прочитанные при миграции. При инкрементальной выполняется поиск
+#   только по GUID (без чтения атрибутов), результат сравнивается с сохраненным предыдущим запуском списком GUID
+def find_deleted_records(connector, list_ou, search_base, filter, page_size, \
+                         sync_state, object_type, guid_attribute, dest_records, delta=False):
+    source_guids, deleted_guids = set(), set()
+    # Поиски по всем OU запускаются до чтения результатов (при чтении через планировщик выполняются одновременно)
+    searches = [connector.iter_records(filter=filter, \
+                                       search_base=f'{ou + "," if ou else ""}{search_base}', \
+                                           attribute_list=[guid_attribute], \
+                                               page_size=page_size) if delta else None for ou in list_ou]
+    for ou, entries in zip(list_ou, searches):
+        if delta:
+            for _, attributes in entries:
+                sync_state.track(ou, object_type, normalize_attribute(attributes[guid_attribute]))
+            deleted_guids |= sync_state.guids(ou, object_type) - sync_state.current_guids(ou, object_type)
+        source_guids |= sync_state.current_guids(ou, object_type)
+    if delta:
+        return deleted_guids & set(dest_records)
+    return set(dest_records) - source_guids
+
+
+## Планирование изменений записи с проверкой отпечатка (см. fingerprint.py). Если отпечаток записи источника совпадает
+#  с сохраненным и запись с тем же DN есть в индексе целевого сервера, сравнение атрибутов не выполняется.
+#  Если сравнение не нашло отличий, отпечаток сохраняется сразу, иначе - после применения шага плана.
+#  Возвращает список операций и отпечаток записи
+def plan_record_changes(samba_connector, fingerprints, object_type, new_dn, mapped_attributes, **add_options):
+    guid = mapped_attributes['novellGUID']
+    fingerprint = record_fingerprint(new_dn, mapped_attributes)
+    dest_dn = samba_connector.indexed_dn(object_type, guid)
+    if fingerprints.get(guid) == fingerprint and dest_dn is not None and dest_dn.lower() == new_dn.lower():
+        return [], fingerprint
+    operations = samba_connector.plan_record(object_type, new_dn, mapped_attributes, **add_options)
+    if not operations and dest_dn is not None:
+        fingerprints.update(guid, fingerprint)
+    return operations, fingerprint
+
+
+## Планирование удаления записей. DN удаляемых записей берутся из индекса целевого сервера (dest_records).
+#  Если сервер поддерживает удаление поддерева (tree_delete), удаляемая OU, в поддереве которой все записи миграции
+#  тоже удаляются, удаляется одним запросом вместе с ними (в шаге фазы Delete OU для верхней такой OU).
+#  Остальные записи удаляются по отдельности: группы, затем пользователи (записи одной фазы удаляются параллельно),
+#  затем OU от дочерних к родительским
+def plan_deletions(samba_connector, dest_records: dict, deleted: dict, tree_delete: bool):
+    # Контейнеры, в поддереве которых есть записи миграции, которые не удаляются (в том числе перемещаемые)
+    kept = set()
+    if tree_delete:
+        for object_type, records in dest_records.items():
+            for guid, dn in records.items():
+                if guid not in deleted[object_type]:
+                    rdns = parse_dn(dn)
+                    kept.update(format_dn(rdns[index:]).lower() for index in range(1, len(rdns)))
+    # Верхние OU удаляемых поддеревьев: {DN в нижнем регистре: записи поддерева [тип объекта, GUID, DN]}
+    subtrees = {}
+    for guid in sorted(deleted['OU'], key=lambda guid: ou_depth(dest_records['OU'][guid])):
+        dn = dest_records['OU'][guid]
+        if tree_delete and dn.lower() not in kept and not subtree_root(subtrees, dn):
+            subtrees[dn.lower()] = []
+    for object_type, phase in (('Group', 'Delete Group'), ('User', 'Delete User'), ('OU', 'Delete OU')):
+        for guid in deleted[object_type]:
+            dn = dest_records[object_type][guid]
+            root = subtree_root(subtrees, dn)
+            if root is not None:
+                subtrees[root].append([object_type, guid, dn])
+            elif dn.lower() not in subtrees:
+                yield make_step(phase, -ou_depth(dn) if object_type == 'OU' else 0, object_type, guid, \
+                                samba_connector.plan_delete(object_type, guid))
+    for guid in deleted['OU']:
+        dn = dest_records['OU'][guid]
+        if dn.lower() in subtrees:
+            yield make_step('Delete OU', -ou_depth(dn), 'OU', guid, \
+                            samba_connector.plan_delete('OU', guid, subtree=subtrees[dn.lower()]))
+
+
+## Планировщики параллельного чтения сервера источника и целевого сервера (см. extract.Extract_Scheduler):
+#  на каждом сервере одновременно выполняется до EXTRACT_WORKERS поисков (OU x класс объектов).
+#  При EXTRACT_WORKERS не больше 1 поиски выполняются последовательно на самих подключениях.
+#  Очередь записей каждого поиска по умолчанию ограничена размером страницы (EXTRACT_QUEUE_SIZE)
+def open_readers(json_config, *connectors):
+    workers = json_config.get('EXTRACT_WORKERS', 1)
+    if workers <= 1:
+        return list(connectors)
+    queue_size = json_config.get('EXTRACT_QUEUE_SIZE', json_config.get('LDAP_PAGE_SIZE', 1000))
+    return [Extract_Scheduler(connector, workers, queue_size) for connector in connectors]
+
+
+## Закрытие планировщиков чтения
+def close_readers(readers):
+    for reader in readers:
+        if isinstance(reader, Extract_Scheduler):
+            reader.close()
+
+
+## Функция возвращающая DN (в нижнем регистре) удаляемого поддерева, в котором находится запись, или None
+def subtree_root(subtrees: dict, dn: str):
+    rdns = parse_dn(dn)
+    for index in range(1, len(rdns)):
+        container = format_dn(rdns[index:]).lower()
+        if container in subtrees:
+            return container
+    return None
+
+
+## Генератор шагов плана изменений: чтение сервера источника, сравнение с индексом целевого сервера и планирование
+#  добавления, перемещения, переименования, обновления атрибутов, членства в группах и удаления записей.
+#  Шаги возвращаются по фазам в порядке применения (для объектов без изменений - None). Записи сервера источника
+#  читаются в отдельном потоке через очередь размером PIPELINE_QUEUE_SIZE (см. pipeline.prefetch).
+#  Поиски OU, пользователей и групп по всем OU запускаются до построения индекса целевого сервера и при EXTRACT_WORKERS
+#  больше 1 выполняются одновременно (см. open_readers). На целевой сервер при планировании ничего не записывается
+def iter_plan_steps(json_config, edir_connector, samba_connector, sync_state, fingerprints, delta):
+    readers = open_readers(json_config, edir_connector, samba_connector)
+    try:
+        yield from plan_steps(json_config, *readers, samba_connector, sync_state, fingerprints, delta)
+    finally:
+        close_readers(readers)
+
+
+## Генератор шагов плана изменений (см. iter_plan_steps). source_reader и dest_reader - подключения или планировщики чтения
+def plan_steps(json_config, source_reader, dest_reader, samba_connector, sync_state, fingerprints, delta):
+## Поиски записей сервера источника: запускаются сразу, результаты читаются по фазам планирования
+    mappings = compile_mappings(json_config, samba_connector)
+    sources = start_source_searches(json_config, source_reader, mappings, json_config['MIGRATION_LIST_OU'], sync_state, delta)
+
+## Индекс записей целевого сервера и записи целевого сервера в мигрируемых OU
+    dest_records = prepare_dest_index(json_config, samba_connector, dest_reader)
+
+    yield from plan_ou_steps(json_config, sources['OU'], samba_connector, fingerprints, mappings['OU'])
+    # Пользователи на целевом сервере после применения плана: существующие и мигрируемые
+    dest_users = set(dn.lower() for dn in dest_records['User'].values())
+    yield from plan_user_steps(json_config, sources['User'], samba_connector, fingerprints, mappings['User'], dest_users)
+    yield from plan_group_steps(json_config, sources['Group'], samba_connector, fingerprints, mappings['Group'], dest_users)
+    yield from plan_delete_steps(json_config, source_reader, samba_connector, sync_state, mappings, dest_records, delta)
+
+
+## Запуск поисков записей сервера источника по всем OU из list_ou для типов объектов object_types.
+#  Возвращает словарь {тип объекта: итератор записей (DN, атрибуты)}. Если задан shard (номер, количество шардов),
+#  возвращаются только записи, GUID которых относится к шарду (см. guid_shard)
+def start_source_searches(json_config, source_reader, mappings, list_ou, sync_state, delta, \
+                          object_types=('OU', 'User', 'Group'), shard=None):
+    # Размер страницы для постраничного поиска
+    page_size = json_config.get('LDAP_PAGE_SIZE', 1000)
+    sources = {}
+    for object_type, filter_key in OBJECT_FILTERS:
+        if object_type not in object_types:
+            continue
+        # Атрибут сервера источника, содержащий GUID объектов
+        guid_attribute = mappings[object_type].guid_attribute
+        records = iter_source_records(source_reader, list_ou, json_config['MIGRATION_SEARCH_BASE'], \
+                                      json_config[filter_key], mappings[object_type].source_attributes, page_size, \
+                                          sync_state, object_type, guid_attribute, delta)
+        if shard is not None:
+            records = ((dn, attributes) for dn, attributes in records \
+                       if guid_shard(normalize_attribute(attributes.get(guid_attribute, '')), shard[1]) == shard[0])
+        sources[object_type] = records
+    return sources
+
+
+## Структура OU
+#  Записи сервера источника читаются постранично и сразу преобразуются, объекты ldap3 в памяти не накапливаются.
+#  Уровень шага плана - уровень вложенности OU, OU создаются от родительских к дочерним
+def plan_ou_steps(json_config, records, samba_connector, fingerprints, mapping):
+    logging.info(f"************* Планирование OU {datetime.datetime.now()} ************************")
+    metrics.begin_phase('Plan', 'OU')
+    for _, _, new_ou, ou_mapped_attributes in transform_records(samba_connector, mapping, \
+                                                                prefetch(records, json_config.get('PIPELINE_QUEUE_SIZE', 1000)), \
+                                                                    json_config.get('LDAP_PAGE_SIZE', 1000)):
+        operations, fingerprint = plan_record_changes(samba_connector, fingerprints, 'OU', new_ou, ou_mapped_attributes)
+        yield make_step('OU', ou_depth(new_ou), 'OU', ou_mapped_attributes['novellGUID'], operations, fingerprint)
+
+
+## Пользователи. DN мигрируемых пользователей (в нижнем регистре) добавляются в dest_users
+def plan_user_steps(json_config, records, samba_connector, fingerprints, mapping, dest_users: set):
+    logging.info(f"************* Планирование пользователей {datetime.datetime.now()} *************")
+    metrics.begin_phase('Plan', 'User')
+    for _, _, new_user, user_mapped_attributes in transform_records(samba_connector, mapping, \
+                                                                    prefetch(records, json_config.get('PIPELINE_QUEUE_SIZE', 1000)), \
+                                                                        json_config.get('LDAP_PAGE_SIZE', 1000)):
+        dest_users.add(new_user.lower())
+        operations, fingerprint = plan_record_changes(samba_connector, fingerprints, 'User', new_user, user_mapped_attributes, \
+                                                      set_default_password=True, \
+                                                        disable_user=json_config['DISABLE_USER_AFTER_CREATION'])
+        yield make_step('User', 0, 'User', user_mapped_attributes['novellGUID'], operations, fingerprint)
+
+
+## Группы и членство пользователей в группах. В группы добавляются только пользователи из dest_users
+#  (пользователи целевого сервера после применения плана)
+def plan_group_steps(json_config, records, samba_connector, fingerprints, mapping, dest_users: set):
+    logging.info(f"************* Планирование групп {datetime.datetime.now()} *********************")
+    metrics.begin_phase('Plan', 'Group')
+    # Переименование группы в формат CN_GroupName и маппинг атрибутов группы (без атрибута member)
+    for _, group, new_group_dn, group_mapped_attributes in transform_records(samba_connector, mapping, \
+                                                                             prefetch(records, json_config.get('PIPELINE_QUEUE_SIZE', 1000)), \
+                                                                                 json_config.get('LDAP_PAGE_SIZE', 1000)):
+        operations, fingerprint = plan_record_changes(samba_connector, fingerprints, 'Group', new_group_dn, group_mapped_attributes)
+        # Подготовка списка членов для добавления в группу
+        source_group_members = set(samba_connector.convert_dn(group_member).lower() for group_member in group.get('member', []))
+        # Находим только тех пользователей, которые есть целевом сервере
+        common_users = source_group_members & dest_users
+        # Вывод информации, каких пользователей нет
+        not_on_dest_server = source_group_members.difference(common_users)
+        if not_on_dest_server:
+            logging.warning(f'Для группы {new_group_dn} нет пользователей на целевом сервере: {not_on_dest_server} ')
+        membership = samba_connector.plan_membership(group_mapped_attributes['novellGUID'], new_group_dn, common_users)
+        if membership:
+            operations.append(membership)
+        yield make_step('Group', 0, 'Group', group_mapped_attributes['novellGUID'], operations, fingerprint)
+
+
+## Удаление записей
+#  Удаляемые записи определяются для каждого типа объектов по GUID, прочитанным с сервера источника (sync_state),
+#  затем планируется их удаление (см. plan_deletions)
+def plan_delete_steps(json_config, source_reader, samba_connector, sync_state, mappings, dest_records, delta):
+    page_size = json_config.get('LDAP_PAGE_SIZE', 1000)
+    list_ou = json_config['MIGRATION_LIST_OU']
+    source_search_base = json_config['MIGRATION_SEARCH_BASE']
+    deleted = {}
+    for object_type, filter_key in (('Group', 'LDAP_FILER_GROUP'), ('User', 'LDAP_FILTER_USER'), ('OU', 'LDAP_FILER_OU')):
+        metrics.begin_phase('Plan Delete', object_type)
+        deleted[object_type] = find_deleted_records(source_reader, list_ou, source_search_base, json_config[filter_key], page_size, \
+                                                    sync_state, object_type, mappings[object_type].guid_attribute, \
+                                                        dest_records[object_type], delta)
+    tree_delete = bool(deleted['OU']) and json_config.get('TREE_DELETE', True) and \
+        samba_connector.supports_control(TREE_DELETE_CONTROL)
+    yield from plan_deletions(samba_connector, dest_records, deleted, tree_delete)
+
+## Построение плана изменений целевого сервера целиком (см. iter_plan_steps)
+def build_plan(json_config, edir_connector, samba_connector, sync_state, fingerprints, delta):
+    return Change_Plan([step for step in iter_plan_steps(json_config, edir_connector, samba_connector, \
+                                                          sync_state, fingerprints, delta) if step])
+
+
+## Построение плана изменений процессами-обработчиками шардов (SHARD_PROCESSES больше 1). Область миграции делится
+#  на шарды по OU из MIGRATION_LIST_OU (SHARD_BY: OU) или по диапазонам хэша GUID (SHARD_BY: GUID), каждый процесс
+#  использует собственные подключения к серверам. Зависимости между шардами обрабатывает координатор:
+#  - OU и пользователи всех шардов планируются до групп, и в группы добавляются пользователи из любого шарда;
+#  - OU всех шардов применяются по уровням вложенности (родительские OU раньше дочерних, см. Change_Plan.stages);
+#  - удаляемые записи определяются координатором по GUID, прочитанным всеми шардами.
+#  Состояние синхронизации, отпечатки, журнал и метрики шардов объединяются координатором
+def build_sharded_plan(json_config, edir_connector, samba_connector, sync_state, fingerprints, delta, pool):
+    processes = pool.processes
+    list_ou = json_config['MIGRATION_LIST_OU']
+    if json_config.get('SHARD_BY', 'OU') == 'GUID':
+        # Каждый шард читает все OU и планирует объекты своего диапазона хэша GUID
+        shards = [{'list_ou': list_ou, 'guid_shard': (index, processes)} for index in range(processes)]
+    else:
+        shards = [{'list_ou': [ou], 'guid_shard': None} for ou in list_ou]
+    logging.info(f"************* Планирование по шардам {datetime.datetime.now()}: процессов {processes}, шардов {len(shards)}")
+    # Индекс целевого сервера построен координатором до запуска процессов-обработчиков и унаследован ими (см. open_shard_pool)
+    readers = open_readers(json_config, edir_connector, samba_connector)
+    try:
+        dest_records = dest_index_records(json_config, samba_connector)
+        metrics.begin_phase('Plan Shards', 'OU, User')
+        results = pool.map([dict(shard, stage='records') for shard in shards])
+        # Пользователи на целевом сервере после применения плана: существующие и мигрируемые всеми шардами
+        dest_users = set(dn.lower() for dn in dest_records['User'].values())
+        for result in results:
+            dest_users |= result['users']
+        metrics.begin_phase('Plan Shards', 'Group')
+        results += pool.map([dict(shard, stage='groups', users=dest_users) for shard in shards])
+        steps = []
+        for result in results:
+            steps += result['steps']
+            sync_state.merge(result['sync_state'])
+            for guid, fingerprint in result['fingerprints'].items():
+                fingerprints.update(guid, fingerprint)
+        steps += [step for step in plan_delete_steps(json_config, readers[0], samba_connector, sync_state, \
+                                                       compile_mappings(json_config, samba_connector), dest_records, delta) if step]
+    finally:
+        pool.close()
+        close_readers(readers)
+    return Change_Plan(steps)
+
+
+# Состояние процесса-обработчика шарда (см. init_shard_worker)
+_shard_worker = {}
+
+
+## Пул процессов-обработчиков шардированного планирования (SHARD_PROCESSES больше 1) или None, если запуск не строит
+#  план по шардам. Создается при старте, до потоков журналирования и выгрузки метрик (см. shard.Shard_Pool).
+#  Перед созданием процессов координатор подключается к целевому серверу и строит индекс (один поиск на тип объектов
+#  в одном потоке): процессы-обработчики наследуют индекс при копировании процесса и не читают целевой сервер повторно.
+#  Возвращает подключение к целевому серверу с индексом (None без шардов) и пул
+def open_shard_pool(args, json_config):
+    if json_config.get('SHARD_PROCESSES', 1) <= 1 or args.resume or args.apply or (args.pipeline and not args.plan_only) \
+            or args.export_snapshot or args.export_ldif or args.verify:
+        return None, None
+    metrics.begin_phase('Connect')
+    samba_connector = connect(json_config, 'WRITE')
+    prepare_dest_index(json_config, samba_connector)
+    _shard_worker['dest_index'] = samba_connector.dest_index
+    sync_state_file = json_config.get('SYNC_STATE_FILE', 'sync_state.json')
+    return samba_connector, Shard_Pool(json_config['SHARD_PROCESSES'], plan_shard, init_shard_worker, \
+                                       (json_config, sync_state_file, json_config.get('FINGERPRINT_FILE', 'fingerprints.json'), \
+                                        args.delta and os.path.exists(sync_state_file)))
+
+
+## Инициализация процесса-обработчика шарда: собственные подключения к серверу источнику и целевому серверу,
+#  индекс целевого сервера (унаследован от координатора, см. open_shard_pool), состояние синхронизации и отпечатки
+#  предыдущего запуска
+def init_shard_worker(json_config, sync_state_path, fingerprint_path, delta):
+    metrics.begin_phase('Connect')
+    samba_connector = connect(json_config, 'WRITE')
+    samba_connector.dest_index = _shard_worker['dest_index']
+    _shard_worker.update(json_config=json_config, delta=delta, samba_connector=samba_connector, \
+                         mappings=compile_mappings(json_config, samba_connector), \
+                         edir_connector=connect(json_config, 'READ'), \
+                         sync_state=Sync_State(sync_state_path), fingerprints=Fingerprint_Store(fingerprint_path))
+
+
+## Планирование шарда в процессе-обработчике: на этапе records - OU и пользователи (возвращаются DN мигрируемых
+#  пользователей), на этапе groups - группы и членство в группах (users - пользователи целевого сервера всех шардов).
+#  Возвращает шаги плана, состояние синхронизации и отпечатки, сохраненные при планировании
+def plan_shard(shard: dict):
+    json_config, samba_connector = _shard_worker['json_config'], _shard_worker['samba_connector']
+    sync_state, fingerprints = _shard_worker['sync_state'], _shard_worker['fingerprints']
+    mappings = _shard_worker['mappings']
+    readers = open_readers(json_config, _shard_worker['edir_connector'])
+    users = set()
+    try:
+        if shard['stage'] == 'records':
+            sources = start_source_searches(json_config, readers[0], mappings, shard['list_ou'], sync_state, _shard_worker['delta'], \
+                                            ('OU', 'User'), shard['guid_shard'])
+            steps = list(plan_ou_steps(json_config, sources['OU'], samba_connector, fingerprints, mappings['OU'])) + \
+                list(plan_user_steps(json_config, sources['User'], samba_connector, fingerprints, mappings['User'], users))
+        else:
+            sources = start_source_searches(json_config, readers[0], mappings, shard['list_ou'], sync_state, _shard_worker['delta'], \
+                                            ('Group',), shard['guid_shard'])
+            steps = list(plan_group_steps(json_config, sources['Group'], samba_connector, fingerprints, mappings['Group'], \
+                                          shard['users']))
+    finally:
+        close_readers(readers)
+    return {'steps': [step for step in steps if step], 'users': users, \
+            'sync_state': sync_state.take_current(), 'fingerprints': fingerprints.take_updates()}
+
+
+## Выгрузка снимков каталогов в директорию directory: source.snapshot - преобразованные записи сервера источника
+#  (DN целевого сервера, атрибуты после маппинга), dest.snapshot - записи целевого сервера в мигрируемых OU.
+#  Атрибуты в снимках ограничены атрибутами целевого сервера, которые сравниваются при синхронизации
+def export_snapshots(json_config, edir_connector, samba_connector, directory):
+    readers = open_readers(json_config, edir_connector, samba_connector)
+    try:
+        write_snapshots(json_config, *readers, samba_connector, directory)
+    finally:
+        close_readers(readers)
+
+
+## Выгрузка снимков каталогов (см. export_snapshots). source_reader и dest_reader - подключения или планировщики чтения
+def write_snapshots(json_config, source_reader, dest_reader, samba_connector, directory):
+    page_size = json_config.get('LDAP_PAGE_SIZE', 1000)
+    mappings = compile_mappings(json_config, samba_connector)
+    # Поиски сервера источника по всем OU и типам объектов запускаются до построения индекса целевого сервера
+    source_searches = start_source_searches(json_config, source_reader, mappings, json_config['MIGRATION_LIST_OU'], None, False)
+    dest_records = prepare_dest_index(json_config, samba_connector, dest_reader)
+
+    def source_records():
+        for object_type, entries in source_searches.items():
+            attribute_list = dest_attribute_list(json_config, object_type)
+            for _, _, new_dn, mapped_attributes in transform_records(samba_connector, mappings[object_type], entries, page_size):
+                yield {'guid': mapped_attributes['novellGUID'], 'type': object_type, 'dn': new_dn, \
+                       'attributes': {key: mapped_attributes[key] for key in attribute_list if key in mapped_attributes}}
+
+    def dest_snapshot_records():
+        for object_type, records in dest_records.items():
+            attribute_list = dest_attribute_list(json_config, object_type)
+            for guid in records:
+                for record in samba_connector.dest_index[object_type][guid]:
+                    yield {'guid': guid, 'type': object_type, 'dn': record.dn, \
+                           'attributes': {key: record[key] for key in attribute_list if key in record}}
+
+    os.makedirs(directory, exist_ok=True)
+    count = write_snapshot(os.path.join(directory, 'source.snapshot'), source_records())
+    logging.info(f'Снимок сервера источника сохранен в {directory}, записей: {count}')
+    count = write_snapshot(os.path.join(directory, 'dest.snapshot'), dest_snapshot_records())
+    logging.info(f'Снимок целевого сервера сохранен в {directory}, записей: {count}')
+
+
+## Выгрузка записей сервера источника в файлы LDIF для начальной загрузки на контроллере домена командой
+#  ldbadd -H /var/lib/samba/private/sam.ldb (см. ldif.py). Записи, которые уже есть на целевом сервере (по novellGUID),
+#  не выгружаются, их синхронизирует обычный запуск
+def export_ldif(json_config, edir_connector, samba_connector, directory):
+    readers = open_readers(json_config, edir_connector, samba_connector)
+    try:
+        write_ldif(json_config, *readers, samba_connector, directory)
+    finally:
+        close_readers(readers)
+
+
+## Выгрузка файлов LDIF (см. export_ldif). Записи преобразуются так же, как при планировании (DN целевого сервера,
+#  маппинг атрибутов) и записываются по мере чтения частями по LDIF_CHUNK_SIZE записей. Порядок файлов (по имени) - порядок
+#  загрузки: OU по уровням вложенности от родительских к дочерним, пользователи с паролем и параметрами учетной записи,
+#  группы с членами (пользователи целевого сервера и выгруженные пользователи)
+def write_ldif(json_config, source_reader, dest_reader, samba_connector, directory):
+    page_size = json_config.get('LDAP_PAGE_SIZE', 1000)
+    chunk_size = json_config.get('LDIF_CHUNK_SIZE', 10000)
+    mappings = compile_mappings(json_config, samba_connector)
+    # Поиски сервера источника по всем OU и типам объектов запускаются до построения индекса целевого сервера
+    source_searches = start_source_searches(json_config, source_reader, mappings, json_config['MIGRATION_LIST_OU'], None, False)
+    dest_records = prepare_dest_index(json_config, samba_connector, dest_reader)
+    account = account_attributes(json_config['DEFAULT_USER_MIGRATION_PASSWORD'], json_config['DISABLE_USER_AFTER_CREATION'])
+    dest_users = set(dn.lower() for dn in dest_records['User'].values())
+    os.makedirs(directory, exist_ok=True)
+    writers, skipped = {}, {}
+    try:
+        for order, (object_type, entries) in enumerate(source_searches.items(), 1):
+            metrics.begin_phase('Export', object_type)
+            skipped[object_type] = 0
+            for _, attributes, new_dn, mapped_attributes in transform_records(samba_connector, mappings[object_type], entries, page_size):
+                if mapped_attributes['novellGUID'] in samba_connector.dest_index.get(object_type, {}):
+                    skipped[object_type] += 1
+                    continue
+                # Файлы OU разделяются по уровням вложенности
+                prefix = f'{order}-{object_type.lower()}' + (f'-{ou_depth(new_dn):02d}' if object_type == 'OU' else '')
+                if prefix not in writers:
+                    writers[prefix] = LDIF_Writer(directory, prefix, chunk_size)
+                attributes_ldif = dict(mapped_attributes)
+                if object_type == 'User':
+                    dest_users.add(new_dn.lower())
+                    attributes_ldif.update(account)
+                elif object_type == 'Group':
+                    members = (samba_connector.convert_dn(group_member) for group_member in attributes.get('member', []))
+                    attributes_ldif['member'] = [member for member in members if member.lower() in dest_users]
+                writers[prefix].write(new_dn, OBJECT_CLASSES[object_type], attributes_ldif)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    for prefix, writer in sorted(writers.items()):
+        logging.info(f'LDIF {prefix}: записей: {writer.count}, файлов: {len(writer.files)}')
+    logging.info(f'Файлы LDIF сохранены в {directory}, записей: {sum(writer.count for writer in writers.values())}, ' \
+                 f'пропущено (уже есть на целевом сервере): {skipped}')
+
+
+## Проверка соответствия целевого сервера серверу источнику по деревьям хэшей (см. verify.py): для каждого сервера
+#  выполняется один поиск GUID и атрибутов из MappingAttr по каждому типу объектов, записи (DN целевого сервера, атрибуты
+#  после маппинга) распределяются по корзинам (тип объектов, поддерево OU из MIGRATION_LIST_OU, префикс GUID).
+#  Деревья сравниваются сверху вниз, записи различающихся корзин перечитываются по DN. Возвращает список различий
+def verify_directories(json_config, edir_connector, samba_connector):
+    readers = open_readers(json_config, edir_connector, samba_connector)
+    try:
+        source_tree, dest_tree, users = build_hash_trees(json_config, *readers, samba_connector)
+    finally:
+        close_readers(readers)
+    metrics.begin_phase('Verify', 'Compare')
+    differences, stats = diff_trees(source_tree, dest_tree)
+    logging.info(f'Деревья хэшей сравнены: записей сервера источника: {source_tree.count}, ' \
+                 f'записей целевого сервера: {dest_tree.count}, {stats}')
+    # Записи, перемещенные между поддеревьями, находятся в разных корзинах серверов: различия объединяются по GUID
+    changed = {}
+    for (object_type, _, _), guid, source_leaf, dest_leaf in differences:
+        change = changed.setdefault(guid, [object_type, None, None])
+        change[1] = source_leaf or change[1]
+        change[2] = dest_leaf or change[2]
+    mappings = compile_mappings(json_config, samba_connector)
+    differences = []
+    for guid, (object_type, source_leaf, dest_leaf) in changed.items():
+        difference = read_difference(json_config, edir_connector, samba_connector, mappings[object_type], guid, \
+                                     source_leaf[1] if source_leaf else None, dest_leaf[1] if dest_leaf else None, users)
+        if difference is not None:
+            differences.append(difference)
+    return differences
+
+
+## Значение атрибута member группы для сравнения (см. normalize_attribute): DN членов группы целевого сервера
+#  нормализуются и приводятся к нижнему регистру. Если задано users, члены группы ограничиваются этими пользователями,
+#  как при планировании (в группу добавляются только пользователи целевого сервера)
+def member_attribute(members, users=None):
+    members = set(normalize_dn(member).lower() for member in members)
+    return normalize_attribute(list(members if users is None else members & users))
+
+## Построение деревьев хэшей сервера источника и целевого сервера (см. verify_directories). Лист группы включает
+#  множество ее членов (см. group_members), поэтому пользователи читаются раньше групп.
+#  source_reader и dest_reader - подключения или планировщики чтения. Возвращает деревья и множество DN пользователей
+#  мигрируемых OU (на целевом сервере и на сервере источнике)
+def build_hash_trees(json_config, source_reader, dest_reader, samba_connector):
+    page_size = json_config.get('LDAP_PAGE_SIZE', 1000)
+    list_ou = json_config['MIGRATION_LIST_OU']
+    mappings = compile_mappings(json_config, samba_connector)
+    source_searches = start_source_searches(json_config, source_reader, mappings, list_ou, None, False)
+    dest_search_base = samba_connector.convert_dn(json_config['MIGRATION_SEARCH_BASE'])
+    dest_searches = {}
+    for object_type, filter_key in OBJECT_FILTERS:
+        attribute_list = dest_attribute_list(json_config, object_type) + (['member'] if object_type == 'Group' else [])
+        query = samba_connector.dest_index_query(json_config[filter_key], attribute_list)
+        dest_searches[object_type] = dest_reader.iter_records(page_size=page_size, **query)
+    subtrees = [f'{ou + "," if ou else ""}{dest_search_base}' for ou in list_ou]
+    prefix_length = json_config.get('VERIFY_PREFIX_LENGTH', 2)
+    source_tree, dest_tree = Hash_Tree(subtrees, prefix_length), Hash_Tree(subtrees, prefix_length)
+    # Пользователи на целевом сервере после синхронизации: пользователи мигрируемых OU обоих серверов
+    users = set()
+    for object_type, _ in OBJECT_FILTERS:
+        metrics.begin_phase('Verify', object_type)
+        attribute_list = dest_attribute_list(json_config, object_type)
+        for dn, attributes, new_dn, mapped_attributes in transform_records(samba_connector, mappings[object_type], \
+                                                                           source_searches[object_type], page_size):
+            leaf_attributes = {key: mapped_attributes[key] for key in attribute_list if key in mapped_attributes}
+            if object_type == 'Group':
+                leaf_attributes['member'] = member_attribute(map(samba_connector.convert_dn, attributes.get('member', [])), users)
+            if source_tree.add(object_type, mapped_attributes['novellGUID'], new_dn, leaf_attributes, dn) and object_type == 'User':
+                users.add(normalize_dn(new_dn).lower())
+        # Атрибуты записей целевого сервера нормализуются так же, как в индексе (см. record.Record), записи не сохраняются.
+        # Члены больших групп (member;range=N-M) дочитываются после завершения постраничного поиска: при EXTRACT_WORKERS = 1
+        # поиск выполняется через samba_connector, и поиски get_group_members во время чтения страниц заменили бы его результат
+        partial_groups = []
+        for dn, attributes in dest_searches[object_type]:
+            record = Record(normalize_attribute(attributes['novellGUID']), dn, attributes, mappings[object_type].dn_attributes)
+            leaf_attributes = {key: record[key] for key in attribute_list if key in record}
+            if object_type == 'Group':
+                if samba_connector.partial_members(attributes):
+                    partial_groups.append((record.guid, dn, leaf_attributes))
+                    continue
+                leaf_attributes['member'] = member_attribute(samba_connector.group_members(dn, attributes))
+            if dest_tree.add(object_type, record.guid, dn, leaf_attributes) and object_type == 'User':
+                users.add(normalize_dn(dn).lower())
+        for guid, dn, leaf_attributes in partial_groups:
+            leaf_attributes['member'] = member_attribute(samba_connector.get_group_members(dn))
+            dest_tree.add(object_type, guid, dn, leaf_attributes)
+    return source_tree, dest_tree, users
+
+
+## Чтение записей с различиями с сервера источника (source_dn - DN сервера источника) и целевого сервера по DN.
+#  Возвращает различие: {change (add - записи нет на целевом сервере, delete - записи нет на сервере источнике,
+#  change - записи отличаются), guid, type, source, dest (DN целевого сервера и атрибуты записи или None),
+#  attributes (различающиеся атрибуты)} или None, если записи нет на обоих серверах. Члены групп сравниваются
+#  как в деревьях хэшей (см. build_hash_trees, users - пользователи мигрируемых OU)
+def read_difference(json_config, edir_connector, samba_connector, mapping, guid, source_dn, dest_dn, users=frozenset()):
+    object_type = mapping.object_type
+    attribute_list = dest_attribute_list(json_config, object_type)
+    source = dest = None
+    if source_dn:
+        source_attributes = edir_connector.read_record(source_dn, mapping.source_attributes)
+        if source_attributes is not None:
+            new_dn, mapped_attributes = transform_record(samba_connector, mapping, source_dn, source_attributes)
+            source = {'dn': new_dn, 'attributes': {key: mapped_attributes[key] for key in attribute_list if key in mapped_attributes}}
+            if object_type == 'Group':
+                source['attributes']['member'] = member_attribute(map(samba_connector.convert_dn, source_attributes.get('member', [])), \
+                                                                  users)
+    if dest_dn:
+        dest_attributes = samba_connector.read_record(dest_dn, attribute_list)
+        if dest_attributes is not None:
+            record = Record(guid, dest_dn, dest_attributes, mapping.dn_attributes)
+            dest = {'dn': dest_dn, 'attributes': {key: record[key] for key in attribute_list if key in record and record[key] != '[]'}}
+            if object_type == 'Group':
+                dest['attributes']['member'] = member_attribute(samba_connector.get_group_members(dest_dn))
+    # Группа без членов сравнивается без атрибута member, как пустые атрибуты
+    for record in (source, dest):
+        if record is not None and record['attributes'].get('member') == '[]':
+            del record['attributes']['member']
+    if source is None and dest is None:
+        return None
+    if source is None or dest is None:
+        change = 'add' if dest is None else 'delete'
+        attributes = sorted((source or dest or {'attributes': {}})['attributes'])
+    else:
+        change = 'change'
+        attributes = sorted(key for key in set(source['attributes']) | set(dest['attributes']) \
+                            if source['attributes'].get(key, '[]') != dest['attributes'].get(key, '[]'))
+        if normalize_dn(source['dn']).lower() != normalize_dn(dest['dn']).lower():
+            attributes.insert(0, 'dn')
+    return {'change': change, 'guid': guid, 'type': object_type, 'source': source, 'dest': dest, 'attributes': attributes}
 
 
 def __main__():
 
+## Параметры запуска
+    parser = argparse.ArgumentParser(description='Миграция объектов LDAP (eDirectory -> Samba DC)')
+    parser.add_argument('--delta', action='store_true', \
+                        help='инкрементальная синхронизация: только объекты, измененные после предыдущего запуска')
+    parser.add_argument('--plan-only', action='store_true', \
+                        help='только построить план изменений и сохранить его в файл, не применяя')
+    parser.add_argument('--apply', metavar='PLAN_FILE', \
+                        help='применить ранее сохраненный план изменений')
+    parser.add_argument('--resume', action='store_true', \
+                        help='продолжить применение плана (PLAN_FILE или --apply) после сбоя, пропуская шаги, выполненные по журналу')
+    parser.add_argument('--pipeline', action='store_true', \
+                        help='применять изменения по мере планирования, без сохранения файла плана')
+    parser.add_argument('--export-snapshot', metavar='DIR', \
+                        help='выгрузить снимки сервера источника и целевого сервера в директорию')
+    parser.add_argument('--export-ldif', metavar='DIR', \
+                        help='выгрузить записи сервера источника в файлы LDIF для начальной загрузки командой ldbadd')
+    parser.add_argument('--verify', action='store_true', \
+                        help='проверить соответствие целевого сервера серверу источнику по деревьям хэшей, различия выводятся в stdout (JSON Lines)')
+    parser.add_argument('--diff-snapshots', nargs=2, metavar=('OLD', 'NEW'), \
+                        help='сравнить два снимка без подключения к серверам, различия выводятся в stdout (JSON Lines)')
+    args = parser.parse_args()
+
+## Сравнение снимков каталогов: выполняется локально, без подключения к серверам
+    if args.diff_snapshots:
+        counts = {'add': 0, 'delete': 0, 'change': 0}
+        for change, old_record, new_record in diff_snapshots(*args.diff_snapshots):
+            counts[change] += 1
+            print(json.dumps({'change': change, 'old': old_record, 'new': new_record}, ensure_ascii=False))
+        logging.info(f'Сравнение снимков {args.diff_snapshots[0]} и {args.diff_snapshots[1]}: {counts}')
+        return
+
 ## Загрузка конфигурации
     with open('config.json', 'r', encoding='utf-8') as file:
         json_config = json.load(file)
         pass
 
-## 
-    attribute_mapping_ou = json_config['MappingAttr']['OU']
-    attribute_mapping_user = json_config['MappingAttr']['User']
-    attribute_mapping_group = json_config['MappingAttr']['Group']
-##
-    # Список атрибутов источника
-    source_attributes_ou = attribute_mapping_ou.values()
-    source_attributes_group = attribute_mapping_group.values()
-    source_attributes_user = attribute_mapping_user.values()
-    # Список атрибутов целевого сервера
-    dest_attributes_ou = attribute_mapping_ou.keys()
-    dest_attributes_user = attribute_mapping_user.keys()
-    dest_attributes_group = list(attribute_mapping_group.keys())
-
-
-## Подключение к LDAP серверам
-    edir_connector = LDAP_Connector(fqdn=json_config['READ_DOMAIN_DC_FQDN'], \
-                                    ldap_manager=json_config['READ_DOMAIN_ADMIN_USERNAME'], \
-                                        ldap_password=json_config['READ_ADMIN_PASSWORD'], \
-                                            ldap_type=LDAP_Type.Edirectory, \
-                                                source_root_dn=json_config['READ_ROOT_DN'], \
-                                                    dest_root_dn=json_config['WRITE_ROOT_DN'])
-    samba_connector = LDAP_Connector(fqdn=json_config['WRITE_DOMAIN_DC_FQDN'], \
-                                        ldap_manager=json_config['WRITE_DOMAIN_ADMIN_USERNAME'], \
-                                        ldap_password=json_config['WRITE_ADMIN_PASSWORD'], \
-                                            ldap_type=LDAP_Type.SambaDC, \
-                                                source_root_dn=json_config['READ_ROOT_DN'], \
-                                                    dest_root_dn=json_config['WRITE_ROOT_DN'])
-
-## Список OU для переноса
-    list_ou = json_config['MIGRATION_LIST_OU']
-## Search base сервера источника и целевого сервера
-    source_search_base=json_config['MIGRATION_SEARCH_BASE']
-    dest_search_base=samba_connector.convert_dn(source_search_base)
-
-## Поиск объектов, учитывая фильтрацию по верхнеуровневым OU 
-#  То есть если задан MIGRATION_SEARCH_BASE: "o=gazprom", а нужно копировать только ou=HQ,o=gazprom и ou=BrunchOffice01,o=gazprom
-#  то дополнительно это нужно задать в MIGRATION_LIST_OU "MIGRATION_LIST_OU": ["ou=HQ", "ou=BrunchOffice01"]  
-    source_ou_list, source_groups_list, source_user_list = [], [], []
-    for ou in list_ou:
-        source_search_base_ou = f'{ou + "," if ou else ""}{source_search_base}'
-        source_ou_list.extend(edir_connector.search_records(filter=json_config['LDAP_FILER_OU'], \
-                                                          search_base=source_search_base_ou, \
-                                                            attribute_list=list(source_attributes_ou)))
-        source_groups_list.extend(edir_connector.search_records(filter=json_config['LDAP_FILER_GROUP'], \
-                                                              search_base=source_search_base_ou, \
-                                                                attribute_list=list(source_attributes_group)))
-        source_user_list.extend(edir_connector.search_records(filter=json_config['LDAP_FILTER_USER'], \
-                                                            search_base=source_search_base_ou, \
-                                                                attribute_list=list(source_attributes_user)))
-
-## Копирование структуры OU
-    logging.info(f"************* Миграция OU {datetime.datetime.now()} ************************")
-    new_ou_dict={}
-    for ou in source_ou_list:
-        new_ou = samba_connector.convert_dn(ou.entry_dn)
-        ou_mapped_attributes = map_attributes(attribute_mapping_ou, ou)
-        new_ou_dict[new_ou] = ou_mapped_attributes
-    key_sort = sorted(new_ou_dict.keys(), key=count_ou_occurrences)
-    sorted_new_ou_dict = {i: new_ou_dict[i] for i in key_sort}
-    for new_ou, attr in sorted_new_ou_dict.items():
-        samba_connector.add_ou_record(source_new_dn=new_ou, \
-                                      source_attributes=attr, \
-                                        dest_attributes=dest_attributes_ou)
-
-## Копирование пользователей
-    logging.info(f"************* Миграция пользователей {datetime.datetime.now()} *************")
-    for user in source_user_list:
-        new_user = samba_connector.convert_dn(user.entry_dn)
-        user_mapped_attributes = map_attributes(attribute_mapping_user, user)
-        samba_connector.add_user_record(source_new_dn=new_user, \
-                                        set_default_password=True, \
-                                            disable_user=json_config['DISABLE_USER_AFTER_CREATION'],\
-                                                default_password=json_config['DEFAULT_USER_MIGRATION_PASSWORD'], \
-                                                    source_attributes=user_mapped_attributes, \
-                                                        dest_attributes=dest_attributes_user)
-
-## Подготока списка пользоватлей целевого сервера для последующего сравнения с сервером источником, добавления их в группы, и удаления 
-#  и удаления
-    dest_ou_list, dest_groups_list, dest_user_list = [], [], []
-    for ou in list_ou:
-        dest_search_base_ou = f'{ou + "," if ou else ""}{dest_search_base}'
-        dest_ou_list.extend(samba_connector.search_records(filter=json_config['LDAP_FILER_OU'], \
-                                                          search_base=dest_search_base_ou, \
-                                                            attribute_list=['novellGUID']))
-        dest_groups_list.extend(samba_connector.search_records(filter=json_config['LDAP_FILER_GROUP'], \
-                                                              search_base=dest_search_base_ou, \
-                                                                attribute_list=['novellGUID']))
-        dest_user_list.extend(samba_connector.search_records(filter=json_config['LDAP_FILTER_USER'], \
-                                                            search_base=dest_search_base_ou, \
-                                                                attribute_list=['novellGUID']))
-
-
-## Копирование групп и добавление в группу пользователей
-    logging.info(f"************* Миграция групп {datetime.datetime.now()} *********************")
-    # Удаление атрибута member из списка атрибутов на целевом сервере, так как добавление членов выполняется после создания группы
-    dest_attributes_group.remove('member')
-    # Пользователи на целевом сервере
-    set_dest_user_list = set(entry.entry_dn.lower() for entry in dest_user_list)
-
-    for group in source_groups_list:
-        # Переименование группы в формат CN_GroupName
-        new_group_dn = rename_group(samba_connector.convert_dn(group.entry_dn))
-        # Задание CN для группы в формат CN_GroupName
-        new_cn = new_group_dn.split(',')[0].split('=')[1]
-        # Маппинг атрибутов группы
-        group_mapped_attributes = map_attributes(attribute_mapping_group, group)
-        group_mapped_attributes['cn'] = new_cn
-        # Удаление атрибута member, так как добавление членов в группу обрабатывается после создания группы
-        group_mapped_attributes.pop('member', None)
-        # Создание группы
-        samba_connector.add_group_record(source_new_dn=new_group_dn, \
-                                         source_attributes=group_mapped_attributes, \
-                                            dest_attributes=dest_attributes_group)
-        # Добавление пользователей в группу, если она существует
-        if samba_connector.result['description'] == 'success':
-            # Подготовка списка членов для добавления в группу, проверка что пол
-            source_group_members = set(samba_connector.convert_dn(group_member).lower() for group_member in list(group['member']))
-            # Находим только тех пользователей, которые есть целевом сервере
-            common_users = source_group_members & set_dest_user_list
-            # Вывод информации, каких пользователей нет
-            not_on_dest_server = source_group_members.difference(common_users)
-            if not_on_dest_server:
-                logging.warning(f'Для группы {new_group_dn} нет пользователей на целевом сервере: {not_on_dest_server} ')
-            samba_connector.update_user_membership(source_group_members = common_users, \
-                                               group_dn=new_group_dn)
+    # Журнал миграции и журнал операций LDAP (ротация файлов, выборка записей об успешных операциях)
+    log_options = dict(log_file=json_config.get('LOG_FILE', 'migration.log'), \
+                       operation_log_file=json_config.get('OPERATION_LOG_FILE'), \
+                       max_bytes=json_config.get('LOG_MAX_BYTES', 100 * 1024 * 1024), \
+                       backup_count=json_config.get('LOG_BACKUP_COUNT', 5), \
+                       success_sample_rate=json_config.get('LOG_SUCCESS_SAMPLE_RATE', 1.0), \
+                       console_level=json_config.get('LOG_CONSOLE_LEVEL', 'DEBUG'))
+    # Процессы-обработчики шардов создаются копированием процесса (fork) до запуска потоков: до их создания
+    # сообщения записываются без фонового потока, затем запускается поток записи журналов
+    setup_logging(**log_options, background=False)
+    samba_connector, shard_pool = open_shard_pool(args, json_config)
+    setup_logging(**log_options)
+    # Метрики операций LDAP: JSON-сводка по завершении запуска и (если задан файл) периодическая выгрузка для Prometheus
+    metrics_file = json_config.get('METRICS_FILE', 'metrics.json')
+    prometheus_file = json_config.get('METRICS_PROMETHEUS_FILE')
+    if prometheus_file:
+        metrics.start_export(prometheus_file, json_config.get('METRICS_INTERVAL', 30))
+    try:
+        migrate(args, json_config, shard_pool, samba_connector)
+    finally:
+        if shard_pool is not None:
+            shard_pool.close()
+        metrics.end_phase()
+        metrics.stop_export()
+        metrics.write_summary(metrics_file)
+        if prometheus_file:
+            metrics.write_prometheus(prometheus_file)
 
-## Удаление записей
 
-    # Удаление групп
-    dest_groups = set(str(entry['novellGUID']) for entry in dest_groups_list)
-    source_groups = set(str(entry['GUID']) for entry in source_groups_list)
-    delete_groups = dest_groups.difference(source_groups)
-    if delete_groups:
-        logging.info(f"************* Удаление групп {datetime.datetime.now()} *********************")
-        samba_connector.delete_records(records=delete_groups)
-
-    # Удаление пользователей
-    dest_users = set(str(entry['novellGUID']) for entry in dest_user_list)
-    source_users = set(str(entry['GUID']) for entry in source_user_list)
-    delete_users = dest_users.difference(source_users)
-    if delete_users:
-        logging.info(f"************* Удаление пользователей {datetime.datetime.now()} *************")
-        samba_connector.delete_records(records=delete_users)
-
-    # Удаление OU
-    dest_ou = set(str(entry['novellGUID']) for entry in dest_ou_list)
-    source_ou = set(str(entry['GUID']) for entry in source_ou_list)
-    delete_ou = dest_ou.difference(source_ou)
-    if delete_ou:
-        logging.info(f"************* Удаление OU {datetime.datetime.now()} ************************")
-        samba_connector.delete_records(records=delete_ou)
-
-__main__()
\ No newline at end of file
+## Подключение к серверу источнику (role READ, eDirectory) или целевому серверу (role WRITE, Samba DC).
+#  Если в конфигурации задан список серверов, подключения распределяются по пулу серверов (Server_Pool_Data).
+#  При обрыве соединение открывается заново (на следующем доступном сервере пула) с повторной аутентификацией
+def connect(json_config, role: str):
+    ldap_type = LDAP_Type.Edirectory if role == 'READ' else LDAP_Type.SambaDC
+    fqdn = json_config[role + '_DOMAIN_DC_FQDN']
+    server_data = None
+    restart_tries = json_config.get('LDAP_RESTART_TRIES', 10)
+    if not isinstance(fqdn, str):
+        # Чтение распределяется по репликам, запись по умолчанию выполняется на первый доступный контроллер домена
+        pool_strategy = json_config.get(role + '_POOL_STRATEGY', 'ROUND_ROBIN' if role == 'READ' else 'FIRST')
+        server_data = Server_Pool_Data(fqdn, ldap_type, pool_strategy, json_config.get('LDAP_POOL_EXHAUST', 60), restart_tries)
+    return LDAP_Connector(fqdn=fqdn, \
+                          ldap_manager=json_config[role + '_DOMAIN_ADMIN_USERNAME'], \
+                              ldap_password=json_config[role + '_ADMIN_PASSWORD'], \
+                                  ldap_type=ldap_type, \
+                                      source_root_dn=json_config['READ_ROOT_DN'], \
+                                          dest_root_dn=json_config['WRITE_ROOT_DN'], \
+                                              member_chunk_size=json_config.get('MEMBER_CHUNK_SIZE', 1000), \
+                                                  server_data=server_data, \
+                                                      client_strategy=RESTARTABLE if restart_tries else SYNC, \
+                                                          restart_tries=restart_tries, \
+                                                              restart_sleep=json_config.get('LDAP_RESTART_SLEEP', 5))
+
+
+## Пул записи на целевой сервер: WRITE_WORKERS соединений, количество одновременных операций на каждом контроллере домена
+#  адаптируется к его нагрузке (см. throttle.Write_Throttle), если не отключено WRITE_ADAPTIVE
+def open_write_pool(json_config, connector):
+    workers = json_config.get('WRITE_WORKERS', 1)
+    throttle = None
+    if json_config.get('WRITE_ADAPTIVE', True):
+        throttle = Write_Throttle(workers, min_limit=json_config.get('WRITE_MIN_WORKERS', 1), \
+                                  target_latency=json_config.get('WRITE_TARGET_LATENCY', 1.0), \
+                                      retries=json_config.get('WRITE_RETRY_TRIES', 5), \
+                                          backoff=json_config.get('WRITE_RETRY_BACKOFF', 0.5), \
+                                              max_backoff=json_config.get('WRITE_RETRY_MAX_BACKOFF', 30), \
+                                                  business_hours=json_config.get('WRITE_BUSINESS_HOURS'), \
+                                                      business_days=json_config.get('WRITE_BUSINESS_DAYS', [1, 2, 3, 4, 5]), \
+                                                          business_limit=json_config.get('WRITE_BUSINESS_WORKERS', 1))
+    return Write_Pool(connector, workers=workers, throttle=throttle)
+
+
+## Конвейерная миграция: шаги применяются по мере планирования, файл плана не сохраняется.
+#  Запись выполняется через копии соединения, чтобы поиск при планировании и запись не использовали одно соединение.
+#  Возвращает количество шагов, примененных с ошибками
+def pipeline_migrate(json_config, edir_connector, samba_connector, sync_state, fingerprints, journal, delta):
+    logging.info(f"************* Конвейерное применение изменений {datetime.datetime.now()} *******")
+    write_connector = samba_connector.clone()
+    write_pool = open_write_pool(json_config, write_connector)
+    journal.start(uuid.uuid4().hex)
+    pipeline = Step_Pipeline(write_pool, json_config['DEFAULT_USER_MIGRATION_PASSWORD'], fingerprints, journal, \
+                             queue_size=json_config.get('PIPELINE_QUEUE_SIZE', 1000))
+    try:
+        for step in iter_plan_steps(json_config, edir_connector, samba_connector, sync_state, fingerprints, delta):
+            if step:
+                pipeline.put(step)
+        pipeline.finish()
+    finally:
+        write_pool.close()
+        write_connector.unbind()
+        journal.close()
+        fingerprints.save()
+    logging.info(f'Конвейерное применение изменений завершено, применено шагов: {pipeline.count - pipeline.failed}, ' \
+                 f'с ошибками: {pipeline.failed}')
+    return pipeline.failed
+
+
+## Время начала чтения сервера источника для high-water mark следующего инкрементального запуска: время сервера
+#  источника (currentTime, если сервер его не возвращает - время локального сервера) минус DELTA_SAFETY_MARGIN секунд.
+#  Запас учитывает расхождение часов серверов и задержку репликации: изменения, записанные во время чтения, будут
+#  прочитаны следующим запуском повторно, а не пропущены
+def sync_start_time(json_config, connector):
+    now = connector.server_time()
+    if now is None:
+        logging.info('Сервер источника не возвращает currentTime, для high-water mark используется время локального сервера')
+        now = datetime.datetime.now(datetime.timezone.utc)
+    return now - datetime.timedelta(seconds=json_config.get('DELTA_SAFETY_MARGIN', 300))
+
+
+## Сохранение состояния синхронизации, если все шаги плана применены. Иначе сохраненное состояние предыдущего запуска
+#  не изменяется: следующий запуск повторно прочитает объекты, измененные после его high-water mark, и удаленные объекты
+def save_sync_state(sync_state, failed: int):
+    if failed:
+        logging.warning(f'Шагов плана, примененных с ошибками: {failed}. Состояние синхронизации не сохранено, ' \
+                        f'следующий запуск повторит изменения после high-water mark предыдущего запуска')
+        return
+    sync_state.save()
+
+
+## Выполнение запуска: выгрузка снимков, построение и (или) применение плана изменений.
+#  shard_pool и samba_connector - пул процессов-обработчиков и подключение к целевому серверу с индексом (см. open_shard_pool)
+def migrate(args, json_config, shard_pool=None, samba_connector=None):
+    # Файл плана изменений
+    plan_file = json_config.get('PLAN_FILE', 'plan.json')
+    # Файл отпечатков синхронизированных записей
+    fingerprints = Fingerprint_Store(json_config.get('FINGERPRINT_FILE', 'fingerprints.json'))
+    # Журнал выполненных шагов плана
+    journal = Apply_Journal(json_config.get('JOURNAL_FILE', 'journal.jsonl'), json_config.get('JOURNAL_SYNC_INTERVAL', 1))
+    # Файл состояния синхронизации (high-water mark modifyTimestamp и GUID объектов предыдущего запуска)
+    sync_state_file = json_config.get('SYNC_STATE_FILE', 'sync_state.json')
+
+## Подключение к целевому серверу (при планировании по шардам подключение и индекс созданы при старте, см. open_shard_pool)
+    if samba_connector is None:
+        metrics.begin_phase('Connect')
+        samba_connector = connect(json_config, 'WRITE')
+
+    sync_state = None
+    if args.export_snapshot:
+## Выгрузка снимков каталогов
+        edir_connector = connect(json_config, 'READ')
+        metrics.begin_phase('Snapshot')
+        export_snapshots(json_config, edir_connector, samba_connector, args.export_snapshot)
+        return
+    if args.export_ldif:
+## Выгрузка LDIF для начальной загрузки целевого сервера
+        edir_connector = connect(json_config, 'READ')
+        metrics.begin_phase('Export')
+        export_ldif(json_config, edir_connector, samba_connector, args.export_ldif)
+        return
+    if args.verify:
+## Проверка соответствия серверов по деревьям хэшей
+        edir_connector = connect(json_config, 'READ')
+        metrics.begin_phase('Verify')
+        counts = {'add': 0, 'delete': 0, 'change': 0}
+        for difference in verify_directories(json_config, edir_connector, samba_connector):
+            counts[difference['change']] += 1
+            print(json.dumps(difference, ensure_ascii=False))
+        logging.info(f'Проверка соответствия серверов завершена, различия: {counts}')
+        return
+    if args.resume:
+## Продолжение применения плана после сбоя: шаги, выполненные по журналу, пропускаются
+        plan_path = args.apply or plan_file
+        plan = Change_Plan.load(plan_path)
+        try:
+            completed = journal.completed(plan.plan_id)
+        except ValueError as error:
+            logging.critical(error)
+            raise
+        for step in plan.steps:
+            if (step['phase'], step['guid']) in completed and 'fingerprint' in step:
+                fingerprints.update(step['guid'], step['fingerprint'])
+        plan = plan.remaining(completed)
+        phases = set(step['phase'] for step in plan.steps)
+        logging.info(f'Продолжение применения плана {plan_path}: выполнено шагов по журналу: {len(completed)}, ' \
+                     f'осталось: {len(plan.steps)}, фазы: {[phase for phase in PHASES if phase in phases]}')
+    elif args.apply:
+## Загрузка ранее сохраненного плана
+        plan = Change_Plan.load(args.apply)
+    else:
+## Состояние синхронизации
+        delta = args.delta
+        if delta and not os.path.exists(sync_state_file):
+            logging.warning(f'Файл состояния {sync_state_file} не найден, выполняется полная синхронизация')
+            delta = False
+        sync_state = Sync_State(sync_state_file)
+
+## Подключение к серверу источнику и построение плана изменений
+        edir_connector = connect(json_config, 'READ')
+        sync_state.begin(sync_start_time(json_config, edir_connector))
+        if args.pipeline and not args.plan_only:
+            if json_config.get('SHARD_PROCESSES', 1) > 1:
+                logging.warning('Конвейерный режим выполняется в одном процессе, SHARD_PROCESSES не используется')
+            failed = pipeline_migrate(json_config, edir_connector, samba_connector, sync_state, fingerprints, journal, delta)
+            save_sync_state(sync_state, failed)
+            return
+        if shard_pool is not None:
+            plan = build_sharded_plan(json_config, edir_connector, samba_connector, sync_state, fingerprints, delta, shard_pool)
+        else:
+            plan = build_plan(json_config, edir_connector, samba_connector, sync_state, fingerprints, delta)
+        # Состояние синхронизации сохраняется вместе с планом: при применении плана запуском с --apply или --resume
+        # оно записывается в файл состояния, если все шаги применены без ошибок
+        plan.sync_state = sync_state.pending()
+        plan.save(plan_file)
+        fingerprints.save()
+        logging.info(f'План изменений сохранен в {plan_file}, операций: {plan.counts()}')
+
+    if args.plan_only:
+        return
+
+## Состояние синхронизации, сохраненное вместе с загруженным планом (план, сохраненный без него, состояние не изменяет)
+    if sync_state is None and plan.sync_state is not None:
+        sync_state = Sync_State(sync_state_file)
+        sync_state.restore(plan.sync_state)
+
+## Применение плана изменений
+    failed = 0
+    if plan.is_empty():
+        logging.info('План изменений пуст, изменения на целевом сервере не требуются')
+    else:
+        logging.info(f"************* Применение плана изменений {datetime.datetime.now()} ************")
+        # При продолжении записи, созданные прерванным запуском, не считаются ошибкой (см. LDAP_Connector.resume)
+        samba_connector.resume = args.resume
+        write_pool = open_write_pool(json_config, samba_connector)
+        journal.start(plan.plan_id, resume=args.resume)
+        try:
+            failed = plan.apply(write_pool, json_config['DEFAULT_USER_MIGRATION_PASSWORD'], fingerprints, journal)
+        finally:
+            write_pool.close()
+            journal.close()
+            fingerprints.save()
+
+## Сохранение состояния синхронизации для следующего инкрементального запуска
+    if sync_state is not None:
+        save_sync_state(sync_state, failed)
+
+if __name__ == '__main__':
+    __main__()
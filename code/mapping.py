@@ -0,0 +1,154 @@
+import datetime
+from ldap3.protocol.formatters.formatters import format_time
+from connector import CaseInsensitiveDict
+from dn import normalize_dn
+from record import normalize_attribute
+from state import to_generalized_time
+from logger import logging
+
+
+## Функция для приведения значения атрибута к нормализованному виду (см. normalize_attribute) с преобразованием
+#  каждого значения многозначного атрибута функцией convert. Значения, для которых convert возвращает None, пропускаются;
+#  если пропущены все значения, возвращается None (атрибут не переносится)
+def _convert(value, convert):
+    if isinstance(value, (list, tuple)):
+        values = sorted(item for item in map(convert, value) if item is not None)
+        if not values:
+            return None if value else '[]'
+        return values[0] if len(values) == 1 else values
+    return convert(value)
+
+
+## Функция возвращающая функцию приведения значения к целому числу (строкой). Значение, которое не является
+#  целым числом, записывается в журнал и пропускается
+def _integer(attribute: str):
+    def convert(item):
+        try:
+            return str(int(item))
+        except (TypeError, ValueError):
+            logging.warning(f'Значение {item!r} атрибута {attribute} не является целым числом и не переносится')
+            return None
+    return convert
+
+
+## Функция для приведения времени (datetime или строка GeneralizedTime с любым часовым поясом) к формату
+#  GeneralizedTime UTC (YYYYMMDDHHMMSSZ). Значение, которое не является временем, возвращается строкой без изменений
+def _timestamp(item):
+    if isinstance(item, str):
+        parsed = format_time(item.encode('utf-8'))
+        if not isinstance(parsed, datetime.datetime):
+            return item
+        item = parsed
+    return to_generalized_time(item)
+
+
+## Функция возвращающая функцию преобразования значения атрибута attribute для типа transform:
+#  str - строка (по умолчанию), int - целое число, timestamp - время в формате GeneralizedTime,
+#  dn - DN, конвертируемый в формат целевого сервера функцией translate, нормализованный и в нижнем регистре
+#  (так же нормализуются значения целевого сервера, см. normalize_attribute)
+def _transform(transform: str, translate=None, attribute: str = None):
+    if transform == 'str':
+        return normalize_attribute
+    if transform == 'int':
+        integer = _integer(attribute)
+        return lambda value: _convert(value, integer)
+    if transform == 'timestamp':
+        return lambda value: _convert(value, _timestamp)
+    if transform == 'dn':
+        return lambda value: _convert(value, lambda item: normalize_dn(translate(str(item))).lower())
+    raise ValueError(f'Неизвестный тип преобразования атрибута: {transform}')
+
+
+class Mapping_Plan:
+    """
+    A class to represent the compiled mapping of source attributes to target attributes for one object type.
+
+    The mapping from MappingAttr is compiled once into a fixed list of steps (source attribute, target
+    attribute, transform). A mapping value is either the name of the source attribute or an object
+    {"source": name, "type": transform}, transform is str (default), int, timestamp or dn. Transforms are
+    applied to every value of multi-valued attributes, a value that can not be converted is logged and
+    skipped. Source attributes are read from CaseInsensitiveDict by their lower-case names without further
+    conversion.
+
+    Attributes
+    ----------
+    object_type : str
+        Object type (OU, User, Group)
+    steps : tuple
+        Steps of the mapping: (lower-case source attribute, lower-case target attribute, transform function)
+    source_attributes : list
+        Source attributes to read
+    guid_attribute : str
+        Source attribute mapped to novellGUID
+    dn_attributes : frozenset
+        Lower-case target attributes with DN values (dn transform), normalized in the target index too
+
+    Methods
+    -------
+    map(attributes):
+        Return the mapped attributes of one source entry
+    map_page(entries):
+        Return the mapped attributes of a page of source entries
+    """
+
+    def __init__(self, object_type: str, attribute_mapping: dict, translate=None, exclude=()):
+        """
+        Init attributes for creating Mapping_Plan Object
+
+        Parameters
+        ----------
+            object_type : str
+                Object type (OU, User, Group)
+            attribute_mapping : dict
+                Mapping of the object type from MappingAttr: {target attribute: source attribute or {"source", "type"}}
+            translate : function, optional
+                Conversion of DN values to the format of the target server (dn transform)
+            exclude : tuple, optional
+                Target attributes that are not mapped (e.g. member of groups, processed separately)
+        """
+
+        self.object_type = object_type
+        steps = []
+        self.source_attributes = []
+        dn_attributes = set()
+        for target, source in attribute_mapping.items():
+            if isinstance(source, dict):
+                transform, source = source.get('type', 'str'), source['source']
+            else:
+                transform = 'str'
+            if target == 'novellGUID':
+                self.guid_attribute = source
+            self.source_attributes.append(source)
+            if transform == 'dn':
+                dn_attributes.add(target.lower())
+            if target not in exclude:
+                steps.append((source.lower(), target.lower(), _transform(transform, translate, source)))
+        self.steps = tuple(steps)
+        self.dn_attributes = frozenset(dn_attributes)
+
+## Метод возвращающий атрибуты записи целевого сервера для записи сервера источника (пустые значения и значения,
+#  которые не удалось преобразовать, не переносятся)
+    def map(self, attributes: dict):
+        get = dict.get
+        mapped = CaseInsensitiveDict()
+        for source, target, transform in self.steps:
+            value = get(attributes, source)
+            if value:
+                value = transform(value)
+                if value is not None:
+                    dict.__setitem__(mapped, target, value)
+        return mapped
+
+## Метод возвращающий атрибуты записей целевого сервера для страницы записей сервера источника.
+#  Шаги маппинга выполняются по очереди для всех записей страницы
+    def map_page(self, entries: list):
+        get = dict.get
+        mapped = [CaseInsensitiveDict() for _ in entries]
+        for source, target, transform in self.steps:
+            for result, attributes in zip(mapped, entries):
+                value = get(attributes, source)
+                if value:
+                    value = transform(value)
+                    if value is not None:
+                        dict.__setitem__(result, target, value)
+        return mapped
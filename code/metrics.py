@@ -0,0 +1,236 @@
+import json
+import os
+import threading
+import time
+
+
+# Границы интервалов гистограммы времени выполнения операций LDAP (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+## Функция для экранирования значения метки в формате Prometheus
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+## Функция для формирования строки меток в формате Prometheus
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_label_value(value)}"' for key, value in labels.items()) + '}'
+
+
+class Metrics:
+    """
+    A class to represent latency histograms and counters of LDAP operations.
+
+    Operations are grouped by operation type (search, add, modify, modify_dn, delete, ...),
+    object type (OU, User, Group) and phase of the run; results are counted by result code.
+    The same registry is shared by all connections of the process (see the module-level metrics object).
+
+    Methods
+    -------
+    begin_phase(phase, object_type):
+        Start a phase of the run, the previous phase is finished
+    end_phase():
+        Finish the current phase
+    current_labels():
+        Return (phase, object_type) of the current phase
+    observe(operation, phase, object_type, seconds, result):
+        Register an executed LDAP operation
+    take_state():
+        Return the registered operations and results and reset them (sharded planning)
+    merge(state):
+        Add the operations and results registered by a shard worker
+    summary():
+        Return the metrics as a dictionary (JSON summary)
+    prometheus():
+        Return the metrics in the Prometheus text format
+    write_summary(path), write_prometheus(path):
+        Write the JSON summary / Prometheus textfile
+    start_export(path, interval), stop_export():
+        Write the Prometheus textfile periodically in a background thread
+    """
+
+    def __init__(self):
+        """
+        Init attributes for creating Metrics Object
+        """
+
+        self.__lock = threading.Lock()
+        self.__started = time.time()
+        self.__operations = {}
+        self.__results = {}
+        self.__phases = {}
+        self.__phase = ('', '')
+        self.__phase_started = None
+        self.__export_stop = None
+        self.__export_thread = None
+
+## Метод для начала фазы запуска (чтение OU, планирование пользователей, применение групп и т.д.).
+#  Время предыдущей фазы добавляется к ее суммарной длительности
+    def begin_phase(self, phase: str, object_type: str = ''):
+        with self.__lock:
+            self.__finish_phase()
+            self.__phase = (phase, object_type)
+            self.__phase_started = time.perf_counter()
+
+## Метод для завершения текущей фазы
+    def end_phase(self):
+        with self.__lock:
+            self.__finish_phase()
+            self.__phase = ('', '')
+
+    def __finish_phase(self):
+        if self.__phase_started is not None:
+            name = self.__phase_name()
+            self.__phases[name] = self.__phases.get(name, 0.0) + time.perf_counter() - self.__phase_started
+            self.__phase_started = None
+
+    def __phase_name(self):
+        phase, object_type = self.__phase
+        return f'{phase} {object_type}' if object_type else phase
+
+## Метод возвращающий фазу и тип объектов текущей фазы
+    def current_labels(self):
+        return self.__phase
+
+## Метод для регистрации выполненной операции LDAP: время выполнения добавляется в гистограмму,
+#  результат (описание кода результата или имя исключения) - в счетчик результатов
+    def observe(self, operation: str, phase: str, object_type: str, seconds: float, result: str):
+        with self.__lock:
+            histogram = self.__operations.get((operation, phase, object_type))
+            if histogram is None:
+                histogram = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+                self.__operations[(operation, phase, object_type)] = histogram
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            histogram['max'] = max(histogram['max'], seconds)
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    break
+            else:
+                index = len(LATENCY_BUCKETS)
+            histogram['buckets'][index] += 1
+            self.__results[(operation, result)] = self.__results.get((operation, result), 0) + 1
+
+## Метод возвращающий зарегистрированные операции и результаты и сбрасывающий их.
+#  Используется процессом-обработчиком шарда для передачи метрик координатору
+    def take_state(self):
+        with self.__lock:
+            state = {'operations': self.__operations, 'results': self.__results}
+            self.__operations, self.__results = {}, {}
+        return state
+
+## Метод для добавления операций и результатов, зарегистрированных процессом-обработчиком шарда (см. take_state)
+    def merge(self, state: dict):
+        with self.__lock:
+            for key, shard_histogram in state['operations'].items():
+                histogram = self.__operations.get(key)
+                if histogram is None:
+                    self.__operations[key] = shard_histogram
+                    continue
+                histogram['count'] += shard_histogram['count']
+                histogram['sum'] += shard_histogram['sum']
+                histogram['max'] = max(histogram['max'], shard_histogram['max'])
+                histogram['buckets'] = [count + shard_count for count, shard_count in zip(histogram['buckets'], shard_histogram['buckets'])]
+            for key, count in state['results'].items():
+                self.__results[key] = self.__results.get(key, 0) + count
+
+## Метод для оценки квантиля по гистограмме (верхняя граница интервала, в который попадает квантиль)
+    @staticmethod
+    def __quantile(histogram: dict, quantile: float):
+        rank = quantile * histogram['count']
+        cumulative = 0
+        for index, count in enumerate(histogram['buckets']):
+            cumulative += count
+            if cumulative >= rank and count:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else histogram['max']
+        return histogram['max']
+
+## Метод возвращающий метрики в виде словаря
+    def summary(self):
+        with self.__lock:
+            phases = dict(self.__phases)
+            if self.__phase_started is not None:
+                name = self.__phase_name()
+                phases[name] = phases.get(name, 0.0) + time.perf_counter() - self.__phase_started
+            operations = []
+            for (operation, phase, object_type), histogram in sorted(self.__operations.items()):
+                operations.append({'operation': operation, 'phase': phase, 'object_type': object_type, \
+                                   'count': histogram['count'], 'sum': round(histogram['sum'], 6), \
+                                   'avg': round(histogram['sum'] / histogram['count'], 6), 'max': round(histogram['max'], 6), \
+                                   'p50': self.__quantile(histogram, 0.5), 'p90': self.__quantile(histogram, 0.9), \
+                                   'p99': self.__quantile(histogram, 0.99), \
+                                   'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], histogram['buckets']))})
+            results = [{'operation': operation, 'result': result, 'count': count} \
+                       for (operation, result), count in sorted(self.__results.items())]
+        return {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.__started)), \
+                'duration': round(time.time() - self.__started, 3), \
+                'phases': {phase: round(seconds, 3) for phase, seconds in phases.items()}, \
+                'operations': operations, 'results': results}
+
+## Метод возвращающий метрики в текстовом формате Prometheus (для textfile collector node_exporter)
+    def prometheus(self):
+        summary = self.summary()
+        lines = ['# HELP migration_ldap_operation_duration_seconds Latency of LDAP operations', \
+                 '# TYPE migration_ldap_operation_duration_seconds histogram']
+        with self.__lock:
+            operations = sorted((key, dict(value, buckets=list(value['buckets']))) for key, value in self.__operations.items())
+        for (operation, phase, object_type), histogram in operations:
+            cumulative = 0
+            for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], histogram['buckets']):
+                cumulative += count
+                lines.append('migration_ldap_operation_duration_seconds_bucket' + \
+                             _labels(operation=operation, phase=phase, object_type=object_type, le=bound) + f' {cumulative}')
+            labels = _labels(operation=operation, phase=phase, object_type=object_type)
+            lines.append(f'migration_ldap_operation_duration_seconds_sum{labels} {histogram["sum"]:.6f}')
+            lines.append(f'migration_ldap_operation_duration_seconds_count{labels} {histogram["count"]}')
+        lines += ['# HELP migration_ldap_results_total LDAP operation results by result code', \
+                  '# TYPE migration_ldap_results_total counter']
+        for result in summary['results']:
+            lines.append('migration_ldap_results_total' + \
+                         _labels(operation=result['operation'], result=result['result']) + f' {result["count"]}')
+        lines += ['# HELP migration_phase_duration_seconds Duration of the phases of the run', \
+                  '# TYPE migration_phase_duration_seconds gauge']
+        for phase, seconds in summary['phases'].items():
+            lines.append('migration_phase_duration_seconds' + _labels(phase=phase) + f' {seconds}')
+        lines += ['# HELP migration_run_duration_seconds Duration of the run', \
+                  '# TYPE migration_run_duration_seconds gauge', f'migration_run_duration_seconds {summary["duration"]}']
+        return '\n'.join(lines) + '\n'
+
+## Метод для записи файла через временный файл (node_exporter не должен прочитать файл частично)
+    @staticmethod
+    def __write_file(path: str, content: str):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(tmp_path, path)
+
+## Метод для сохранения метрик в JSON-файл
+    def write_summary(self, path: str):
+        self.__write_file(path, json.dumps(self.summary(), ensure_ascii=False, indent=1))
+
+## Метод для сохранения метрик в текстовый файл Prometheus
+    def write_prometheus(self, path: str):
+        self.__write_file(path, self.prometheus())
+
+## Метод запускающий периодическую запись файла Prometheus в фоновом потоке (каждые interval секунд)
+    def start_export(self, path: str, interval: float = 30):
+        self.__export_stop = threading.Event()
+
+        def export():
+            while not self.__export_stop.wait(interval):
+                self.write_prometheus(path)
+
+        self.__export_thread = threading.Thread(target=export, name='metrics-export', daemon=True)
+        self.__export_thread.start()
+
+## Метод останавливающий периодическую запись файла Prometheus
+    def stop_export(self):
+        if self.__export_thread is not None:
+            self.__export_stop.set()
+            self.__export_thread.join()
+            self.__export_thread = None
+
+
+# Метрики процесса, общие для всех подключений
+metrics = Metrics()
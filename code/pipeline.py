@@ -0,0 +1,152 @@
+import threading
+from queue import Queue
+from plan import Change_Plan, step_applier
+from metrics import metrics
+
+
+# Признак завершения очереди
+_DONE = object()
+
+# Фазы, шаги которых применяются по мере планирования. Шаги остальных фаз (OU по уровням вложенности, удаления)
+# зависят друг от друга и применяются после планирования всей фазы
+STREAMED_PHASES = ('User', 'Group')
+
+
+## Генератор, читающий iterable в отдельном потоке через очередь размером не больше queue_size элементов:
+#  чтение следующих страниц сервера источника выполняется одновременно с обработкой прочитанных записей,
+#  при заполнении очереди чтение приостанавливается. Исключение потока чтения передается потребителю
+def prefetch(iterable, queue_size: int):
+    if queue_size <= 0:
+        yield from iterable
+        return
+    queue = Queue(maxsize=queue_size)
+
+    def produce():
+        try:
+            for item in iterable:
+                queue.put(item)
+        except BaseException as error:
+            queue.put(error)
+            return
+        queue.put(_DONE)
+
+    threading.Thread(target=produce, name='prefetch', daemon=True).start()
+    while True:
+        item = queue.get()
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+class Step_Pipeline:
+    """
+    A class to represent the writer stage of the pipelined migration.
+
+    Steps of the User and Group phases are put into a bounded queue while the plan is being built
+    and are applied by the write pool at the same time. Steps of the other phases are collected
+    and applied by levels when the phase is finished. Phases are applied in order: the writer
+    waits until all steps of the previous phase are applied.
+
+    Attributes
+    ----------
+    queue_size : int
+        Maximum number of planned steps waiting to be applied
+    count : int
+        Number of planned steps
+    failed : int
+        Number of steps that failed to apply
+
+    Methods
+    -------
+    put(step):
+        Add a planned step
+    finish():
+        Apply all remaining steps and wait until they are applied
+    """
+
+    def __init__(self, write_pool, default_password: str, fingerprints=None, journal=None, queue_size: int = 1000):
+        """
+        Init attributes for creating Step_Pipeline Object
+
+        Parameters
+        ----------
+            write_pool : Write_Pool
+                Pool of connections used to apply the steps
+            default_password : str
+                Password for the new users
+            fingerprints : Fingerprint_Store, optional
+                Fingerprints updated for the applied steps
+            journal : Apply_Journal, optional
+                Journal of the applied steps
+            queue_size : int, optional
+                Maximum number of planned steps waiting to be applied (default is 1000)
+        """
+
+        self.queue_size = max(1, queue_size)
+        self.__write_pool = write_pool
+        self.__default_password = default_password
+        self.__fingerprints = fingerprints
+        self.__journal = journal
+        self.__apply_step = step_applier(default_password, fingerprints, journal)
+        self.__phase = None
+        self.__collected = []
+        self.__queue = None
+        self.__writer = None
+        self.__error = None
+        self.count = 0
+        self.failed = 0
+
+## Метод для добавления запланированного шага. При смене фазы дожидается применения шагов предыдущей фазы
+    def put(self, step: dict):
+        if step['phase'] != self.__phase:
+            self.__finish_phase()
+            self.__phase = step['phase']
+            if self.__phase in STREAMED_PHASES:
+                self.__start_writer()
+        self.count += 1
+        if self.__writer is not None:
+            self.__queue.put(step)
+            if self.__error is not None:
+                self.__finish_phase()
+        else:
+            self.__collected.append(step)
+
+## Метод для применения оставшихся шагов
+    def finish(self):
+        self.__finish_phase()
+        self.__phase = None
+
+## Метод запускающий поток записи, который применяет шаги из очереди через пул соединений
+    def __start_writer(self):
+        self.__queue = Queue(maxsize=self.queue_size)
+
+        def write():
+            try:
+                self.failed += self.__write_pool.run(self.__apply_step, iter(self.__queue.get, _DONE)).count(False)
+            except BaseException as error:
+                self.__error = error
+                # Очередь освобождается, чтобы поток планирования не остановился на заполненной очереди
+                while self.__queue.get() is not _DONE:
+                    pass
+
+        self.__writer = threading.Thread(target=write, name='writer', daemon=True)
+        self.__writer.start()
+
+## Метод завершающий текущую фазу: дожидается потока записи или применяет собранные шаги по уровням
+    def __finish_phase(self):
+        if self.__writer is not None:
+            self.__queue.put(_DONE)
+            self.__writer.join()
+            self.__writer = None
+            if self.__error is not None:
+                error, self.__error = self.__error, None
+                raise error
+        elif self.__collected:
+            # Фаза метрик планирования восстанавливается после применения собранных шагов
+            labels = metrics.current_labels()
+            self.failed += Change_Plan(self.__collected).apply(self.__write_pool, self.__default_password, \
+                                                               self.__fingerprints, self.__journal)
+            metrics.begin_phase(*labels)
+            self.__collected = []
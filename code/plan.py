@@ -0,0 +1,145 @@
+import json
+import uuid
+from metrics import metrics
+from collections import Counter
+
+
+# Порядок фаз применения плана: OU (от родительских к дочерним), пользователи, группы и членство в группах,
+# затем удаление групп, пользователей и OU (от дочерних к родительским)
+PHASES = ['OU', 'User', 'Group', 'Delete Group', 'Delete User', 'Delete OU']
+
+
+## Функция создающая шаг плана для объекта guid. Для шага без операций возвращает None
+def make_step(phase: str, level: int, object_type: str, guid: str, operations: list, fingerprint: str = None):
+    if not operations:
+        return None
+    step = {'phase': phase, 'level': level, 'object_type': object_type, 'guid': guid, 'operations': operations}
+    if fingerprint:
+        step['fingerprint'] = fingerprint
+    return step
+
+
+## Функция возвращающая функцию выполнения шага плана на соединении пула (см. writer.Write_Pool).
+#  Успешно выполненный шаг записывается в журнал, для него обновляется (при удалении - удаляется) отпечаток записи
+def step_applier(default_password: str, fingerprints=None, journal=None):
+    def apply_step(connector, step):
+        success = connector.apply_operations(step, default_password)
+        if not success:
+            return False
+        if journal is not None:
+            journal.record(step)
+        if fingerprints is not None:
+            if step['phase'].startswith('Delete'):
+                fingerprints.discard(step['guid'])
+                # Записи, удаленные вместе с поддеревом OU
+                for operation in step['operations']:
+                    for _, guid, _ in operation.get('records', []):
+                        fingerprints.discard(guid)
+            elif 'fingerprint' in step:
+                fingerprints.update(step['guid'], step['fingerprint'])
+        return True
+    return apply_step
+
+
+class Change_Plan:
+    """
+    A class to represent a plan of changes for the target LDAP server.
+
+    The plan is a list of steps. Every step belongs to one object (GUID) and contains the
+    operations for it in execution order: add, move, rename, modify, membership, delete.
+    A step may carry the fingerprint of the source entry, it is saved after the step is applied.
+    Every plan has an identifier, the journal of applied steps (see journal.py) refers to it.
+    A plan may carry the pending state of incremental synchronization (see state.Sync_State.pending):
+    it is saved to the state file only after the plan is applied without errors.
+    Steps of the same phase and level do not depend on each other and can be applied concurrently.
+
+    Methods
+    -------
+    counts():
+        Return the number of operations per operation type
+    is_empty():
+        Return True if the plan contains no operations
+    stages():
+        Return steps grouped by phase and level in execution order
+    remaining(completed):
+        Return the plan without the steps registered in the journal as applied
+    apply(write_pool, default_password, fingerprints, journal):
+        Apply the plan through the write pool, update fingerprints and the journal of applied steps,
+        return the number of failed steps
+    save(path), load(path):
+        Write the plan to a JSON file / read the plan from a JSON file
+    """
+
+    def __init__(self, steps=None, plan_id: str = None, sync_state: dict = None):
+        """
+        Init attributes for creating Change_Plan Object
+
+        Parameters
+        ----------
+            steps : list, optional
+                Steps of the plan (default is an empty plan)
+            plan_id : str, optional
+                Identifier of the plan (default is a new unique identifier)
+            sync_state : dict, optional
+                Pending state of incremental synchronization registered while planning (default is None)
+        """
+
+        self.steps = steps if steps is not None else []
+        self.plan_id = plan_id if plan_id is not None else uuid.uuid4().hex
+        self.sync_state = sync_state
+
+## Метод возвращающий количество операций по типам, для операций с членством в группах - также количество
+#  добавляемых и удаляемых членов групп, для удаления поддеревьев - количество удаляемых вместе с ними записей
+    def counts(self):
+        counts = Counter()
+        for step in self.steps:
+            for operation in step['operations']:
+                counts[operation['op']] += 1
+                if operation['op'] == 'membership':
+                    counts['member_add'] += len(operation['add'])
+                    counts['member_remove'] += len(operation['remove'])
+                elif operation.get('tree'):
+                    counts['tree_delete_records'] += len(operation['records'])
+        return dict(counts)
+
+## Метод возвращающий True, если план не содержит операций
+    def is_empty(self):
+        return not self.steps
+
+## Метод возвращающий шаги плана, сгруппированные по фазам и уровням, в порядке выполнения
+    def stages(self):
+        stages = {}
+        for step in self.steps:
+            stages.setdefault((PHASES.index(step['phase']), step['level']), []).append(step)
+        return [stages[key] for key in sorted(stages)]
+
+## Метод возвращающий план без шагов, выполненных ранее (completed - множество (фаза, GUID) из журнала)
+    def remaining(self, completed: set):
+        return Change_Plan([step for step in self.steps if (step['phase'], step['guid']) not in completed], self.plan_id, \
+                           self.sync_state)
+
+## Метод для применения плана через пул соединений. Шаги одного уровня выполняются параллельно,
+#  следующий уровень - после завершения предыдущего. Каждый успешно выполненный шаг сразу записывается в журнал
+#  и для него обновляется отпечаток записи (см. step_applier). Возвращает количество невыполненных шагов
+    def apply(self, write_pool, default_password: str, fingerprints=None, journal=None):
+        apply_step = step_applier(default_password, fingerprints, journal)
+        failed = 0
+        for stage in self.stages():
+            metrics.begin_phase('Apply ' + stage[0]['phase'])
+            failed += write_pool.run(apply_step, stage).count(False)
+        return failed
+
+## Метод для сохранения плана в JSON-файл (вместе с состоянием синхронизации, если оно задано)
+    def save(self, path: str):
+        data = {'id': self.plan_id, 'counts': self.counts(), 'steps': self.steps}
+        if self.sync_state is not None:
+            data['sync_state'] = self.sync_state
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=1)
+
+## Метод для загрузки плана из JSON-файла
+    @classmethod
+    def load(cls, path: str):
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        return cls(data['steps'], data.get('id'), data.get('sync_state'))
@@ -0,0 +1,123 @@
+import datetime
+import sys
+from dn import normalize_dn
+from state import to_generalized_time
+
+
+## Функция для приведения значения атрибута к нормализованному виду: строка для одного значения,
+#  отсортированный список строк для многозначного атрибута (порядок значений не учитывается при сравнении),
+#  '[]' для пустого атрибута (как str() для пустого атрибута ldap3 Entry). Время (атрибуты с синтаксисом
+#  GeneralizedTime, ldap3 возвращает datetime) приводится к формату GeneralizedTime UTC, как при маппинге (см. mapping.py).
+#  Значения атрибутов с DN (is_dn) нормализуются и приводятся к нижнему регистру: Samba DC возвращает CN=...,DC=...
+def normalize_attribute(value, is_dn: bool = False):
+    if isinstance(value, (list, tuple)):
+        values = sorted(_normalize_value(item, is_dn) for item in value)
+        if not values:
+            return '[]'
+        return values[0] if len(values) == 1 else values
+    return _normalize_value(value, is_dn)
+
+
+def _normalize_value(item, is_dn: bool = False):
+    if is_dn:
+        return normalize_dn(str(item)).lower()
+    return to_generalized_time(item) if isinstance(item, datetime.datetime) else str(item)
+
+
+# Наборы имен атрибутов записей: {кортеж имен: (кортеж имен, {имя: позиция})}. Записи одного типа объектов
+# с одинаковым набором атрибутов ссылаются на один кортеж интернированных имен
+_SCHEMAS = {}
+
+
+## Функция возвращающая общий набор имен атрибутов (имена в нижнем регистре, интернированные)
+def _schema(names):
+    names = tuple(sys.intern(name.lower()) for name in names)
+    schema = _SCHEMAS.get(names)
+    if schema is None:
+        schema = _SCHEMAS.setdefault(names, (names, {name: position for position, name in enumerate(names)}))
+    return schema
+
+
+class Record:
+    """
+    A class to represent a compact record of the target server index.
+
+    Only the GUID, the normalized DN and the normalized attribute values are kept. Attribute names
+    are shared by records with the same set of attributes, values are stored in a tuple in the same
+    order. Attribute access is case-insensitive, like CaseInsensitiveDict.
+
+    Attributes
+    ----------
+    guid : str
+        novellGUID of the record
+    dn : str
+        Normalized DN (see dn.normalize_dn)
+
+    Methods
+    -------
+    get(name, default):
+        Return the value of the attribute or default
+    keys(), items():
+        Return attribute names / (name, value) pairs
+    update(attributes):
+        Replace values of the attributes, new attributes are added
+    """
+
+    __slots__ = ('guid', '_dn', '_schema', '_values')
+
+    def __init__(self, guid: str, dn: str, attributes: dict, dn_attributes=frozenset()):
+        """
+        Init attributes for creating Record Object
+
+        Parameters
+        ----------
+            guid : str
+                novellGUID of the record
+            dn : str
+                DN of the record
+            attributes : dict
+                Attributes of the record, values are normalized (see normalize_attribute)
+            dn_attributes : frozenset, optional
+                Lower-case names of the attributes with DN values (see Mapping_Plan.dn_attributes)
+        """
+
+        self.guid = guid
+        self.dn = dn
+        self._schema = _schema(attributes.keys())
+        self._values = tuple(normalize_attribute(value, name.lower() in dn_attributes) for name, value in attributes.items())
+
+## DN записи хранится в нормализованном виде (типы атрибутов RDN в нижнем регистре, без пробелов)
+    @property
+    def dn(self):
+        return self._dn
+
+    @dn.setter
+    def dn(self, dn: str):
+        self._dn = normalize_dn(dn)
+
+    def __getitem__(self, name: str):
+        return self._values[self._schema[1][name.lower()]]
+
+    def __contains__(self, name: str):
+        return name.lower() in self._schema[1]
+
+    def get(self, name: str, default=None):
+        position = self._schema[1].get(name.lower())
+        return default if position is None else self._values[position]
+
+    def keys(self):
+        return self._schema[0]
+
+    def items(self):
+        return zip(self._schema[0], self._values)
+
+## Метод для замены значений атрибутов после изменения записи на целевом сервере
+    def update(self, attributes: dict):
+        values = dict(self.items())
+        for name, value in attributes.items():
+            values[name.lower()] = normalize_attribute(value)
+        self._schema = _schema(values.keys())
+        self._values = tuple(values.values())
+
+    def __repr__(self):
+        return f'Record({self.guid!r}, {self.dn!r}, {dict(self.items())!r})'
@@ -0,0 +1,96 @@
+import multiprocessing
+import zlib
+from logging.handlers import QueueListener
+from metrics import metrics
+from logger import Forward_Handler, setup_worker_logging
+
+
+# Функция планирования шарда процесса-обработчика (задается при запуске процесса, см. Shard_Pool)
+_task = None
+
+
+## Функция возвращающая номер шарда для GUID объекта (шарды по диапазонам хэша GUID). Хэш CRC32 не зависит от процесса
+def guid_shard(guid: str, count: int):
+    return zlib.crc32(guid.lower().encode('utf-8')) % count
+
+
+## Функция инициализации процесса-обработчика: журналирование через очередь координатора, затем initializer(*initargs).
+#  Метрики, скопированные из процесса-координатора, сбрасываются
+def _init_worker(log_queue, task, initializer, initargs):
+    global _task
+    setup_worker_logging(log_queue)
+    metrics.take_state()
+    _task = task
+    initializer(*initargs)
+
+
+## Функция выполняющая планирование шарда в процессе-обработчике. Возвращает результат и метрики операций LDAP шарда
+def _run_task(shard):
+    return _task(shard), metrics.take_state()
+
+
+class Shard_Pool:
+    """
+    A class to represent the pool of worker processes of the sharded migration.
+
+    Every worker process is initialized once (own connections, index of the target server inherited
+    from the coordinator) and then plans the shards given to it by the coordinator. Log records of the workers are passed to the
+    coordinator through a queue and written to its logs, metrics of LDAP operations of the workers are
+    added to the metrics of the coordinator. Worker processes are forked from the coordinator, so the pool
+    must be created before the coordinator starts threads (log writer, metrics export): a lock held by
+    such a thread at the moment of fork stays locked in the worker forever.
+
+    Attributes
+    ----------
+    processes : int
+        Number of worker processes
+
+    Methods
+    -------
+    map(shards):
+        Plan the shards in the worker processes and return the results in the order of shards
+    close():
+        Stop the worker processes
+    """
+
+    def __init__(self, processes: int, task, initializer, initargs=()):
+        """
+        Init attributes for creating Shard_Pool Object
+
+        Parameters
+        ----------
+            processes : int
+                Number of worker processes
+            task : function
+                Function planning one shard in a worker process, task(shard) returns a picklable result
+            initializer : function
+                Function called once in every worker process
+            initargs : tuple, optional
+                Arguments of initializer
+        """
+
+        self.processes = max(1, processes)
+        # Процессы-обработчики создаются копированием процесса-координатора (fork), если это поддерживается системой.
+        # Поток приема сообщений запускается после создания процессов, чтобы они не копировали его блокировки
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        self.__log_queue = context.Queue()
+        self.__pool = context.Pool(self.processes, _init_worker, (self.__log_queue, task, initializer, initargs))
+        self.__listener = QueueListener(self.__log_queue, Forward_Handler())
+        self.__listener.start()
+
+## Метод выполняющий планирование шардов в процессах-обработчиках. Возвращает список результатов в порядке shards
+    def map(self, shards: list):
+        results = []
+        for result, shard_metrics in self.__pool.imap(_run_task, shards):
+            metrics.merge(shard_metrics)
+            results.append(result)
+        return results
+
+## Метод останавливающий процессы-обработчики и прием их сообщений (повторный вызов ничего не делает)
+    def close(self):
+        if self.__pool is None:
+            return
+        self.__pool.close()
+        self.__pool.join()
+        self.__pool = None
+        self.__listener.stop()
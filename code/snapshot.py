@@ -0,0 +1,91 @@
+import heapq
+import json
+import os
+import tempfile
+
+
+## Формат снимка каталога: текстовый файл, отсортированный по GUID, по одной записи в строке:
+#  "<GUID>\t<JSON записи>", где JSON записи - {"guid", "type", "dn", "attributes"} с отсортированными ключами.
+#  GUID в начале строки позволяет сравнивать снимки без разбора JSON для совпадающих записей
+
+
+## Функция для преобразования записи в строку снимка
+def _format_record(record: dict):
+    attributes = {key.lower(): value if isinstance(value, list) else str(value) for key, value in record['attributes'].items()}
+    line = json.dumps({'guid': record['guid'], 'type': record['type'], 'dn': record['dn'], 'attributes': attributes}, \
+                      ensure_ascii=False, sort_keys=True)
+    return record['guid'] + '\t' + line + '\n'
+
+
+## Функция для записи отсортированной части снимка во временный файл
+def _write_chunk(lines: list, directory: str):
+    lines.sort()
+    file = tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, suffix='.chunk', delete=False)
+    with file:
+        file.writelines(lines)
+    return file.name
+
+
+## Функция для записи снимка каталога. Записи (словари guid, type, dn, attributes) сортируются по GUID внешней
+#  сортировкой: части по chunk_size записей сортируются в памяти, затем временные файлы объединяются слиянием
+def write_snapshot(path: str, records, chunk_size: int = 100000):
+    directory = os.path.dirname(os.path.abspath(path))
+    chunks, lines, count = [], [], 0
+    for record in records:
+        lines.append(_format_record(record))
+        count += 1
+        if len(lines) >= chunk_size:
+            chunks.append(_write_chunk(lines, directory))
+            lines = []
+    lines.sort()
+    files = [open(chunk, 'r', encoding='utf-8') for chunk in chunks]
+    try:
+        with open(path, 'w', encoding='utf-8') as snapshot:
+            snapshot.writelines(heapq.merge(lines, *files))
+    finally:
+        for file in files:
+            file.close()
+        for chunk in chunks:
+            os.remove(chunk)
+    return count
+
+
+## Генератор, читающий снимок каталога: возвращает кортежи (GUID, строка JSON записи) в порядке GUID
+def read_snapshot(path: str):
+    with open(path, 'r', encoding='utf-8') as snapshot:
+        for line in snapshot:
+            guid, _, record = line.rstrip('\n').partition('\t')
+            yield guid, record
+
+
+## Функция сравнения двух записей снимков: DN без учета регистра, атрибуты - по объединению ключей,
+#  отсутствующий атрибут равен пустому значению '[]' (как str() для пустого атрибута ldap3)
+def records_differ(old_record: dict, new_record: dict):
+    if old_record['dn'].lower() != new_record['dn'].lower():
+        return True
+    old_attributes, new_attributes = old_record['attributes'], new_record['attributes']
+    for key in set(old_attributes) | set(new_attributes):
+        if old_attributes.get(key, '[]') != new_attributes.get(key, '[]'):
+            return True
+    return False
+
+
+## Генератор, сравнивающий два снимка за один проход слиянием отсортированных файлов.
+#  Возвращает кортежи (изменение, старая запись, новая запись), где изменение - 'add' (запись есть только в новом снимке),
+#  'delete' (только в старом) или 'change' (записи отличаются). JSON разбирается только для несовпадающих строк
+def diff_snapshots(old_path: str, new_path: str):
+    old_records, new_records = read_snapshot(old_path), read_snapshot(new_path)
+    old, new = next(old_records, None), next(new_records, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield 'delete', json.loads(old[1]), None
+            old = next(old_records, None)
+        elif old is None or new[0] < old[0]:
+            yield 'add', None, json.loads(new[1])
+            new = next(new_records, None)
+        else:
+            if old[1] != new[1]:
+                old_record, new_record = json.loads(old[1]), json.loads(new[1])
+                if records_differ(old_record, new_record):
+                    yield 'change', old_record, new_record
+            old, new = next(old_records, None), next(new_records, None)
@@ -0,0 +1,143 @@
+import datetime
+import json
+import os
+
+
+## Функция для приведения значения modifyTimestamp к формату GeneralizedTime (YYYYMMDDHHMMSSZ), пригодному для фильтра LDAP
+def to_generalized_time(value):
+    if isinstance(value, list):
+        if not value:
+            return None
+        value = value[0]
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc)
+        return value.strftime('%Y%m%d%H%M%SZ')
+    return str(value) if value else None
+
+
+class Sync_State:
+    """
+    A class to represent the state of incremental (delta) synchronization.
+
+    For every MIGRATION_LIST_OU entry and object type (OU, User, Group) the state keeps
+    the high-water mark of source modifyTimestamp and the set of source GUIDs seen by the last run.
+    The high-water mark is the source server time captured before the run started reading (minus
+    a safety margin), not the maximum modifyTimestamp read: an entry changed while the run reads the
+    server may have an older modifyTimestamp than the entries already read.
+
+    Attributes
+    ----------
+    path : str
+        Path to the local state file (JSON)
+
+    Methods
+    -------
+    high_water(ou, object_type):
+        Return the high-water mark saved by the previous run or None
+    guids(ou, object_type):
+        Return the set of GUIDs saved by the previous run
+    begin(timestamp):
+        Set the high-water mark of the current run
+    track(ou, object_type, guid):
+        Register a source object read by the current run
+    current_guids(ou, object_type):
+        Return the set of GUIDs read by the current run
+    take_current():
+        Return the state registered so far and start registering anew (sharded planning)
+    merge(current):
+        Add the state registered by a shard worker
+    pending(), restore(pending):
+        Return the state of the current run to be saved with the plan / restore it when the plan is applied
+    save():
+        Write the state of the current run to the state file
+    """
+
+    def __init__(self, path: str):
+        """
+        Init attributes for creating Sync_State Object
+
+        Parameters
+        ----------
+            path : str
+                Path to the local state file, the state of the previous run is loaded if the file exists
+        """
+
+        self.path = path
+        self.__saved = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.__saved = json.load(file)
+        self.__current = {}
+        self.__high_water = None
+
+## Метод возвращающий сохраненное предыдущим запуском состояние для OU и типа объектов
+    def __get_saved(self, ou: str, object_type: str):
+        return self.__saved.get(ou, {}).get(object_type, {})
+
+## Метод возвращающий множество GUID объектов текущего запуска для OU и типа объектов
+    def __get_current(self, ou: str, object_type: str):
+        return self.__current.setdefault(ou, {}).setdefault(object_type, set())
+
+## Метод возвращающий high-water mark (время начала чтения сервера источника), сохраненный предыдущим запуском
+    def high_water(self, ou: str, object_type: str):
+        return self.__get_saved(ou, object_type).get('high_water')
+
+## Метод возвращающий множество GUID объектов, сохраненное предыдущим запуском
+    def guids(self, ou: str, object_type: str):
+        return set(self.__get_saved(ou, object_type).get('guids', []))
+
+## Метод для задания high-water mark текущего запуска: время сервера источника перед началом чтения. Следующий
+#  инкрементальный запуск читает объекты с modifyTimestamp не меньше этого времени
+    def begin(self, timestamp):
+        self.__high_water = to_generalized_time(timestamp)
+
+## Метод для регистрации объекта, прочитанного с сервера источника в текущем запуске
+    def track(self, ou: str, object_type: str, guid: str):
+        current = self.__get_current(ou, object_type)
+        if guid:
+            current.add(guid)
+
+## Метод возвращающий множество GUID объектов, прочитанных в текущем запуске
+    def current_guids(self, ou: str, object_type: str):
+        return self.__get_current(ou, object_type)
+
+## Метод возвращающий состояние, зарегистрированное процессом-обработчиком шарда, и начинающий регистрацию заново
+    def take_current(self):
+        current, self.__current = self.__current, {}
+        return current
+
+## Метод для добавления состояния, зарегистрированного процессом-обработчиком шарда (см. take_current)
+    def merge(self, current: dict):
+        for ou, object_types in current.items():
+            for object_type, guids in object_types.items():
+                self.__get_current(ou, object_type).update(guids)
+
+## Метод возвращающий состояние текущего запуска (high-water mark и GUID объектов), которое сохраняется вместе с планом
+#  изменений (см. plan.Change_Plan) и записывается в файл состояния после применения плана запуском с --apply или --resume
+    def pending(self):
+        return {'high_water': self.__high_water, \
+                'guids': {ou: {object_type: sorted(guids) for object_type, guids in object_types.items()} \
+                          for ou, object_types in self.__current.items()}}
+
+## Метод для восстановления состояния текущего запуска, сохраненного вместе с планом изменений (см. pending)
+    def restore(self, pending: dict):
+        self.__high_water = pending.get('high_water')
+        self.__current = {ou: {object_type: set(guids) for object_type, guids in object_types.items()} \
+                          for ou, object_types in pending.get('guids', {}).items()}
+
+## Метод для сохранения состояния текущего запуска в файл. Сохраняется только после успешного применения всех
+#  шагов плана, иначе следующий запуск повторяет чтение от high-water mark предыдущего запуска. Запись выполняется
+#  через временный файл, чтобы прерванный запуск не повредил состояние предыдущего
+    def save(self):
+        state = {}
+        for ou, object_types in self.__current.items():
+            state[ou] = {}
+            for object_type, guids in object_types.items():
+                state[ou][object_type] = {'high_water': self.__high_water, 'guids': sorted(guids)}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,227 @@
+import datetime
+import random
+import threading
+import time
+from logger import logging
+
+
+# Результаты операций, при которых контроллер домена перегружен: операция повторяется после паузы
+THROTTLE_RESULTS = ('busy', 'unavailable', 'timeLimitExceeded')
+# Коэффициент уменьшения количества одновременных операций при перегрузке (multiplicative decrease)
+DECREASE_FACTOR = 0.5
+# Вес последней операции в скользящих средних времени выполнения и доли ошибок
+EWMA_WEIGHT = 0.1
+
+
+## Функция для разбора интервала рабочего времени "ЧЧ:ММ-ЧЧ:ММ". Возвращает кортеж (начало, конец) datetime.time
+def parse_hours(hours: str):
+    start, end = (datetime.datetime.strptime(value.strip(), '%H:%M').time() for value in hours.split('-'))
+    return start, end
+
+
+class Server_Throttle:
+    """
+    A class to represent the state of the write concurrency control of one domain controller.
+
+    Attributes
+    ----------
+    limit : float
+        Current number of operations allowed in flight
+    in_flight : int
+        Number of operations in flight
+    latency : float
+        Moving average of the operation latency, in seconds
+    error_rate : float
+        Moving average of the share of throttled and failed operations
+    operations : int
+        Number of executed operations (including retries)
+    throttled : int
+        Number of operations rejected by the server as busy
+    """
+
+    __slots__ = ('limit', 'in_flight', 'latency', 'error_rate', 'operations', 'throttled', 'since_decrease')
+
+    def __init__(self, limit: float):
+        """
+        Init attributes for creating Server_Throttle Object
+
+        Parameters
+        ----------
+            limit : float
+                Initial number of operations allowed in flight
+        """
+
+        self.limit = limit
+        self.in_flight = 0
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.operations = 0
+        self.throttled = 0
+        # Количество операций, завершенных после последнего уменьшения limit
+        self.since_decrease = 0
+
+
+class Write_Throttle:
+    """
+    A class to represent the adaptive control of concurrent writes to the domain controllers (AIMD).
+
+    The number of write operations in flight is limited separately for every domain controller.
+    The limit grows by one per limit successful operations while the moving average latency stays below
+    target_latency (additive increase) and is halved when the server answers busy, unavailable or
+    timeLimitExceeded, an operation fails or the latency exceeds the target (multiplicative decrease,
+    at most once per limit operations). Throttled operations are retried after a random pause
+    growing exponentially up to max_backoff (jittered backoff). During business hours the limit does not
+    exceed business_limit.
+
+    Attributes
+    ----------
+    max_limit : int
+        Maximum number of operations in flight on one server (number of connections of the write pool)
+    min_limit : int
+        Minimum number of operations in flight on one server
+    target_latency : float
+        Latency of a write operation above which the server is considered overloaded, in seconds
+    retries : int
+        Number of retries of a throttled operation
+    backoff : float
+        Pause before the first retry, in seconds
+    max_backoff : float
+        Maximum pause before a retry, in seconds
+    business_hours : tuple
+        Business hours (start, end) as datetime.time or None
+    business_days : tuple
+        Days of the week of the business hours (1 - Monday, 7 - Sunday)
+    business_limit : int
+        Maximum number of operations in flight on one server during business hours
+
+    Methods
+    -------
+    ceiling(now):
+        Return the maximum number of operations in flight at the given time
+    run(server, call, result):
+        Run a write operation within the limit of the server and retry it while the server is busy
+    summary():
+        Return the state of the control for every server
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, target_latency: float = 1.0, retries: int = 5, \
+                 backoff: float = 0.5, max_backoff: float = 30, business_hours: str = None, \
+                 business_days=(1, 2, 3, 4, 5), business_limit: int = 1):
+        """
+        Init attributes for creating Write_Throttle Object
+
+        Parameters
+        ----------
+            max_limit : int
+                Maximum number of operations in flight on one server
+            min_limit : int, optional
+                Minimum number of operations in flight on one server (default is 1)
+            target_latency : float, optional
+                Latency above which the server is considered overloaded, in seconds (default is 1.0)
+            retries : int, optional
+                Number of retries of a throttled operation (default is 5)
+            backoff : float, optional
+                Pause before the first retry, in seconds (default is 0.5)
+            max_backoff : float, optional
+                Maximum pause before a retry, in seconds (default is 30)
+            business_hours : str, optional
+                Business hours "HH:MM-HH:MM" (default is None - no business hours limit)
+            business_days : tuple, optional
+                Days of the week of the business hours (default is Monday to Friday)
+            business_limit : int, optional
+                Maximum number of operations in flight on one server during business hours (default is 1)
+        """
+
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.target_latency = target_latency
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.business_hours = parse_hours(business_hours) if business_hours else None
+        self.business_days = tuple(business_days)
+        self.business_limit = max(1, business_limit)
+        self.__servers = {}
+        self.__condition = threading.Condition()
+        self.__random = random.Random()
+
+## Метод возвращающий максимальное количество одновременных операций на сервере в момент now
+#  (в рабочее время - не больше business_limit). Интервал рабочего времени может переходить через полночь
+    def ceiling(self, now: datetime.datetime = None):
+        if self.business_hours is None:
+            return self.max_limit
+        now = now or datetime.datetime.now()
+        start, end = self.business_hours
+        current = now.time()
+        in_hours = start <= current < end if start <= end else current >= start or current < end
+        if in_hours and now.isoweekday() in self.business_days:
+            return min(self.max_limit, self.business_limit)
+        return self.max_limit
+
+## Метод выполняющий операцию записи call() на сервере server с учетом ограничения количества одновременных операций.
+#  result() возвращает результат операции (description ldap3). Если сервер перегружен, операция повторяется до retries раз
+#  после паузы (на время паузы место операции освобождается). Любой другой результат, кроме success, учитывается
+#  как ошибка (без повтора). Возвращает результат последнего вызова call()
+    def run(self, server: str, call, result):
+        attempt = 0
+        while True:
+            state = self.__acquire(server)
+            started = time.perf_counter()
+            try:
+                response = call()
+            except Exception:
+                self.__release(state, server, time.perf_counter() - started, 'error')
+                raise
+            description = result()
+            outcome = 'throttled' if description in THROTTLE_RESULTS else 'success' if description == 'success' else 'error'
+            self.__release(state, server, time.perf_counter() - started, outcome)
+            if outcome != 'throttled' or attempt >= self.retries:
+                return response
+            attempt += 1
+            pause = self.__random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+            logging.info(f'Сервер {server} перегружен ({result()}), повтор операции {attempt} из {self.retries} ' \
+                            f'через {pause:.2f} с')
+            time.sleep(pause)
+
+## Метод ожидающий свободного места для операции на сервере. Ожидание прерывается раз в секунду,
+#  чтобы учитывать начало рабочего времени
+    def __acquire(self, server: str):
+        with self.__condition:
+            state = self.__servers.get(server)
+            if state is None:
+                state = self.__servers[server] = Server_Throttle(self.max_limit)
+            while state.in_flight >= min(self.ceiling(), max(self.min_limit, int(state.limit))):
+                self.__condition.wait(1)
+            state.in_flight += 1
+            return state
+
+## Метод учитывающий завершенную операцию (outcome - success, throttled или error): скользящие средние,
+#  увеличение или уменьшение limit
+    def __release(self, state: Server_Throttle, server: str, seconds: float, outcome: str):
+        with self.__condition:
+            state.in_flight -= 1
+            state.operations += 1
+            state.since_decrease += 1
+            success = outcome == 'success'
+            state.latency += EWMA_WEIGHT * (seconds - state.latency)
+            state.error_rate += EWMA_WEIGHT * ((0.0 if success else 1.0) - state.error_rate)
+            if outcome == 'throttled':
+                state.throttled += 1
+            if success and state.latency <= self.target_latency:
+                state.limit = min(self.max_limit, state.limit + 1 / max(1.0, state.limit))
+            elif state.since_decrease >= state.limit:
+                limit = max(self.min_limit, state.limit * DECREASE_FACTOR)
+                if int(limit) < int(state.limit):
+                    logging.warning(f'Сервер {server}: количество одновременных операций записи уменьшено до {int(limit)} ' \
+                                    f'(время выполнения {state.latency:.3f} с, доля ошибок {state.error_rate:.2f})')
+                state.limit = limit
+                state.since_decrease = 0
+            self.__condition.notify_all()
+
+## Метод возвращающий состояние управления для каждого сервера: {сервер: {limit, latency, error_rate, operations, throttled}}
+    def summary(self):
+        with self.__condition:
+            return {server: {'limit': int(state.limit), 'latency': round(state.latency, 6), \
+                             'error_rate': round(state.error_rate, 4), 'operations': state.operations, \
+                             'throttled': state.throttled} \
+                    for server, state in self.__servers.items()}
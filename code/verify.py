@@ -0,0 +1,148 @@
+import hashlib
+from dn import normalize_dn
+from fingerprint import record_fingerprint
+
+
+# Длина префикса GUID (шестнадцатеричных символов хэша GUID), по которому записи поддерева делятся на корзины
+PREFIX_LENGTH = 2
+
+
+## Функция возвращающая префикс GUID записи: первые length символов хэша SHA-1 GUID. Хэш равномерно распределяет
+#  записи по корзинам независимо от формата GUID
+def guid_prefix(guid: str, length: int = PREFIX_LENGTH):
+    return hashlib.sha1(guid.lower().encode('utf-8')).hexdigest()[:length]
+
+
+## Функция для вычисления хэша узла дерева по отсортированным парам (ключ, хэш дочернего узла или записи)
+def _node_digest(items):
+    digest = hashlib.sha256()
+    for key, value in sorted(items):
+        digest.update(key.encode('utf-8') + b'\0' + value.encode('ascii') + b'\n')
+    return digest.hexdigest()
+
+
+class Hash_Tree:
+    """
+    A class to represent the hash tree (Merkle tree) of the migrated entries of one server.
+
+    Entries are placed in buckets by object type, migrated OU subtree and GUID prefix. A leaf is the
+    fingerprint of the entry (DN and compared attributes, see fingerprint.record_fingerprint), the hash of
+    a bucket or of a level is computed from the sorted hashes of its children, so two trees are compared
+    top-down and only the buckets with different hashes are compared entry by entry.
+
+    Attributes
+    ----------
+    subtrees : list
+        Normalized DNs (lower case) of the migrated OU subtrees on the target server
+    prefix_length : int
+        Length of the GUID prefix of the buckets
+    count : int
+        Number of entries in the tree
+
+    Methods
+    -------
+    add(object_type, guid, dn, attributes, read_dn):
+        Add an entry to its bucket, entries outside the subtrees are skipped
+    digest(path):
+        Return the hash of the node: () - root, (object_type, ), (object_type, subtree), (object_type, subtree, prefix)
+    keys(path):
+        Return the keys of the children of the node
+    leaves(path):
+        Return the entries of a bucket: {GUID: (fingerprint, DN to read the entry)}
+    """
+
+    # Количество уровней корзин: тип объектов, поддерево OU, префикс GUID
+    DEPTH = 3
+
+    def __init__(self, subtrees: list, prefix_length: int = PREFIX_LENGTH):
+        """
+        Init attributes for creating Hash_Tree Object
+
+        Parameters
+        ----------
+            subtrees : list
+                DNs of the migrated OU subtrees on the target server
+            prefix_length : int, optional
+                Length of the GUID prefix of the buckets (default is 2 - 256 buckets per subtree)
+        """
+
+        self.subtrees = [normalize_dn(subtree).lower() for subtree in subtrees]
+        self.prefix_length = prefix_length
+        self.count = 0
+        self.__root = {}
+        self.__digests = {}
+
+## Метод возвращающий поддерево OU, в котором находится запись, или None
+    def __subtree(self, dn: str):
+        for subtree in self.subtrees:
+            if dn == subtree or dn.endswith(',' + subtree):
+                return subtree
+        return None
+
+## Метод для добавления записи в корзину (тип объектов, поддерево OU, префикс GUID). Пустые значения атрибутов
+#  ('[]', см. normalize_attribute) не учитываются. read_dn - DN для чтения записи с ее сервера (по умолчанию dn).
+#  Возвращает False, если запись не относится к мигрируемым поддеревьям
+    def add(self, object_type: str, guid: str, dn: str, attributes: dict, read_dn: str = None):
+        normalized_dn = normalize_dn(dn)
+        subtree = self.__subtree(normalized_dn.lower())
+        if subtree is None:
+            return False
+        fingerprint = record_fingerprint(normalized_dn, {key: value for key, value in attributes.items() if value != '[]'})
+        bucket = self.__root.setdefault(object_type, {}).setdefault(subtree, {}).setdefault(guid_prefix(guid, self.prefix_length), {})
+        bucket[guid] = (fingerprint, read_dn or dn)
+        self.__digests.clear()
+        self.count += 1
+        return True
+
+## Метод возвращающий узел дерева по пути (пустой словарь, если узла нет)
+    def __node(self, path: tuple):
+        node = self.__root
+        for key in path:
+            node = node.get(key, {})
+        return node
+
+## Метод возвращающий хэш узла дерева. Хэши вычисляются один раз после добавления записей
+    def digest(self, path: tuple = ()):
+        path = tuple(path)
+        digest = self.__digests.get(path)
+        if digest is None:
+            node = self.__node(path)
+            if len(path) == self.DEPTH:
+                digest = _node_digest((guid, leaf[0]) for guid, leaf in node.items())
+            else:
+                digest = _node_digest((key, self.digest(path + (key,))) for key in node)
+            self.__digests[path] = digest
+        return digest
+
+## Метод возвращающий ключи дочерних узлов
+    def keys(self, path: tuple = ()):
+        return set(self.__node(tuple(path)))
+
+## Метод возвращающий записи корзины: {GUID: (отпечаток, DN для чтения записи)}
+    def leaves(self, path: tuple):
+        return self.__node(tuple(path))
+
+
+## Функция сравнения двух деревьев сверху вниз: дочерние узлы сравниваются только для узлов с разными хэшами,
+#  записи - только в корзинах с разными хэшами. Возвращает список различий (путь корзины, GUID, запись источника,
+#  запись целевого сервера), где запись - (отпечаток, DN для чтения) или None, и статистику: количество сравненных и различающихся корзин
+def diff_trees(source: Hash_Tree, dest: Hash_Tree):
+    differences = []
+    stats = {'compared_buckets': 0, 'different_buckets': 0}
+    paths = [()]
+    while paths:
+        path = paths.pop()
+        if len(path) == Hash_Tree.DEPTH:
+            stats['compared_buckets'] += 1
+        if source.digest(path) == dest.digest(path):
+            continue
+        if len(path) < Hash_Tree.DEPTH:
+            paths.extend(path + (key,) for key in sorted(source.keys(path) | dest.keys(path), reverse=True))
+            continue
+        stats['different_buckets'] += 1
+        source_leaves, dest_leaves = source.leaves(path), dest.leaves(path)
+        for guid in sorted(set(source_leaves) | set(dest_leaves)):
+            source_leaf, dest_leaf = source_leaves.get(guid), dest_leaves.get(guid)
+            if source_leaf is None or dest_leaf is None or source_leaf[0] != dest_leaf[0]:
+                differences.append((path, guid, source_leaf, dest_leaf))
+    return differences, stats
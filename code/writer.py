@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from queue import Queue
+from logger import logging
+
+
+class Write_Pool:
+    """
+    A class to represent a pool of connections for concurrent writes to the LDAP server.
+
+    Each operation gets its own connection for the time it runs, so the result of every
+    add/modify/modify_dn/delete is read from the connection that sent it and logging stays accurate.
+    With a throttle the number of write operations in flight on every server is adapted to the
+    server load and may be lower than workers (see throttle.Write_Throttle).
+
+    Attributes
+    ----------
+    workers : int
+        Number of worker connections (maximum number of operations in flight)
+    throttle : Write_Throttle
+        Adaptive control of the write operations or None
+
+    Methods
+    -------
+    run(operation, items):
+        Run operation(connector, item) for every item and wait until all of them are done
+    """
+
+    def __init__(self, connector, workers: int = 1, throttle=None):
+        """
+        Init attributes for creating Write_Pool Object
+
+        Parameters
+        ----------
+            connector : LDAP_Connector
+                Bound connection, used as the first worker; other workers are its clones
+            workers : int, optional
+                Number of worker connections (default is 1 - sequential writes)
+            throttle : Write_Throttle, optional
+                Adaptive control of the write operations (default is None - fixed number of operations in flight)
+        """
+
+        self.workers = max(1, workers)
+        self.throttle = throttle
+        self.__connector = connector
+        connector.write_throttle = throttle
+        self.__clones = [connector.clone() for _ in range(self.workers - 1)]
+        self.__connectors = Queue()
+        self.__connectors.put(connector)
+        for clone in self.__clones:
+            self.__connectors.put(clone)
+        self.__executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+## Метод выполняющий операцию на свободном соединении пула
+    def __execute(self, operation, item):
+        connector = self.__connectors.get()
+        try:
+            return operation(connector, item)
+        finally:
+            self.__connectors.put(connector)
+
+## Метод выполняющий operation(connector, item) для всех элементов items и ожидающий их завершения.
+#  Элементы читаются из items по мере выполнения, одновременно в очереди не более workers * 2 операций.
+#  Возвращает список результатов в порядке элементов items
+    def run(self, operation, items):
+        results = []
+        if self.__executor is None:
+            for item in items:
+                results.append(self.__execute(operation, item))
+            return results
+        futures = deque()
+        for item in items:
+            if len(futures) >= self.workers * 2:
+                results.append(futures.popleft().result())
+            futures.append(self.__executor.submit(self.__execute, operation, item))
+        while futures:
+            results.append(futures.popleft().result())
+        return results
+
+## Метод закрывающий дополнительные соединения пула. Адаптивное управление записью основного соединения отключается
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown()
+        self.__connector.write_throttle = None
+        if self.throttle is not None:
+            logging.info(f'Адаптивное управление записью: {self.throttle.summary()}')
+        for clone in self.__clones:
+            clone.unbind()